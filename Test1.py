@@ -41,8 +41,29 @@ except Exception:
     SERIAL_OK = False
 
 # ==== YOLO OCR (có thì dùng, không có thì mock) ====
+# mock YOLO: dùng khi không có torch, hoặc làm fallback khi nạp model lỗi
+class _MockValues:
+    def __init__(self): self._vals = [[100, 100, 300, 200, 0.95, 0]]
+    def tolist(self): return self._vals
+
+class _MockDF:
+    def __init__(self): self.values = _MockValues()
+    # function/helper đọc kết quả như mảng Nx6
+    def __len__(self): return len(self.values.tolist())
+    def __getitem__(self, i): return self.values.tolist()[i]
+
+class _MockPandasResult:
+    def __init__(self): self.xyxy = [_MockDF()]
+    def pandas(self): return self
+
+class MockYoloModel:
+    def __init__(self): self.conf = 0.6
+    def __call__(self, frame, size=640): return _MockPandasResult()
+
 try:
-    import torch
+    from function import models
+    if not models.available():
+        raise ImportError("torch")
     import function.utils_rotate as utils_rotate
     import function.helper as helper
     TORCH_OK = True
@@ -50,21 +71,6 @@ except Exception:
     TORCH_OK = False
     print("Không có torch/function -> dùng mock OCR để test.")
 
-    class _MockValues:
-        def __init__(self): self._vals = [[100, 100, 300, 200, 0.95, 0]]
-        def tolist(self): return self._vals
-
-    class _MockDF:
-        def __init__(self): self.values = _MockValues()
-
-    class _MockPandasResult:
-        def __init__(self): self.xyxy = [_MockDF()]
-        def pandas(self): return self
-
-    class MockYoloModel:
-        def __init__(self): self.conf = 0.6
-        def __call__(self, frame, size=640): return _MockPandasResult()
-
     class helper:
         @staticmethod
         def read_plate(model, img): return "80T-8888"
@@ -76,22 +82,9 @@ except Exception:
 yolo_LP_detect = None
 yolo_license_plate = None
 if TORCH_OK:
-    try:
-        yolo_LP_detect = torch.hub.load(
-            'yolov5', 'custom',
-            path='model/LP_detector_nano_61.pt',
-            force_reload=False, source='local'
-        )
-        yolo_license_plate = torch.hub.load(
-            'yolov5', 'custom',
-            path='model/LP_ocr_nano_62.pt',
-            force_reload=False, source='local'
-        )
-        yolo_license_plate.conf = 0.60
-    except Exception as e:
-        print("Không tải được YOLO, chuyển sang mock. Lỗi:", e)
-        yolo_LP_detect = MockYoloModel()
-        yolo_license_plate = MockYoloModel()
+    # nạp lười 1 lần qua function/models (không force_reload), warm-up ở nền
+    yolo_LP_detect, yolo_license_plate = models.yolo_models(fallback=MockYoloModel)
+    models.preload()
 else:
     yolo_LP_detect = MockYoloModel()
     yolo_license_plate = MockYoloModel()
@@ -49,39 +49,49 @@ except Exception:
 from flask import Flask, request, redirect, session, render_template_string
 
 # ===================== YOLO / OCR (giữ như bạn, nhưng OCR không timeout) =====================
-try:
-    import torch
-    import function.utils_rotate as utils_rotate
-    import function.helper as helper
-    TORCH_OK = True
-except Exception:
-    TORCH_OK = False
-    print("Không có module function/ hoặc torch, dùng mock YOLO-OCR để test.")
+# mock YOLO: dùng khi không có torch, hoặc làm fallback khi nạp model lỗi
+class _MockValues:
+    def __init__(self):
+        self._vals = [[100, 100, 300, 200, 0.95, 0]]
+
+    def tolist(self):
+        return self._vals
 
-    class _MockValues:
-        def __init__(self):
-            self._vals = [[100, 100, 300, 200, 0.95, 0]]
+class _MockDF:
+    def __init__(self):
+        self.values = _MockValues()
 
-        def tolist(self):
-            return self._vals
+    # function/helper đọc kết quả như mảng Nx6
+    def __len__(self):
+        return len(self.values.tolist())
 
-    class _MockDF:
-        def __init__(self):
-            self.values = _MockValues()
+    def __getitem__(self, i):
+        return self.values.tolist()[i]
 
-    class _MockPandasResult:
-        def __init__(self):
-            self.xyxy = [_MockDF()]
+class _MockPandasResult:
+    def __init__(self):
+        self.xyxy = [_MockDF()]
 
-        def pandas(self):
-            return self
+    def pandas(self):
+        return self
 
-    class MockYoloModel:
-        def __init__(self):
-            self.conf = 0.6
+class MockYoloModel:
+    def __init__(self):
+        self.conf = 0.6
 
-        def __call__(self, frame, size=640):
-            return _MockPandasResult()
+    def __call__(self, frame, size=640):
+        return _MockPandasResult()
+
+try:
+    from function import models
+    if not models.available():
+        raise ImportError("torch")
+    import function.utils_rotate as utils_rotate
+    import function.helper as helper
+    TORCH_OK = True
+except Exception:
+    TORCH_OK = False
+    print("Không có module function/ hoặc torch, dùng mock YOLO-OCR để test.")
 
     class helper:
         @staticmethod
@@ -97,22 +107,9 @@ yolo_LP_detect = None
 yolo_license_plate = None
 
 if TORCH_OK:
-    try:
-        yolo_LP_detect = torch.hub.load(
-            'yolov5', 'custom',
-            path='model/LP_detector_nano_61.pt',
-            force_reload=False, source='local'
-        )
-        yolo_license_plate = torch.hub.load(
-            'yolov5', 'custom',
-            path='model/LP_ocr_nano_62.pt',
-            force_reload=False, source='local'
-        )
-        yolo_license_plate.conf = 0.60
-    except Exception as e:
-        print(f"Không thể tải YOLO, dùng mock. Lỗi: {e}")
-        yolo_LP_detect = MockYoloModel()
-        yolo_license_plate = MockYoloModel()
+    # nạp lười 1 lần qua function/models (không force_reload), warm-up ở nền
+    yolo_LP_detect, yolo_license_plate = models.yolo_models(fallback=MockYoloModel)
+    models.preload()
 else:
     yolo_LP_detect = MockYoloModel()
     yolo_license_plate = MockYoloModel()
@@ -2,7 +2,6 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from PIL import Image, ImageTk, Image as PILImage
 import cv2
-import torch
 from datetime import datetime
 import os, csv, math, serial, threading, queue, time
 
@@ -12,23 +11,27 @@ try:
 except ImportError:
     print("Cảnh báo: cần cài pyserial:  pip install pyserial")
 
-# ==== MOCK YOLO nếu thiếu module cục bộ ====
+# ==== MOCK YOLO nếu thiếu module cục bộ / nạp model lỗi ====
+class _MockValues:
+    def __init__(self): self._vals = [[100,100,300,200,0.95,0]]
+    def tolist(self): return self._vals
+class _MockDF:
+    def __init__(self): self.values = _MockValues()
+    # function/helper đọc kết quả như mảng Nx6
+    def __len__(self): return len(self.values.tolist())
+    def __getitem__(self, i): return self.values.tolist()[i]
+class _MockPandasResult:
+    def __init__(self): self.xyxy = [_MockDF()]
+    def pandas(self): return self
+class MockYoloModel:
+    def __init__(self): self.conf = 0.6
+    def __call__(self, frame, size=640): return _MockPandasResult()
+
 try:
     import function.utils_rotate as utils_rotate
     import function.helper as helper
 except ImportError:
     print("Không có module function/, dùng mock YOLO-OCR để test.")
-    class _MockValues:
-        def __init__(self): self._vals = [[100,100,300,200,0.95,0]]
-        def tolist(self): return self._vals
-    class _MockDF:
-        def __init__(self): self.values = _MockValues()
-    class _MockPandasResult:
-        def __init__(self): self.xyxy = [_MockDF()]
-        def pandas(self): return self
-    class MockYoloModel:
-        def __init__(self): self.conf = 0.6
-        def __call__(self, frame, size): return _MockPandasResult()
     class helper:
         @staticmethod
         def read_plate(model, img): return "80T-8888"
@@ -39,9 +42,10 @@ except ImportError:
 # ==== Load YOLO (nếu có) ====
 try:
     if 'yolo_LP_detect' not in globals():
-        yolo_LP_detect = torch.hub.load('yolov5', 'custom', path='model/LP_detector_nano_61.pt', force_reload=True, source='local')
-        yolo_license_plate = torch.hub.load('yolov5', 'custom', path='model/LP_ocr_nano_62.pt', force_reload=True, source='local')
-        yolo_license_plate.conf = 0.60
+        # nạp lười 1 lần qua function/models (không force_reload), warm-up ở nền
+        from function import models
+        yolo_LP_detect, yolo_license_plate = models.yolo_models(fallback=MockYoloModel)
+        models.preload()
 except Exception as e:
     print(f"Không thể tải YOLO, dùng mock. Lỗi: {e}")
     yolo_LP_detect = MockYoloModel()
@@ -2,7 +2,6 @@ import tkinter as tk
 from tkinter import ttk, font, messagebox, filedialog
 from PIL import Image, ImageTk
 import cv2
-import torch
 from datetime import datetime
 import numpy as np
 import os
@@ -17,36 +16,42 @@ except ImportError:
     print("Vui lòng cài đặt bằng lệnh: pip install pyserial")
 
 # --- GIẢ LẬP MODULE (ĐỂ TEST) ---
+class MockYoloModel:
+    def __init__(self): self.conf = 0.6
+    def __call__(self, frame, size=640):
+        class MockResult:
+            def __init__(self): self.xyxy = [[[100, 100, 300, 200, 0.95, 0]]]; self.names = {0: "0"}
+        return MockResult()
+
 try:
-    import function.utils_rotate as utils_rotate
     import function.helper as helper
+    from function.plate_search import PlateSearch
 except ImportError:
     print("Cảnh báo: Không tìm thấy module 'function'. Sử dụng module giả lập.")
-    class MockYoloModel:
-        def __init__(self): self.conf = 0.6
-        def __call__(self, frame, size):
-            class MockPandasResult:
-                def __init__(self): self.xyxy = [{'values': [[100, 100, 300, 200, 0.95, 0]]}]
-                def pandas(self): return self
-            return MockPandasResult()
     class helper:
         @staticmethod
-        def read_plate(model, img): return "80T-8888"
-    class utils_rotate:
+        def detections(results): return [type("D", (object,), {"boxes": [row[:4] for row in results.xyxy[0]]})()]
         @staticmethod
-        def deskew(img, a, b): return img
+        def read_plate(model, img): return "80T-8888"
+    class PlateSearch:
+        def __init__(self, model, accept=0.80): self.accept = accept
+        def search(self, crop, camera="default"): return "80T-8888", 1.0, (0, 0)
 
 # --- CÁC THIẾT LẬP BAN ĐẦU ---
 try:
     if 'yolo_LP_detect' not in globals():
-        yolo_LP_detect = torch.hub.load('yolov5', 'custom', path='model/LP_detector_nano_61.pt', force_reload=True, source='local')
-        yolo_license_plate = torch.hub.load('yolov5', 'custom', path='model/LP_ocr_nano_62.pt', force_reload=True, source='local')
-        yolo_license_plate.conf = 0.60
+        # nạp lười 1 lần (không force_reload), warm-up ở nền; lỗi nạp -> model giả lập
+        from function import models
+        yolo_LP_detect, yolo_license_plate = models.yolo_models(fallback=MockYoloModel)
+        models.preload()
 except Exception as e:
     print(f"Cảnh báo: Không thể tải model YOLO. Chương trình sẽ chạy với model giả lập. Lỗi: {e}")
     yolo_LP_detect = MockYoloModel()
     yolo_license_plate = MockYoloModel()
 
+# OCR trên các biến thể deskew (1 batch), nhớ biến thể tốt nhất theo từng camera
+plate_search = PlateSearch(yolo_license_plate, accept=0.80)
+
 # --- LỚP GIAO DIỆN CHÍNH ---
 class ParkingApp:
     def __init__(self, window, window_title):
@@ -205,7 +210,7 @@ class ParkingApp:
         if not spot_id: messagebox.showwarning("Hết chỗ", "Bãi xe đã đầy."); return
         frame = self.last_frame_in
         if frame is None: messagebox.showerror("Lỗi", "Không có tín hiệu từ camera vào."); return
-        plate_text, crop_img = self.process_frame_for_plate(frame)
+        plate_text, crop_img = self.process_frame_for_plate(frame, "in")
         if plate_text == "unknown": messagebox.showinfo("Thông tin", "Không nhận diện được biển số xe vào."); return
         
         vehicle_data = {'plate_text': plate_text, 'entry_time': datetime.now(), 'plate_image': Image.fromarray(cv2.cvtColor(crop_img, cv2.COLOR_BGR2RGB)), 'vehicle_image': Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)), 'status': 'occupied'}
@@ -224,7 +229,7 @@ class ParkingApp:
     def capture_out(self):
         frame = self.last_frame_out
         if frame is None: messagebox.showerror("Lỗi", "Không có tín hiệu từ camera ra."); return
-        plate_text_out, crop_img_out = self.process_frame_for_plate(frame)
+        plate_text_out, crop_img_out = self.process_frame_for_plate(frame, "out")
         if plate_text_out == "unknown": messagebox.showinfo("Thông tin", "Không nhận diện được biển số xe ra."); return
 
         spot_id, vehicle_data_in = self.find_vehicle_by_plate(plate_text_out)
@@ -267,15 +272,12 @@ class ParkingApp:
             self.source_out = self.default_source_out
             self.init_capture_devices()
 
-    def process_frame_for_plate(self, frame):
-        plates = yolo_LP_detect(frame, size=640)
-        list_plates = plates.pandas().xyxy[0].values.tolist()
-        if list_plates:
-            plate_info = list_plates[0]; x, y, x2, y2 = map(int, plate_info[:4]); crop_img = frame[y:y2, x:x2]
-            for cc in range(0,2):
-                for ct in range(0,2):
-                    lp = helper.read_plate(yolo_license_plate, utils_rotate.deskew(crop_img, cc, ct))
-                    if lp != "unknown": return lp, crop_img
+    def process_frame_for_plate(self, frame, camera="default"):
+        det = helper.detections(yolo_LP_detect(frame, size=640))[0]
+        if len(det.boxes):
+            x, y, x2, y2 = map(int, det.boxes[0]); crop_img = frame[y:y2, x:x2]
+            lp = plate_search.search(crop_img, camera)[0]
+            if lp != "unknown": return lp, crop_img
         return "unknown", None
 
     def on_closing(self):
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - BENCHMARK BACKEND: so sánh torch / onnx / openvino trên ảnh result/.
+
+Mỗi backend chạy trong 1 tiến trình riêng (đo đúng thời gian nạp và bộ nhớ đỉnh), cùng pipeline
+với engine: detect -> crop biển tốt nhất -> PlateSearch (deskew + OCR). Báo cáo p50/p95/p99
+từng công đoạn, thời gian nạp / warm-up, RSS đỉnh và tỉ lệ biển số đọc giống backend đầu tiên.
+
+  python export_onnx.py
+  python benchmarks/backend_bench.py --backends torch,onnx --repeats 20
+  python benchmarks/backend_bench.py --backends onnx,onnx:int8   (sau training/quantize.py)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from gate_bench import ROOT, StageTimer, synthetic_frames, git_rev
+
+STAGES = ("detect", "plate", "total")
+
+def run_backend(backend, frames, repeats, threads):
+    """Chạy trong tiến trình con: nạp backend, warm-up rồi đo pipeline trên frames."""
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from function import models
+    import function.helper as helper
+    from function.plate_search import PlateSearch
+
+    name, _, precision = backend.partition(":")
+    models.configure(name, threads, precision or "fp32")
+    det, ocr = models.yolo_models()
+    det.get()
+    ocr.get()
+    models.warmup()
+    search = PlateSearch(ocr, accept=0.80)
+
+    timer = StageTimer(STAGES)
+    plates = {}
+    for _ in range(repeats):
+        for name, img in frames:
+            t0 = time.perf_counter()
+            d = helper.detections(det(img, size=models.DETECT_SIZE))[0]
+            t1 = time.perf_counter()
+            timer.add("detect", t1 - t0)
+            lp = "unknown"
+            i = d.best()
+            if i >= 0:
+                x, y, x2, y2 = map(int, d.boxes[i])
+                crop = img[max(0, y):max(y + 1, y2), max(0, x):max(x + 1, x2)]
+                lp = search.search(crop, "bench")[0]
+                timer.add("plate", time.perf_counter() - t1)
+            timer.add("total", time.perf_counter() - t0)
+            plates[name] = lp
+
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+    except ImportError:  # Windows
+        rss_mb = None
+    return {
+        "requested": backend,
+        "backend": det.backend,
+        "load_sec": round((det.load_sec or 0) + (ocr.load_sec or 0), 3),
+        "warmup_sec": round((det.warmup_sec or 0) + (ocr.warmup_sec or 0), 3),
+        "peak_rss_mb": rss_mb,
+        "stages": timer.summary(),
+        "plates": plates,
+    }
+
+# models.LazyModel.backend khi backend[:precision] nạp đúng như yêu cầu
+def expected_backend(spec):
+    name, _, precision = spec.partition(":")
+    got = {"torch": "yolov5", "openvino": "onnx-openvino"}.get(name, name)
+    return got + "-int8" if precision == "int8" and name != "torch" else got
+
+def read_images(args):
+    import glob
+    import cv2
+    frames = []
+    if not args.synthetic:
+        for p in sorted(glob.glob(os.path.join(ROOT, args.images))):
+            img = cv2.imread(p)
+            if img is not None:
+                frames.append((os.path.basename(p), img))
+    return frames or [(f"synthetic{i}", f) for i, f in enumerate(synthetic_frames())]
+
+def main():
+    ap = argparse.ArgumentParser(description="So sánh backend suy luận YOLO trên ảnh result/")
+    ap.add_argument("--backends", default="torch,onnx", help="danh sách backend[:precision], vd torch,onnx,onnx:int8")
+    ap.add_argument("--images", default="result/*.jpg")
+    ap.add_argument("--synthetic", action="store_true")
+    ap.add_argument("--repeats", type=int, default=10)
+    ap.add_argument("--threads", type=int, default=0, help="số luồng ONNX Runtime (0: tự chọn)")
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--child-out", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        res = run_backend(args.child, read_images(args), args.repeats, args.threads)
+        with open(args.child_out, "w", encoding="utf-8") as f:
+            json.dump(res, f, ensure_ascii=False)
+        return
+
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        fd, tmp = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", backend, "--child-out", tmp,
+               "--images", args.images, "--repeats", str(args.repeats), "--threads", str(args.threads)]
+        if args.synthetic:
+            cmd.append("--synthetic")
+        print(f"== {backend}")
+        if subprocess.run(cmd).returncode != 0:
+            print(f"Backend {backend} lỗi, bỏ qua.")
+            continue
+        with open(tmp, encoding="utf-8") as f:
+            res = json.load(f)
+        os.remove(tmp)
+        if res["backend"] != expected_backend(backend):
+            print(f"Lưu ý: yêu cầu {backend} nhưng chạy {res['backend']}.")
+        results.append(res)
+
+    if not results:
+        raise SystemExit("Không backend nào chạy được.")
+    ref = results[0]
+    for res in results:
+        same = sum(1 for k, v in res["plates"].items() if ref["plates"].get(k) == v)
+        res["agreement"] = round(same / max(1, len(res["plates"])), 3)
+        base = ref["stages"].get("total", {}).get("p50_ms", 0)
+        cur = res["stages"].get("total", {}).get("p50_ms", 0)
+        res["speedup_p50"] = round(base / cur, 2) if cur else None
+
+    out = os.path.abspath(args.out) if args.out else os.path.join(
+        ROOT, "benchmarks", "results", datetime.now().strftime("backend-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"benchmark": "backend", "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                   "git": git_rev(), "images": "synthetic" if args.synthetic else args.images,
+                   "repeats": args.repeats, "threads": args.threads, "results": results},
+                  f, ensure_ascii=False, indent=2)
+
+    print(f"{'backend':14s} {'load s':>7s} {'RSS MB':>7s} {'detect p50':>11s} {'plate p50':>10s} "
+          f"{'total p50':>10s} {'total p95':>10s} {'x':>5s} {'giống':>6s}")
+    for res in results:
+        s = res["stages"]
+        print(f"{res['backend']:14s} {res['load_sec']:7.2f} {res['peak_rss_mb'] or 0:7.1f} "
+              f"{s.get('detect', {}).get('p50_ms', 0):11.2f} {s.get('plate', {}).get('p50_ms', 0):10.2f} "
+              f"{s.get('total', {}).get('p50_ms', 0):10.2f} {s.get('total', {}).get('p95_ms', 0):10.2f} "
+              f"{res['speedup_p50'] or 0:5.2f} {100 * res['agreement']:5.0f}%")
+    print("Đã ghi", out)
+
+if __name__ == "__main__":
+    main()
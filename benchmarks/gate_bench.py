@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - BENCHMARK CỔNG: đo thông lượng xe vào/ra không cần phần cứng.
+
+Mỗi xe = 1 lượt vào (_process_vehicle_entry, RFID giả) rồi 1 lượt ra (_process_vehicle_exit_by_rfid
+hoặc theo biển số) trên ảnh trong result/ (hoặc ảnh tổng hợp), MASTER là master_sim.VirtualMaster
+qua socket:// nên vẫn đi đúng đường serial, hàng lệnh và chờ ARRIVED.
+
+Đo độ trễ từng công đoạn (p50/p95/p99, ms): detect, deskew, ocr, plate (cả tìm biến thể),
+reservation (tra đặt chỗ / tìm xe), persistence (lưu ô, ghi lịch sử), motor (chờ ARRIVED),
+entry/exit (cả lượt) và số xe/phút duy trì. Kết quả ghi JSON để so sánh giữa các lần chạy:
+
+  python benchmarks/gate_bench.py --vehicles 40
+  python benchmarks/gate_bench.py --synthetic --travel 0.05 --baseline benchmarks/results/gate-A.json
+
+Dữ liệu bãi (CSV/SQLite) chạy trong thư mục tạm, không đụng dữ liệu thật.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from function.metrics import percentile  # nearest-rank, giống /metrics và --profile
+
+STAGES = ("detect", "deskew", "ocr", "plate", "reservation", "persistence", "motor", "entry", "exit")
+
+class StageTimer:
+    """Gom thời gian (giây) theo công đoạn từ nhiều luồng."""
+
+    def __init__(self, stages=STAGES):
+        self.stages = stages
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, sec):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(sec)
+
+    def wrap(self, stage, fn):
+        def timed(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+        return timed
+
+    def summary(self):
+        out = {}
+        for stage in self.stages:
+            xs = sorted(self.samples.get(stage, []))
+            if not xs:
+                continue
+            out[stage] = {
+                "n": len(xs),
+                "mean_ms": round(1000 * sum(xs) / len(xs), 3),
+                "p50_ms": round(1000 * percentile(xs, 50), 3),
+                "p95_ms": round(1000 * percentile(xs, 95), 3),
+                "p99_ms": round(1000 * percentile(xs, 99), 3),
+                "max_ms": round(1000 * xs[-1], 3),
+            }
+        return out
+
+def synthetic_frames(n=4, size=(720, 1280)):
+    """Ảnh tổng hợp: nền xám + 1 khung biển số trắng chữ đen ở vị trí khác nhau."""
+    frames = []
+    for i in range(n):
+        img = np.full((size[0], size[1], 3), 90, np.uint8)
+        x, y = 420 + 40 * i, 380 + 20 * i
+        cv2.rectangle(img, (x, y), (x + 330, y + 110), (255, 255, 255), -1)
+        cv2.putText(img, f"{30 + i}A-{12345 + i}", (x + 15, y + 75), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 4)
+        frames.append(img)
+    return frames
+
+def load_frames(pattern):
+    frames = []
+    for p in sorted(glob.glob(pattern)):
+        img = cv2.imread(p)
+        if img is not None:
+            frames.append(img)
+    return frames
+
+def instrument(engine, pe, timer):
+    """Bọc các công đoạn của engine/pipeline OCR bằng bộ đo; trả hàm khôi phục."""
+    for name, stage in (("_detect_plates", "detect"), ("_take_reservation_if_match", "reservation"),
+                        ("_find_vehicle_by_plate", "reservation"), ("_find_vehicle_by_rfid", "reservation"),
+                        ("save_spots", "persistence"), ("_log_exit", "persistence"),
+                        ("_mark_reservation_done", "persistence"), ("_move_and_wait_arrived", "motor")):
+        setattr(engine, name, timer.wrap(stage, getattr(engine, name)))
+
+    restore = []
+    def patch(obj, attr, stage):
+        fn = getattr(obj, attr, None)
+        if fn is not None:
+            setattr(obj, attr, timer.wrap(stage, fn))
+            restore.append((obj, attr, fn))
+
+    patch(pe.plate_search, "search", "plate")
+    patch(pe.helper, "read_plates_scored", "ocr")
+    if hasattr(pe.utils_rotate, "Deskewer"):
+        patch(pe.utils_rotate.Deskewer, "deskew", "deskew")
+
+    def undo():
+        for obj, attr, fn in restore:
+            setattr(obj, attr, fn)
+    return undo
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+def run(args):
+    os.chdir(ROOT)  # model/ và yolov5/ nạp theo đường dẫn tương đối
+    import parking_engine as pe
+    from master_sim import VirtualMaster, serve_tcp, N_STATIONS
+    from parking_settings import read_settings, write_settings
+
+    frames = [] if args.synthetic else load_frames(os.path.join(ROOT, args.images))
+    source = "synthetic" if not frames else args.images
+    frames = frames or synthetic_frames()
+
+    work = tempfile.mkdtemp(prefix="gate_bench_")
+    os.chdir(work)
+    img0 = os.path.join(work, "frame0.jpg")
+    cv2.imwrite(img0, frames[0])
+    st = read_settings()
+    st.update(cam_in=img0, cam_out=img0, com_port="", continuous_ocr="0", storage=args.storage,
+              infer_backend=args.backend, detect_mode=args.detect_mode, detect_small=str(args.detect_small))
+    write_settings(st)
+
+    vm = VirtualMaster(travel_sec=args.travel, beep_sec=args.beep, seed=args.seed)
+    port = serve_tcp(vm, port=0)
+
+    engine = pe.ParkingEngine()
+    engine.settings["com_port"] = f"socket://127.0.0.1:{port}"
+    done = {"entry": 0, "exit": 0}
+    cv = threading.Condition()
+    def on_event(kind, data):
+        if kind in done:
+            with cv:
+                done[kind] += 1
+                cv.notify_all()
+    engine.add_listener(on_event)
+    engine.start()
+
+    t_end = time.time() + 5
+    while engine.master_link is None and time.time() < t_end:
+        time.sleep(0.02)
+    if engine.master_link is None:
+        raise SystemExit("Không kết nối được MASTER giả lập")
+
+    timer = StageTimer()
+    undo = instrument(engine, pe, timer)
+    current = {"frame": frames[0]}
+    engine.grab_out.frame = lambda: current["frame"]
+
+    def wait_flow(busy_attr, kind, before, stage, t0):
+        # cờ busy trả về False (qua post) sau khi flow xong, kể cả khi thất bại
+        t_lim = time.time() + args.flow_timeout
+        while getattr(engine, busy_attr) and time.time() < t_lim:
+            time.sleep(0.001)
+        with cv:
+            ok = done[kind] > before
+        if ok:
+            timer.add(stage, time.perf_counter() - t0)
+        return ok
+
+    def park_away(sid):
+        """
+        Đưa bàn xoay ra trạm đối diện ô sid (lệnh SETPOS qua MasterLink) trước mỗi lượt, để mỗi
+        xe đều đi 1 vòng GOTO/ARRIVED thật qua master_sim (engine bỏ qua lệnh khi đã đứng đúng ô).
+        """
+        if sid in pe.SPOT_TO_TARGET:
+            away = (pe.SPOT_TO_TARGET[sid] - 1 + N_STATIONS // 2) % N_STATIONS + 1
+            engine.master_link.send(f"SETPOS:{away}").result(timeout=2)
+            # engine nhận OK:SETPOS sau khi Reply hoàn tất
+            t_lim = time.time() + 2
+            while engine.master_position != away and time.time() < t_lim:
+                time.sleep(0.001)
+
+    def exit_vehicle(uid):
+        park_away(next((sid for sid, v in engine.parking_spots.items()
+                        if v and str(v.get("rfid_uid", "")).upper() == uid), None))
+        before = done["exit"]
+        t0 = time.perf_counter()
+        if args.exit_mode == "rfid":
+            engine._process_vehicle_exit_by_rfid(uid)
+        else:
+            engine._process_vehicle_exit_manual()
+        return wait_flow("exit_busy", "exit", before, "exit", t0)
+
+    completed = failed = 0
+    parked = []  # (uid, frame) đang đỗ, ra theo thứ tự vào
+    wall0 = time.perf_counter()
+    for i in range(args.vehicles):
+        frame = frames[i % len(frames)]
+        uid = f"BENCH{i:04d}"
+
+        park_away(engine._find_empty_spot())
+        before = done["entry"]
+        t0 = time.perf_counter()
+        engine._process_vehicle_entry(frame, rfid_uid=uid)
+        if wait_flow("entry_busy", "entry", before, "entry", t0):
+            parked.append((uid, frame))
+        else:
+            failed += 1
+
+        while len(parked) > args.hold or (parked and i == args.vehicles - 1):
+            uid, current["frame"] = parked.pop(0)
+            if exit_vehicle(uid):
+                completed += 1
+            else:
+                failed += 1
+    wall = time.perf_counter() - wall0
+
+    undo()
+    engine.stop()
+    vm.stop()
+
+    return {
+        "benchmark": "gate",
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git": git_rev(),
+        "host": socket.gethostname(),
+        "backend": getattr(pe.yolo_LP_detect, "backend", None) or "mock",
+        "config": {"vehicles": args.vehicles, "frames": source, "exit_mode": args.exit_mode, "hold": args.hold,
+                   "storage": args.storage, "infer_backend": args.backend,
+                   "detect_mode": args.detect_mode, "detect_small": args.detect_small, "travel_sec": args.travel, "beep_sec": args.beep},
+        "completed": completed,
+        "failed": failed,
+        "wall_sec": round(wall, 3),
+        "vehicles_per_min": round(60.0 * completed / wall, 2) if wall > 0 else 0.0,
+        "stages": timer.summary(),
+    }
+
+def compare(result, baseline, tolerance, min_delta_ms=1.0):
+    """In chênh lệch so với baseline; trả danh sách chỉ số kém hơn quá tolerance (tỉ lệ) và quá min_delta_ms."""
+    worse = []
+    b, r = baseline.get("vehicles_per_min", 0), result["vehicles_per_min"]
+    print(f"vehicles/min: {b} -> {r}")
+    if b and r < b * (1 - tolerance):
+        worse.append("vehicles_per_min")
+    for stage, s in result["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old:
+            continue
+        print(f"  {stage:12s} p95 {old['p95_ms']:9.2f} -> {s['p95_ms']:9.2f} ms")
+        if s["p95_ms"] > old["p95_ms"] * (1 + tolerance) and s["p95_ms"] - old["p95_ms"] > min_delta_ms:
+            worse.append(f"{stage}.p95")
+    return worse
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark thông lượng cổng vào/ra")
+    ap.add_argument("--vehicles", type=int, default=20)
+    ap.add_argument("--images", default="result/*.jpg", help="glob ảnh xe (tính từ thư mục repo)")
+    ap.add_argument("--synthetic", action="store_true", help="dùng ảnh tổng hợp thay cho --images")
+    ap.add_argument("--exit-mode", choices=["rfid", "plate"], default="rfid")
+    ap.add_argument("--hold", type=int, default=0,
+                    help="số xe giữ lại trong bãi trước khi cho xe ra (cần ảnh có biển số khác nhau)")
+    ap.add_argument("--storage", choices=["csv", "sqlite"], default="csv")
+    ap.add_argument("--backend", choices=["torch", "onnx", "openvino"], default="torch", help="backend suy luận YOLO")
+    ap.add_argument("--detect-mode", choices=["fixed", "adaptive"], default="fixed",
+                    help="adaptive: detector size nhỏ trước, vùng biển số theo camera")
+    ap.add_argument("--detect-small", type=int, default=320, help="size detector bước đầu (adaptive)")
+    ap.add_argument("--travel", type=float, default=0.4, help="giây motor qua 1 trạm (master_sim)")
+    ap.add_argument("--beep", type=float, default=0.16, help="giây mỗi tiếng beep (master_sim)")
+    ap.add_argument("--flow-timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="file JSON kết quả (mặc định benchmarks/results/gate-<time>.json)")
+    ap.add_argument("--baseline", default=None, help="JSON lần chạy trước để so sánh")
+    ap.add_argument("--tolerance", type=float, default=0.20, help="mức kém hơn cho phép so với baseline")
+    ap.add_argument("--min-delta-ms", type=float, default=1.0, help="bỏ qua chênh lệch p95 nhỏ hơn mức này")
+    args = ap.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else os.path.join(
+        ROOT, "benchmarks", "results", datetime.now().strftime("gate-%Y%m%d-%H%M%S.json"))
+    baseline = None
+    if args.baseline:
+        with open(os.path.abspath(args.baseline), encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    result = run(args)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"{result['completed']} xe, {result['failed']} lỗi, {result['vehicles_per_min']} xe/phút ({result['backend']})")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:12s} p50 {s['p50_ms']:9.2f}  p95 {s['p95_ms']:9.2f}  p99 {s['p99_ms']:9.2f} ms  (n={s['n']})")
+    print("Đã ghi", out)
+
+    if baseline is not None:
+        worse = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if worse:
+            print("Kém hơn baseline:", ", ".join(worse))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - XUẤT MODEL ONNX cho backend onnx / openvino (settings infer_backend).
+
+  python export_onnx.py              -> model/LP_detector_nano_61.onnx, model/LP_ocr_nano_62.onnx
+  python export_onnx.py --static     -> input cố định 1x3x640x640 (một số bản OpenVINO cần)
+
+Dùng yolov5/export.py (cần thư mục yolov5/ + torch + onnx) nên đầu ra giống hệt model .pt,
+kèm metadata stride/names. Mặc định xuất --dynamic (batch + kích thước tự do) để backend ONNX
+dùng cùng khung hình chữ nhật như AutoShape. Sau khi xuất, chạy thử 1 lần bằng onnxruntime.
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+import numpy as np
+
+from function import models
+
+def export(weights, imgsz=640, opset=12, dynamic=True, simplify=False):
+    export_py = os.path.join(models.YOLO_DIR, "export.py")
+    if not os.path.isfile(export_py):
+        raise SystemExit(f"Không thấy {export_py} (clone ultralytics/yolov5 vào thư mục yolov5/)")
+    cmd = [sys.executable, export_py, "--weights", weights, "--include", "onnx",
+           "--imgsz", str(imgsz), "--opset", str(opset), "--device", "cpu"]
+    if dynamic:
+        cmd.append("--dynamic")
+    if simplify:
+        cmd.append("--simplify")
+    print(" ".join(cmd))
+    subprocess.run(cmd, check=True, cwd=models.YOLO_DIR)
+    return os.path.splitext(weights)[0] + ".onnx"
+
+def check(path, names_yaml, imgsz=640):
+    from function.onnx_backend import OnnxYolo
+    m = OnnxYolo(path, names=models.yaml_names(names_yaml))
+    t0 = time.perf_counter()
+    m(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), size=imgsz)
+    print(f"  {os.path.basename(path)}: input {m.session.get_inputs()[0].shape}, {len(m.names)} lớp, "
+          f"{m.providers[0]}, 1 lần chạy {1000 * (time.perf_counter() - t0):.1f} ms")
+
+def main():
+    ap = argparse.ArgumentParser(description="Xuất model YOLO (.pt) sang ONNX")
+    ap.add_argument("--imgsz", type=int, default=models.DETECT_SIZE)
+    ap.add_argument("--opset", type=int, default=12)
+    ap.add_argument("--static", action="store_true", help="input cố định (không --dynamic)")
+    ap.add_argument("--simplify", action="store_true", help="chạy onnx-simplifier sau khi xuất")
+    ap.add_argument("--no-check", action="store_true", help="không chạy thử bằng onnxruntime")
+    args = ap.parse_args()
+
+    for m in (models.DETECTOR, models.OCR):
+        path = export(m.weights, args.imgsz, args.opset, dynamic=not args.static, simplify=args.simplify)
+        print("Đã xuất", path)
+        if not args.no_check:
+            check(path, m.names_yaml, args.imgsz)
+    print("Chọn backend: settings.csv infer_backend=onnx (hoặc openvino), hoặc trang Admin Settings.")
+
+if __name__ == "__main__":
+    main()
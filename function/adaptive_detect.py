@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+import numpy as np
+import function.helper as helper
+import function.metrics as metrics
+
+# area of a camera's frame where plates actually appear, learned from the confident plate
+# boxes: robust bounds (percentiles) of the recent boxes grown by `margin` plate sizes.
+# None until `min_boxes` boxes were seen or when the area would cover most of the frame
+class PlateRegion:
+    def __init__(self, window=300, min_boxes=20, margin=1.0, max_cover=0.8, pct=2.0):
+        self.boxes = deque(maxlen=window)
+        self.min_boxes = min_boxes
+        self.margin = margin
+        self.max_cover = max_cover
+        self.pct = pct
+        self.shape = None
+        self._roi = None
+        self._lock = threading.Lock()
+
+    def add(self, boxes, shape):
+        shape = tuple(shape[:2])
+        with self._lock:
+            # other resolution (camera source changed): start over
+            if shape != self.shape:
+                self.boxes.clear()
+                self.shape = shape
+                self._roi = None
+            if len(boxes) == 0:
+                return
+            self.boxes.extend(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+            self._roi = self._bounds()
+
+    def _bounds(self):
+        if len(self.boxes) < self.min_boxes:
+            return None
+        b = np.asarray(self.boxes)
+        lo = np.percentile(b[:, :2], self.pct, axis=0)
+        hi = np.percentile(b[:, 2:], 100 - self.pct, axis=0)
+        size = np.median(b[:, 2:] - b[:, :2], axis=0) * self.margin
+        h, w = self.shape
+        x1, y1 = np.maximum(lo - size, 0).astype(int)
+        x2, y2 = np.minimum(hi + size, (w, h)).astype(int)
+        if x2 <= x1 or y2 <= y1 or (x2 - x1) * (y2 - y1) > self.max_cover * w * h:
+            return None
+        return int(x1), int(y1), int(x2), int(y2)
+
+    # (x1, y1, x2, y2) for a frame of this shape, None: run on the whole frame
+    def roi(self, shape):
+        with self._lock:
+            return self._roi if tuple(shape[:2]) == self.shape else None
+
+    def reset(self):
+        with self._lock:
+            self.boxes.clear()
+            self.shape = self._roi = None
+
+# plate detector that spends the full input size only where it is needed:
+# it runs at `small` first and escalates to `full` when the best box is below `min_conf`,
+# or when nothing was found and the call is `thorough` (a vehicle is known to be at the gate;
+# the continuous watcher passes thorough=False so empty frames stay at one small pass).
+# With `roi`, frames are cropped to the camera's PlateRegion first and the whole frame is
+# only searched at `full` when the region finds nothing. Boxes are in frame coordinates.
+class AdaptiveDetector:
+    def __init__(self, model, small=320, full=640, min_conf=0.5, roi=True):
+        self.model = model
+        self.small = small
+        self.full = full
+        self.min_conf = min_conf
+        self.use_roi = roi
+        self.regions = {}
+        self._lock = threading.Lock()
+
+    def region(self, camera):
+        with self._lock:
+            r = self.regions.get(camera)
+            if r is None:
+                r = self.regions[camera] = PlateRegion()
+            return r
+
+    def reset(self, camera=None):
+        with self._lock:
+            regions = list(self.regions.values()) if camera is None else [self.regions.get(camera)]
+        for r in regions:
+            if r is not None:
+                r.reset()
+
+    # passes in escalation order: (x1, y1, x2, y2) or None for the whole frame, input size
+    def _passes(self, roi):
+        sizes = [self.small, self.full] if self.small < self.full else [self.full]
+        if roi is None:
+            return [(None, s) for s in sizes]
+        return [(roi, s) for s in sizes] + [(None, self.full)]
+
+    def _run(self, frame, box, size, camera):
+        im = frame if box is None else frame[box[1]:box[3], box[0]:box[2]]
+        metrics.inc("detect_passes", camera=camera, size=size, roi=int(box is not None))
+        metrics.inc("detect_pixels", im.shape[0] * im.shape[1], camera=camera)
+        det = helper.detections(self.model(im, size=size))[0]
+        if box is not None and len(det):
+            det.boxes += np.array([box[0], box[1], box[0], box[1]], dtype=np.float32)
+        return det
+
+    def detect(self, frame, camera="default", thorough=True):
+        region = self.region(camera)
+        roi = region.roi(frame.shape) if self.use_roi else None
+        best, best_conf = None, -1.0
+        for box, size in self._passes(roi):
+            det = self._run(frame, box, size, camera)
+            conf = float(det.conf.max()) if len(det) else -1.0
+            if best is None or conf > best_conf:
+                best, best_conf = det, conf
+            if best_conf >= self.min_conf or (best_conf < 0 and not thorough):
+                break
+        region.add(best.boxes[best.conf >= self.min_conf], frame.shape)
+        return best
+
+    def state(self):
+        with self._lock:
+            regions = dict(self.regions)
+        return {cam: {"roi": r._roi, "boxes": len(r.boxes), "shape": r.shape} for cam, r in regions.items()}
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+import cv2
+import function.metrics as metrics
+
+IMG_EXT = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# reads one camera index / video file / stream / still image on its own thread.
+# Only the newest frame is kept, published as a single (seq, timestamp, frame) tuple:
+# rebinding the attribute is atomic, so readers never take a lock or wait on the device.
+# A source that fails or stops delivering frames is reopened every `reconnect_sec`.
+class FrameGrabber:
+    def __init__(self, source, name="cam", reconnect_sec=2.0, max_fail=10):
+        self.source = source
+        self.name = name
+        self.reconnect_sec = reconnect_sec
+        self.max_fail = max_fail
+        self.latest = (0, 0.0, None)
+        self.connected = False
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"grabber-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def read(self):
+        return self.latest
+
+    def frame(self):
+        return self.latest[2]
+
+    def _publish(self, frame):
+        self._seq += 1
+        self.latest = (self._seq, time.time(), frame)
+
+    def _open(self):
+        src = self.source
+        if isinstance(src, int):
+            backend = cv2.CAP_DSHOW if os.name == "nt" else cv2.CAP_ANY
+            cap = cv2.VideoCapture(src, backend)
+        else:
+            s = str(src).strip()
+            if s.lower().endswith(IMG_EXT):
+                frame = cv2.imread(s)
+                if frame is None:
+                    print(f"Không đọc được ảnh {self.name}: {s}")
+                return None, frame
+            cap = cv2.VideoCapture(s, cv2.CAP_ANY)
+        try:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        except Exception:
+            pass
+        return cap, None
+
+    def _run(self):
+        while not self._stop.is_set():
+            cap, still = self._open()
+            if still is not None:
+                # still image: publish once, nothing to re-read
+                self._publish(still)
+                self.connected = True
+                self._stop.wait()
+                return
+            if cap is None or not cap.isOpened():
+                print(f"Không mở được camera/video {self.name}:", self.source)
+                if cap is not None:
+                    cap.release()
+                self._stop.wait(self.reconnect_sec)
+                continue
+
+            self.connected = True
+            is_file = not isinstance(self.source, int) and os.path.isfile(str(self.source))
+            fps = cap.get(cv2.CAP_PROP_FPS) if is_file else 0
+            pace = 1.0 / fps if fps and fps > 0 else 0
+            fails = 0
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret and is_file:
+                    # loop video for demo
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ret, frame = cap.read()
+                if not ret:
+                    fails += 1
+                    if fails >= self.max_fail:
+                        break
+                    self._stop.wait(0.05)
+                    continue
+                fails = 0
+                self._publish(frame)
+                if pace:
+                    self._stop.wait(pace)
+
+            self.connected = False
+            cap.release()
+            if not self._stop.is_set():
+                print(f"Mất tín hiệu {self.name}, kết nối lại...")
+                self._stop.wait(self.reconnect_sec)
+
+# JPEG of a grabber's newest frame, encoded at most once per captured frame and shared by
+# every viewer (snapshot / MJPEG); frames are scaled down to `width` before encoding
+class JpegCache:
+    def __init__(self, read_frame, width=640, quality=80):
+        self.read_frame = read_frame    # () -> (seq, timestamp, frame)
+        self.width = width
+        self.quality = quality
+        self._key = None
+        self._jpeg = None
+        self._lock = threading.Lock()
+
+    # (key, jpeg bytes); key changes with every new frame, jpeg is None before the first frame.
+    # When `last` equals the current key the bytes are not returned again.
+    def get(self, last=None):
+        seq, ts, frame = self.read_frame()
+        if frame is None:
+            return None, None
+        key = (seq, ts)
+        with self._lock:
+            if key != self._key:
+                t0 = time.perf_counter()
+                img = frame
+                h, w = img.shape[:2]
+                if self.width and w > self.width:
+                    img = cv2.resize(img, (self.width, int(h * self.width / w)), interpolation=cv2.INTER_AREA)
+                ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+                if not ok:
+                    return None, None
+                self._key, self._jpeg = key, buf.tobytes()
+                metrics.observe("jpeg_encode", time.perf_counter() - t0)
+            if last == self._key:
+                return self._key, None
+            return self._key, self._jpeg
@@ -1,9 +1,11 @@
 import math
+import numpy as np
+import function.metrics as metrics
 
 # license plate type classification helper function
 def linear_equation(x1, y1, x2, y2):
-    b = y1 - (y2 - y1) * x1 / (x2 - x1)
-    a = (y1 - b) / x1
+    a = (y2 - y1) / (x2 - x1)
+    b = y1 - a * x1
     return a, b
 
 def check_point_linear(x, y, x1, y1, x2, y2):
@@ -11,54 +13,98 @@ def check_point_linear(x, y, x1, y1, x2, y2):
     y_pred = a*x+b
     return(math.isclose(y_pred, y, abs_tol = 3))
 
+# compact view of the detections of one image, read straight from the raw xyxy tensor
+# (xmin, ymin, xmax, ymax, conf, cls) instead of building a pandas DataFrame
+class Detections:
+    __slots__ = ("boxes", "conf", "cls", "names")
+
+    def __init__(self, xyxy, names=None):
+        if hasattr(xyxy, "cpu"):
+            xyxy = xyxy.cpu().numpy()
+        a = np.asarray(xyxy, dtype=np.float32).reshape(-1, 6)
+        self.boxes = a[:, :4]
+        self.conf = a[:, 4]
+        self.cls = a[:, 5].astype(np.int32)
+        if isinstance(names, (list, tuple)):
+            names = dict(enumerate(names))
+        self.names = names or {}
+
+    def __len__(self):
+        return len(self.conf)
+
+    def labels(self):
+        return [str(self.names.get(c, c)) for c in self.cls.tolist()]
+
+    # index of the most confident box, -1 if nothing was detected
+    def best(self):
+        return int(self.conf.argmax()) if len(self.conf) else -1
+
+def detections(results):
+    names = getattr(results, "names", None)
+    return [Detections(xyxy, names) for xyxy in results.xyxy]
+
 # detect character and number in license plate
 def read_plate(yolo_license_plate, im):
-    LP_type = "1"
-    results = yolo_license_plate(im)
-    bb_list = results.pandas().xyxy[0].values.tolist()
-    if len(bb_list) == 0 or len(bb_list) < 7 or len(bb_list) > 10:
-        return "unknown"
-    center_list = []
-    y_mean = 0
-    y_sum = 0
-    for bb in bb_list:
-        x_c = (bb[0]+bb[2])/2
-        y_c = (bb[1]+bb[3])/2
-        y_sum += y_c
-        center_list.append([x_c,y_c,bb[-1]])
-
-    # find 2 point to draw line
-    l_point = center_list[0]
-    r_point = center_list[0]
-    for cp in center_list:
-        if cp[0] < l_point[0]:
-            l_point = cp
-        if cp[0] > r_point[0]:
-            r_point = cp
-    for ct in center_list:
-        if l_point[0] != r_point[0]:
-            if (check_point_linear(ct[0], ct[1], l_point[0], l_point[1], r_point[0], r_point[1]) == False):
-                LP_type = "2"
-
-    y_mean = int(int(y_sum) / len(bb_list))
-    size = results.pandas().s
-
-    # 1 line plates and 2 line plates
-    line_1 = []
-    line_2 = []
-    license_plate = ""
-    if LP_type == "2":
-        for c in center_list:
-            if int(c[1]) > y_mean:
-                line_2.append(c)
-            else:
-                line_1.append(c)
-        for l1 in sorted(line_1, key = lambda x: x[0]):
-            license_plate += str(l1[2])
-        license_plate += "-"
-        for l2 in sorted(line_2, key = lambda x: x[0]):
-            license_plate += str(l2[2])
-    else:
-        for l in sorted(center_list, key = lambda x: x[0]):
-            license_plate += str(l[2])
-    return license_plate
\ No newline at end of file
+    return read_plates(yolo_license_plate, [im])[0]
+
+# detect characters on several crops (deskew variants, all plates of a frame) in one forward pass
+def read_plates(yolo_license_plate, ims):
+    return [lp for lp, _ in read_plates_scored(yolo_license_plate, ims)]
+
+# same as read_plates but also returns the per-character confidences in reading order
+def read_plates_scored(yolo_license_plate, ims):
+    if len(ims) == 0:
+        return []
+    with metrics.timer("ocr"):
+        results = yolo_license_plate(list(ims))
+    with metrics.timer("layout"):
+        return [plate_layout(det) for det in detections(results)]
+
+def plate_from_detections(det):
+    return plate_layout(det)[0]
+
+# max distance (px) of a character center from the baseline for a 1 line plate
+LINE_TOL = 3
+
+# assemble the plate string from the character boxes of one crop:
+# 1 line plates are read left to right, 2 (or 3) line plates row by row joined with "-"
+def plate_layout(det):
+    if len(det) < 7 or len(det) > 10:
+        return "unknown", np.empty(0, dtype=np.float32)
+    boxes = det.boxes
+    x_c = (boxes[:, 0] + boxes[:, 2]) / 2
+    y_c = (boxes[:, 1] + boxes[:, 3]) / 2
+    rows = np.zeros(len(det), dtype=np.int32)
+
+    # line through the leftmost and rightmost centers, every center close to it -> 1 line plate
+    l, r = int(x_c.argmin()), int(x_c.argmax())
+    if x_c[l] != x_c[r]:
+        a, b = linear_equation(x_c[l], y_c[l], x_c[r], y_c[r])
+        if np.abs(a * x_c + b - y_c).max() > LINE_TOL:
+            rows = _assign_rows(x_c, y_c, boxes[:, 3] - boxes[:, 1])
+
+    order = np.lexsort((x_c, rows))
+    labels = np.asarray(det.labels(), dtype=object)[order]
+    splits = np.flatnonzero(np.diff(rows[order])) + 1
+    license_plate = "-".join("".join(line) for line in np.split(labels, splits))
+    return license_plate, det.conf[order]
+
+# split character centers into rows: cluster on y after removing the common slant of the rows
+def _assign_rows(x_c, y_c, heights):
+    gap = 0.5 * float(np.median(heights))
+    rows = _cluster_rows(y_c, gap)
+    if rows.max() > 0:
+        n = rows.max() + 1
+        cnt = np.bincount(rows, minlength=n)
+        dx = x_c - (np.bincount(rows, x_c, n) / cnt)[rows]
+        dy = y_c - (np.bincount(rows, y_c, n) / cnt)[rows]
+        den = float((dx * dx).sum())
+        if den > 0:
+            rows = _cluster_rows(y_c - (dx * dy).sum() / den * x_c, gap)
+    return rows
+
+def _cluster_rows(y, gap):
+    order = np.argsort(y)
+    rows = np.empty(len(y), dtype=np.int32)
+    rows[order] = np.concatenate(([0], np.cumsum(np.diff(y[order]) > gap)))
+    return rows
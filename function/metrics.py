@@ -0,0 +1,156 @@
+import math
+import time
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# latency bucket bounds in seconds, shared by every stage (1 ms .. 30 s)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# samples kept per stage for the rolling quantiles
+WINDOW = 1024
+QUANTILES = (50, 95, 99)
+
+# nearest-rank percentile of an ascending list (same numbers in /metrics, --profile and benchmarks/)
+def percentile(xs, p):
+    if not xs:
+        return 0.0
+    return xs[max(0, min(len(xs) - 1, math.ceil(p / 100.0 * len(xs)) - 1))]
+
+# latency histogram of one stage: cumulative bucket counts / sum / count since start
+# (Prometheus histogram) plus the last WINDOW samples for recent quantiles
+class Histogram:
+    def __init__(self, buckets=BUCKETS, window=WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, sec):
+        for i, b in enumerate(self.buckets):
+            if sec <= b:
+                self.counts[i] += 1
+                break
+        self.sum += sec
+        self.count += 1
+        self.recent.append(sec)
+
+    def quantiles(self, ps=QUANTILES):
+        xs = sorted(self.recent)
+        return {p: percentile(xs, p) for p in ps}
+
+# in-process registry of stage timers and counters; every method is thread safe and cheap
+# enough (one lock, no allocation beyond the sample) to stay enabled in production
+class Metrics:
+    def __init__(self, prefix="parking"):
+        self.prefix = prefix
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, sec):
+        with self._lock:
+            h = self.stages.get(stage)
+            if h is None:
+                h = self.stages[stage] = Histogram()
+            h.observe(sec)
+
+    @contextmanager
+    def timer(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    # decorator form of timer()
+    def timed(self, stage):
+        def deco(fn):
+            def wrapper(*a, **kw):
+                t0 = time.perf_counter()
+                try:
+                    return fn(*a, **kw)
+                finally:
+                    self.observe(stage, time.perf_counter() - t0)
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+        return deco
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        p = self.prefix
+        out = []
+        with self._lock:
+            stages = sorted(self.stages.items())
+            if stages:
+                out.append(f"# HELP {p}_stage_seconds Latency of pipeline stages.")
+                out.append(f"# TYPE {p}_stage_seconds histogram")
+                for stage, h in stages:
+                    acc = 0
+                    for b, c in zip(h.buckets, h.counts):
+                        acc += c
+                        out.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{b}"}} {acc}')
+                    out.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                    out.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {h.sum:.6f}')
+                    out.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+                out.append(f"# HELP {p}_stage_recent_seconds Quantiles over the last {WINDOW} samples of each stage.")
+                out.append(f"# TYPE {p}_stage_recent_seconds gauge")
+                for stage, h in stages:
+                    for q, v in h.quantiles().items():
+                        out.append(f'{p}_stage_recent_seconds{{stage="{stage}",quantile="{q / 100:g}"}} {v:.6f}')
+            names = {}
+            for (name, labels), v in self.counters.items():
+                names.setdefault(name, []).append((labels, v))
+        for name in sorted(names):
+            out.append(f"# TYPE {p}_{name}_total counter")
+            for labels, v in sorted(names[name]):
+                lab = ",".join(f'{k}="{_escape(val)}"' for k, val in labels)
+                out.append(f"{p}_{name}_total{{{lab}}} {v}" if lab else f"{p}_{name}_total {v}")
+        return "\n".join(out) + "\n"
+
+    # human readable table for --profile
+    def report(self):
+        with self._lock:
+            rows = [(stage, h.count, h.sum / h.count if h.count else 0.0, h.quantiles())
+                    for stage, h in sorted(self.stages.items())]
+            counters = sorted(self.counters.items())
+        lines = [f"{'stage':16s} {'n':>7s} {'mean':>9s} {'p50':>9s} {'p95':>9s} {'p99':>9s}  (ms)"]
+        for stage, n, mean, q in rows:
+            lines.append(f"{stage:16s} {n:7d} {1000 * mean:9.2f} {1000 * q[50]:9.2f} {1000 * q[95]:9.2f} {1000 * q[99]:9.2f}")
+        for (name, labels), v in counters:
+            lab = ",".join(f"{k}={val}" for k, val in labels)
+            lines.append(f"{name}{'{' + lab + '}' if lab else ''} = {v}")
+        return "\n".join(lines)
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+METRICS = Metrics()
+observe = METRICS.observe
+timer = METRICS.timer
+timed = METRICS.timed
+inc = METRICS.inc
+render = METRICS.render
+report = METRICS.report
+
+# --profile: print the stage table at exit and, when interval > 0, every `interval` seconds
+def enable_profile(interval=0.0):
+    atexit.register(lambda: print("\n" + report()))
+    if interval > 0:
+        def loop():
+            while True:
+                time.sleep(interval)
+                print("\n" + report())
+        threading.Thread(target=loop, name="metrics-profile", daemon=True).start()
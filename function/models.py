@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import hashlib
+import importlib.util
+import threading
+import numpy as np
+import function.metrics as metrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# local clone of ultralytics/yolov5 used by torch.hub (source='local')
+YOLO_DIR = os.path.join(ROOT, "yolov5")
+DETECTOR_WEIGHTS = os.path.join(ROOT, "model", "LP_detector_nano_61.pt")
+OCR_WEIGHTS = os.path.join(ROOT, "model", "LP_ocr_nano_62.pt")
+OCR_CONF = 0.60
+DETECT_SIZE = 640
+# class names used when an exported .onnx carries no names metadata
+DETECTOR_NAMES = os.path.join(ROOT, "training", "LP_detection.yaml")
+OCR_NAMES = os.path.join(ROOT, "training", "Letter_detect.yaml")
+
+# "torch": yolov5 through torch.hub; "onnx": ONNX Runtime on CPU; "openvino": ONNX Runtime
+# with the OpenVINO execution provider (onnxruntime-openvino). The .onnx files sit next to
+# the .pt weights (see export_onnx.py); a backend that cannot load falls back to torch.
+BACKENDS = ("torch", "onnx", "openvino")
+# "int8": the quantized <weights>.int8.onnx from training/quantize.py, onnx backends only and
+# only while its accuracy report (<weights>.int8.json) says it passed and the file is unchanged
+PRECISIONS = ("fp32", "int8")
+_config = {"backend": "torch", "threads": 0, "precision": "fp32"}
+
+# YOLOv5 model loaded on first use, once per process, from any thread.
+# Calls and attribute reads go to the loaded model, so it drops in wherever the scripts
+# used the torch.hub model directly. When loading fails and a `fallback` factory is set
+# (the scripts' mock models), the fallback is used instead of raising on every call.
+class LazyModel:
+    def __init__(self, name, weights, conf=None, names_yaml=None):
+        self.name = name
+        self.weights = weights
+        self.names_yaml = names_yaml
+        self.min_conf = conf
+        self.fallback = None
+        self.backend = None        # "yolov5" / "onnx" / "onnx-int8" / "mock" once loaded
+        self.load_sec = None
+        self.warmup_sec = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        model = self._model
+        if model is not None:
+            return model
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            return self._model
+
+    def reset(self):
+        with self._lock:
+            self._model = None
+            self.backend = self.load_sec = self.warmup_sec = None
+
+    def _load(self):
+        t0 = time.perf_counter()
+        model = None
+        if _config["backend"] != "torch":
+            try:
+                model = self._load_onnx(_config["backend"], _config["threads"], _config["precision"])
+            except Exception as e:
+                print(f"Không tải được model {self.name} ({_config['backend']}), dùng torch. Lỗi: {e}")
+        if model is None:
+            model = self._load_torch()
+        self.load_sec = time.perf_counter() - t0
+        metrics.observe("model_load", self.load_sec)
+        print(f"Đã nạp model {self.name} ({self.backend}) trong {self.load_sec:.2f}s")
+        return model
+
+    def _load_onnx(self, backend, threads, precision="fp32"):
+        import onnxruntime as ort
+        from function.onnx_backend import OnnxYolo
+        path = os.path.splitext(self.weights)[0] + ".onnx"
+        if precision == "int8":
+            ok, why = int8_approved(self.weights)
+            if ok:
+                path = int8_path(self.weights)
+            else:
+                print(f"Không dùng INT8 cho model {self.name}: {why}. Dùng FP32.")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{path} (chạy export_onnx.py)")
+        providers = ["CPUExecutionProvider"]
+        if backend == "openvino":
+            if "OpenVINOExecutionProvider" in ort.get_available_providers():
+                providers.insert(0, "OpenVINOExecutionProvider")
+            else:
+                print("onnxruntime không có OpenVINOExecutionProvider, chạy CPUExecutionProvider.")
+        model = OnnxYolo(path, providers=providers, threads=threads, names=yaml_names(self.names_yaml))
+        if self.min_conf is not None:
+            model.conf = self.min_conf
+        self.backend = "onnx-openvino" if "OpenVINOExecutionProvider" in model.providers else "onnx"
+        if path == int8_path(self.weights):
+            self.backend += "-int8"
+        return model
+
+    def _load_torch(self):
+        try:
+            import torch
+            # force_reload=False: reuse the hub cache instead of rebuilding it on every start
+            model = torch.hub.load(YOLO_DIR if os.path.isdir(YOLO_DIR) else "yolov5", "custom",
+                                   path=self.weights, force_reload=False, source="local")
+            if self.min_conf is not None:
+                model.conf = self.min_conf
+            self.backend = "yolov5"
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            print(f"Không tải được model {self.name}, dùng mock. Lỗi: {e}")
+            model = self.fallback()
+            self.backend = "mock"
+        return model
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    # one inference on a blank input so CUDA/cuDNN setup and the first-call allocations
+    # happen before the first vehicle
+    def warmup(self, ims, **kw):
+        model = self.get()
+        if self.backend == "mock":
+            return
+        t0 = time.perf_counter()
+        model(ims, **kw)
+        self.warmup_sec = time.perf_counter() - t0
+        metrics.observe("model_warmup", self.warmup_sec)
+        print(f"Warm-up model {self.name} trong {self.warmup_sec:.2f}s")
+
+    def __call__(self, *a, **kw):
+        return self.get()(*a, **kw)
+
+    def __getattr__(self, attr):
+        # only reached for attributes LazyModel itself does not have
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+def yaml_names(path):
+    if not path or not os.path.isfile(path):
+        return None
+    import yaml
+    with open(path, encoding="utf-8") as f:
+        names = yaml.safe_load(f).get("names")
+    return dict(enumerate(names)) if isinstance(names, list) else names
+
+def int8_path(weights):
+    return os.path.splitext(weights)[0] + ".int8.onnx"
+
+def int8_report_path(weights):
+    return os.path.splitext(weights)[0] + ".int8.json"
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# (ok, reason): the INT8 model exists, passed the accuracy check and was not replaced since
+def int8_approved(weights):
+    path, report = int8_path(weights), int8_report_path(weights)
+    if not os.path.isfile(path):
+        return False, f"thiếu {os.path.basename(path)} (chạy training/quantize.py)"
+    try:
+        with open(report, encoding="utf-8") as f:
+            rep = json.load(f)
+    except (OSError, ValueError):
+        return False, f"thiếu báo cáo kiểm tra độ chính xác {os.path.basename(report)}"
+    if not rep.get("passed"):
+        return False, "không đạt kiểm tra độ chính xác"
+    if rep.get("sha256") != file_sha256(path):
+        return False, "file INT8 đã đổi sau lần kiểm tra"
+    return True, ""
+
+# an inference runtime is installed (the weights are only checked when a model is loaded)
+def available():
+    return any(importlib.util.find_spec(m) is not None for m in ("torch", "onnxruntime"))
+
+DETECTOR = LazyModel("detector", DETECTOR_WEIGHTS, names_yaml=DETECTOR_NAMES)
+OCR = LazyModel("ocr", OCR_WEIGHTS, conf=OCR_CONF, names_yaml=OCR_NAMES)
+
+# choose the inference backend (settings infer_backend / infer_threads / infer_precision);
+# models already loaded with another backend are dropped and load again on next use
+def configure(backend=None, threads=None, precision=None):
+    backend = str(backend or "torch").strip().lower()
+    if backend not in BACKENDS:
+        print(f"infer_backend không hợp lệ: {backend}, dùng torch.")
+        backend = "torch"
+    try:
+        threads = max(0, int(threads or 0))
+    except ValueError:
+        threads = 0
+    precision = str(precision or "fp32").strip().lower()
+    if precision not in PRECISIONS:
+        print(f"infer_precision không hợp lệ: {precision}, dùng fp32.")
+        precision = "fp32"
+    if precision == "int8" and backend == "torch":
+        print("infer_precision=int8 chỉ áp dụng cho backend onnx / openvino, torch chạy FP32.")
+    changed = (backend, threads, precision) != (_config["backend"], _config["threads"], _config["precision"])
+    _config.update(backend=backend, threads=threads, precision=precision)
+    if changed:
+        for m in (DETECTOR, OCR):
+            m.reset()
+    return changed
+
+# (detector, ocr) shared by every script; `fallback` builds a mock model when loading fails
+def yolo_models(fallback=None):
+    if fallback is not None:
+        DETECTOR.fallback = DETECTOR.fallback or fallback
+        OCR.fallback = OCR.fallback or fallback
+    return DETECTOR, OCR
+
+def warmup(size=DETECT_SIZE):
+    DETECTOR.warmup(np.zeros((size, size, 3), dtype=np.uint8), size=size)
+    OCR.warmup([np.zeros((64, 160, 3), dtype=np.uint8)])
+
+# load (and warm up) both models; in the background by default so the UI / serial start at once
+def preload(warm=True, background=True):
+    def run():
+        try:
+            DETECTOR.get()
+            OCR.get()
+            if warm:
+                warmup()
+        except Exception as e:
+            print("Nạp model lỗi:", e)
+    if not background:
+        run()
+        return None
+    th = threading.Thread(target=run, name="model-preload", daemon=True)
+    th.start()
+    return th
+
+def timings():
+    return {m.name: {"backend": m.backend, "load_sec": m.load_sec, "warmup_sec": m.warmup_sec}
+            for m in (DETECTOR, OCR)}
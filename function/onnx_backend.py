@@ -0,0 +1,134 @@
+import ast
+import numpy as np
+import cv2
+
+# CPU inference of the exported YOLOv5 models with ONNX Runtime (optionally through the
+# OpenVINO execution provider). Pre/post-processing mirrors yolov5's AutoShape with NumPy only:
+# letterbox -> CHW float in [0, 1] -> model -> confidence filter -> NMS -> boxes back on the image.
+# Calls return an object with .xyxy / .names like the torch.hub model, so helper.detections,
+# read_plate(s) and the engine work unchanged.
+
+def make_divisible(x, d):
+    return int(np.ceil(x / d) * d)
+
+# resize keeping the aspect ratio and pad to `shape` (h, w); returns image, ratio, (pad_w, pad_h)
+def letterbox(im, shape, color=(114, 114, 114)):
+    h, w = im.shape[:2]
+    r = min(shape[0] / h, shape[1] / w)
+    nw, nh = int(round(w * r)), int(round(h * r))
+    dw, dh = (shape[1] - nw) / 2, (shape[0] - nh) / 2
+    if (w, h) != (nw, nh):
+        im = cv2.resize(im, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    im = cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return im, r, (dw, dh)
+
+def xywh2xyxy(x):
+    y = np.empty_like(x)
+    y[:, 0] = x[:, 0] - x[:, 2] / 2
+    y[:, 1] = x[:, 1] - x[:, 3] / 2
+    y[:, 2] = x[:, 0] + x[:, 2] / 2
+    y[:, 3] = x[:, 1] + x[:, 3] / 2
+    return y
+
+# greedy NMS: indices of the kept boxes, highest score first
+def nms(boxes, scores, iou_thres):
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+# raw predictions of one image (n, 5 + classes: xywh, objectness, class scores) ->
+# (k, 6) xyxy, conf, cls; class-aware like yolov5 (boxes offset by class before NMS)
+def non_max_suppression(pred, conf_thres=0.25, iou_thres=0.45, max_det=1000, max_nms=30000, max_wh=7680):
+    x = pred[pred[:, 4] > conf_thres]
+    if not len(x):
+        return np.zeros((0, 6), dtype=np.float32)
+    scores = x[:, 5:] * x[:, 4:5]
+    cls = scores.argmax(1)
+    conf = scores[np.arange(len(x)), cls]
+    m = conf > conf_thres
+    box, conf, cls = xywh2xyxy(x[m, :4]), conf[m], cls[m]
+    if len(conf) > max_nms:
+        top = conf.argsort()[::-1][:max_nms]
+        box, conf, cls = box[top], conf[top], cls[top]
+    keep = nms(box + (cls * max_wh)[:, None], conf, iou_thres)[:max_det]
+    return np.concatenate([box[keep], conf[keep, None], cls[keep, None].astype(np.float32)], 1)
+
+class OnnxResults:
+    __slots__ = ("xyxy", "names")
+
+    def __init__(self, xyxy, names):
+        self.xyxy = xyxy
+        self.names = names
+
+class OnnxYolo:
+    def __init__(self, path, providers=None, threads=0, names=None, conf=0.25, iou=0.45, max_det=1000):
+        import onnxruntime as ort
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            so.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(path, so, providers=providers or ["CPUExecutionProvider"])
+        self.providers = self.session.get_providers()
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.dtype = np.float16 if inp.type == "tensor(float16)" else np.float32
+        # exported with --dynamic: batch and image size are free, otherwise fixed
+        b, _, h, w = inp.shape
+        self.batch = b if isinstance(b, int) else None
+        self.shape = (h, w) if isinstance(h, int) and isinstance(w, int) else None
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.stride = int(meta.get("stride", 32))
+        self.names = ast.literal_eval(meta["names"]) if "names" in meta else (names or {})
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    # input shape for a batch: AutoShape's rectangular shape when the model is dynamic
+    def _input_shape(self, ims, size):
+        if self.shape is not None:
+            return self.shape
+        g = [size / max(im.shape[:2]) for im in ims]
+        hw = np.array([[im.shape[0] * s, im.shape[1] * s] for im, s in zip(ims, g)]).max(0)
+        return tuple(make_divisible(int(v), self.stride) for v in hw)
+
+    # images -> (NCHW input, letterboxed images with ratio / padding, 3 channel images);
+    # `shape` forces the input size (INT8 calibration feeds every sample at the same size)
+    def preprocess(self, ims, size=640, shape=None):
+        ims = [im[..., :3] if im.ndim == 3 else cv2.cvtColor(im, cv2.COLOR_GRAY2BGR) for im in ims]
+        shape = shape or self._input_shape(ims, size)
+        boxed = [letterbox(im, shape) for im in ims]
+        x = np.ascontiguousarray(np.stack([b[0] for b in boxed]).transpose(0, 3, 1, 2)).astype(self.dtype) / 255
+        return x, boxed, ims
+
+    def __call__(self, ims, size=640):
+        ims = list(ims) if isinstance(ims, (list, tuple)) else [ims]
+        if not ims:
+            return OnnxResults([], self.names)
+        x, boxed, ims = self.preprocess(ims, size)
+
+        if self.batch is None or self.batch == len(ims):
+            pred = self.session.run(None, {self.input_name: x})[0]
+        else:
+            pred = np.concatenate([self.session.run(None, {self.input_name: x[i:i + 1]})[0] for i in range(len(ims))])
+        pred = pred.astype(np.float32)
+
+        xyxy = []
+        for p, im, (_, r, (dw, dh)) in zip(pred, ims, boxed):
+            det = non_max_suppression(p, self.conf, self.iou, self.max_det)
+            det[:, [0, 2]] = ((det[:, [0, 2]] - dw) / r).clip(0, im.shape[1])
+            det[:, [1, 3]] = ((det[:, [1, 3]] - dh) / r).clip(0, im.shape[0])
+            xyxy.append(det)
+        return OnnxResults(xyxy, self.names)
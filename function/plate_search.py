@@ -0,0 +1,60 @@
+import re
+import threading
+from collections import Counter
+import numpy as np
+import function.helper as helper
+import function.utils_rotate as utils_rotate
+import function.metrics as metrics
+
+# (change_cons, center_thres) deskew combinations, in the order they were always tried
+VARIANTS = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+# province code, series (letter + optional letter/digit), optional "-", 4-5 digit number
+PLATE_RE = re.compile(r"^\d{2}[A-Z][A-Z0-9]?-?\d{4,5}$")
+
+# score of an OCR result: mean character confidence, halved when the text is not a valid plate
+def plate_score(lp, char_conf):
+    if lp == "unknown" or len(char_conf) == 0:
+        return 0.0
+    score = float(np.mean(char_conf))
+    if not PLATE_RE.match(lp.replace(".", "")):
+        score *= 0.5
+    return score
+
+# search the deskew variants of a plate crop for the best OCR result:
+# the variant that won most often on this camera is tried alone first and accepted
+# when its score reaches `accept`, otherwise the remaining variants go through in one batch
+class PlateSearch:
+    def __init__(self, yolo_license_plate, accept=0.80):
+        self.yolo_license_plate = yolo_license_plate
+        self.accept = accept
+        self.wins = {}
+        self._lock = threading.Lock()
+
+    def order(self, camera):
+        with self._lock:
+            wins = self.wins.get(camera)
+            if not wins:
+                return list(VARIANTS)
+            first = max(VARIANTS, key=lambda v: (wins[v], -VARIANTS.index(v)))
+        return [first] + [v for v in VARIANTS if v != first]
+
+    # returns (plate, score, variant); plate is "unknown" and variant None when nothing was read
+    def search(self, crop, camera="default"):
+        order = self.order(camera)
+        best = ("unknown", 0.0, None)
+        # variants share the CLAHE / edge / Hough work done on this crop
+        with utils_rotate.deskewer().for_crop(crop) as dk:
+            for batch in (order[:1], order[1:]):
+                ims = [dk.deskew(crop, cc, ct) for cc, ct in batch]
+                for variant, (lp, conf) in zip(batch, helper.read_plates_scored(self.yolo_license_plate, ims)):
+                    score = plate_score(lp, conf)
+                    if lp != "unknown" and score > best[1]:
+                        best = (lp, score, variant)
+                if best[1] >= self.accept:
+                    break
+        if best[2] is not None:
+            metrics.inc("plate_variant_wins", camera=camera, variant="%d%d" % best[2])
+            with self._lock:
+                self.wins.setdefault(camera, Counter())[best[2]] += 1
+        return best
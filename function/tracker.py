@@ -0,0 +1,152 @@
+import time
+import threading
+from collections import Counter
+import numpy as np
+
+# IoU of one box against an (N, 4) array of boxes
+def iou(box, boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(box[0], boxes[:, 0]); y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2]); y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+class Track:
+    def __init__(self, tid, box, now):
+        self.id = tid
+        self.box = np.asarray(box, dtype=np.float32)
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.votes = Counter()
+        self.reads = Counter()
+        self.crop = None
+        self.last_ocr = 0.0
+
+    # (plate, summed score, reads) of the leading OCR result, None before any read
+    def leader(self):
+        if not self.votes:
+            return None
+        plate, score = self.votes.most_common(1)[0]
+        return plate, score, self.reads[plate]
+
+# plate boxes matched frame to frame by IoU (centroid distance as a fallback for fast
+# moving plates); each track accumulates score-weighted OCR votes
+class PlateTracker:
+    def __init__(self, iou_thres=0.3, max_age=1.5, max_shift=0.5):
+        self.iou_thres = iou_thres
+        self.max_age = max_age
+        self.max_shift = max_shift
+        self.tracks = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def update(self, boxes, now=None):
+        now = time.time() if now is None else now
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        with self._lock:
+            self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+            free = list(range(len(boxes)))
+            matched = []
+            for t in sorted(self.tracks, key=lambda t: -t.hits):
+                if not free:
+                    break
+                cand = boxes[free]
+                scores = iou(t.box, cand)
+                j = int(scores.argmax())
+                if scores[j] < self.iou_thres:
+                    # centroid fallback: shift smaller than max_shift plate widths
+                    c = (cand[:, :2] + cand[:, 2:]) / 2
+                    tc = (t.box[:2] + t.box[2:]) / 2
+                    dist = np.linalg.norm(c - tc, axis=1)
+                    j = int(dist.argmin())
+                    if dist[j] > self.max_shift * max(t.box[2] - t.box[0], 1.0):
+                        continue
+                t.box = cand[j]
+                t.last_seen = now
+                t.hits += 1
+                matched.append(t)
+                free.pop(j)
+            for j in free:
+                t = Track(self._next_id, boxes[j], now)
+                self._next_id += 1
+                self.tracks.append(t)
+                matched.append(t)
+            return matched
+
+    def vote(self, track, plate, score, crop=None):
+        with self._lock:
+            track.last_ocr = time.time()
+            if plate == "unknown" or score <= 0:
+                return
+            track.votes[plate] += score
+            track.reads[plate] += 1
+            if crop is not None and (track.crop is None or plate == track.leader()[0]):
+                track.crop = crop
+
+    # (plate, crop) voted by the freshest live track that has read a plate, else None
+    def consensus(self, max_age=None, min_reads=1):
+        max_age = self.max_age if max_age is None else max_age
+        now = time.time()
+        with self._lock:
+            live = [t for t in self.tracks if now - t.last_seen <= max_age and t.leader()]
+            live = [t for t in live if t.leader()[2] >= min_reads]
+            if not live:
+                return None
+            t = max(live, key=lambda t: (t.last_seen, t.leader()[1]))
+            return t.leader()[0], t.crop
+
+# continuous recognition on one gate camera: runs the detector on a sub-sampled stream,
+# tracks the plate boxes and OCRs each track until its reading is settled
+class GateWatcher:
+    def __init__(self, read_frame, detect, search, camera, interval=0.2, ocr_interval=0.3, settle_reads=3):
+        self.read_frame = read_frame    # () -> (seq, timestamp, frame)
+        self.detect = detect            # frame -> helper.Detections
+        self.search = search            # function.plate_search.PlateSearch
+        self.camera = camera
+        self.interval = interval
+        self.ocr_interval = ocr_interval
+        self.settle_reads = settle_reads
+        self.tracker = PlateTracker()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"watch-{self.camera}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def plate(self, max_age=2.0):
+        return self.tracker.consensus(max_age=max_age)
+
+    def _run(self):
+        last_seq = -1
+        while not self._stop.wait(self.interval):
+            seq, ts, frame = self.read_frame()
+            if frame is None or seq == last_seq:
+                continue
+            last_seq = seq
+            try:
+                det = self.detect(frame)
+                tracks = self.tracker.update(det.boxes, now=ts)
+                for t in tracks:
+                    lead = t.leader()
+                    if lead and lead[2] >= self.settle_reads:
+                        continue
+                    if ts - t.last_ocr < self.ocr_interval:
+                        continue
+                    x, y, x2, y2 = map(int, t.box)
+                    x = max(0, x); y = max(0, y); x2 = max(x + 1, x2); y2 = max(y + 1, y2)
+                    crop = frame[y:y2, x:x2]
+                    lp, score, _ = self.search.search(crop, self.camera)
+                    self.tracker.vote(t, lp, score, crop)
+            except Exception as e:
+                print(f"Lỗi theo dõi biển số {self.camera}:", e)
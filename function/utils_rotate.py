@@ -1,11 +1,15 @@
 import numpy as np
 import math
 import cv2
+import threading
+from contextlib import contextmanager
+import function.metrics as metrics
 
-def changeContrast(img):
+def changeContrast(img, clahe=None):
+    if clahe is None:
+        clahe = deskewer().clahe
     lab= cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
     l_channel, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
     cl = clahe.apply(l_channel)
     limg = cv2.merge((cl,a,b))
     enhanced_img = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
@@ -17,7 +21,7 @@ def rotate_image(image, angle):
     result = cv2.warpAffine(image, rot_mat, image.shape[1::-1], flags=cv2.INTER_LINEAR)
     return result
 
-def compute_skew(src_img, center_thres):
+def hough_lines(src_img):
     if len(src_img.shape) == 3:
         h, w, _ = src_img.shape
     elif len(src_img.shape) == 2:
@@ -27,6 +31,10 @@ def compute_skew(src_img, center_thres):
     img = cv2.medianBlur(src_img, 3)
     edges = cv2.Canny(img,  threshold1 = 30,  threshold2 = 100, apertureSize = 3, L2gradient = True)
     lines = cv2.HoughLinesP(edges, 1, math.pi/180, 30, minLineLength=w / 1.5, maxLineGap=h/3.0)
+    # OpenCV 5 returns (N, 4) instead of (N, 1, 4)
+    return lines if lines is None else lines.reshape(-1, 1, 4)
+
+def skew_from_lines(lines, center_thres):
     if lines is None:
         return 1
 
@@ -54,9 +62,61 @@ def compute_skew(src_img, center_thres):
         return 0.0
     return (angle / cnt)*180/math.pi
 
-def deskew(src_img, change_cons, center_thres):
-    if change_cons == 1:
-        return rotate_image(src_img, compute_skew(changeContrast(src_img), center_thres))
-    else:
-        return rotate_image(src_img, compute_skew(src_img, center_thres))
+def compute_skew(src_img, center_thres):
+    return skew_from_lines(hough_lines(src_img), center_thres)
+
+# reusable deskew state: holds the CLAHE object and, for the crop given to prepare() /
+# for_crop(), the Hough lines of each contrast mode and the skew angle of each
+# (change_cons, center_thres) variant, so trying all four variants on one crop runs the
+# edge/line detection only twice. Other images are deskewed without caching
+class Deskewer:
+    def __init__(self, clip_limit=3.0, tile_grid_size=(8,8)):
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        self._crop = None
+        self._lines = {}
+        self._angles = {}
+
+    def prepare(self, crop):
+        self._crop = crop
+        self._lines = {}
+        self._angles = {}
 
+    # drop the cached crop (and the reference keeping it alive)
+    def release(self):
+        self.prepare(None)
+
+    @contextmanager
+    def for_crop(self, crop):
+        self.prepare(crop)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def angle(self, src_img, change_cons, center_thres):
+        if self._crop is None or src_img is not self._crop:
+            img = changeContrast(src_img, self.clahe) if change_cons == 1 else src_img
+            return compute_skew(img, center_thres)
+        key = (change_cons, center_thres)
+        if key not in self._angles:
+            if change_cons not in self._lines:
+                img = changeContrast(src_img, self.clahe) if change_cons == 1 else src_img
+                self._lines[change_cons] = hough_lines(img)
+            self._angles[key] = skew_from_lines(self._lines[change_cons], center_thres)
+        return self._angles[key]
+
+    def deskew(self, src_img, change_cons, center_thres):
+        with metrics.timer("deskew"):
+            return rotate_image(src_img, self.angle(src_img, change_cons, center_thres))
+
+_local = threading.local()
+
+# Deskewer of the calling thread (CLAHE objects are not shared between threads)
+def deskewer():
+    dk = getattr(_local, "deskewer", None)
+    if dk is None:
+        dk = _local.deskewer = Deskewer()
+    return dk
+
+def deskew(src_img, change_cons, center_thres):
+    return deskewer().deskew(src_img, change_cons, center_thres)
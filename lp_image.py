@@ -1,6 +1,5 @@
 from PIL import Image
 import cv2
-import torch
 import math 
 import function.utils_rotate as utils_rotate
 from IPython.display import display
@@ -8,20 +7,23 @@ import os
 import time
 import argparse
 import function.helper as helper
+import function.metrics as metrics
+from function import models
 
 ap = argparse.ArgumentParser()
 ap.add_argument('-i', '--image', required=True, help='path to input image')
+ap.add_argument('--profile', nargs='?', type=float, const=0.0, default=None, metavar='SEC',
+                help='print per-stage latency at exit (and every SEC seconds)')
 args = ap.parse_args()
+if args.profile is not None:
+    metrics.enable_profile(args.profile)
 
-yolo_LP_detect = torch.hub.load('yolov5', 'custom', path='model/LP_detector.pt', force_reload=True, source='local')
-yolo_license_plate = torch.hub.load('yolov5', 'custom', path='model/LP_ocr.pt', force_reload=True, source='local')
-yolo_license_plate.conf = 0.60
+yolo_LP_detect, yolo_license_plate = models.yolo_models()
 
 img = cv2.imread(args.image)
-plates = yolo_LP_detect(img, size=640)
-
-plates = yolo_LP_detect(img, size=640)
-list_plates = plates.pandas().xyxy[0].values.tolist()
+with metrics.timer("detect"):
+    plates = yolo_LP_detect(img, size=640)
+list_plates = helper.detections(plates)[0].boxes.tolist()
 list_read_plates = set()
 if len(list_plates) == 0:
     lp = helper.read_plate(yolo_license_plate,img)
@@ -30,25 +32,22 @@ if len(list_plates) == 0:
         list_read_plates.add(lp)
 else:
     for plate in list_plates:
-        flag = 0
         x = int(plate[0]) # xmin
         y = int(plate[1]) # ymin
         w = int(plate[2] - plate[0]) # xmax - xmin
         h = int(plate[3] - plate[1]) # ymax - ymin  
-        crop_img = img[y:y+h, x:x+w]
+        with metrics.timer("crop"):
+            crop_img = img[y:y+h, x:x+w]
         cv2.rectangle(img, (int(plate[0]),int(plate[1])), (int(plate[2]),int(plate[3])), color = (0,0,225), thickness = 2)
         cv2.imwrite("crop.jpg", crop_img)
         rc_image = cv2.imread("crop.jpg")
         lp = ""
-        for cc in range(0,2):
-            for ct in range(0,2):
-                lp = helper.read_plate(yolo_license_plate, utils_rotate.deskew(crop_img, cc, ct))
-                if lp != "unknown":
-                    list_read_plates.add(lp)
-                    cv2.putText(img, lp, (int(plate[0]), int(plate[1]-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36,255,12), 2)
-                    flag = 1
-                    break
-            if flag == 1:
+        with utils_rotate.deskewer().for_crop(crop_img) as dk:
+            variants = [dk.deskew(crop_img, cc, ct) for cc in range(0,2) for ct in range(0,2)]
+        for lp in helper.read_plates(yolo_license_plate, variants):
+            if lp != "unknown":
+                list_read_plates.add(lp)
+                cv2.putText(img, lp, (int(plate[0]), int(plate[1]-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36,255,12), 2)
                 break
 cv2.imshow('frame', img)
 cv2.waitKey() 
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - MASTER GIẢ LẬP: thay Arduino/Master/Master.ino để test tải không cần phần cứng.
+
+Giả lập đúng giao thức dòng lệnh của MASTER (xem parking_master.py):
+  PING, STATUS, SW?, LCD1:/LCD2:, BEEP:n, SETPOS:n, GO:n | 1..4, OPEN_IN/OPEN_OUT, OUT,<plate>,
+  M:STOP/M:FWD:x/M:REV:x, RFID_IN:/RFID_OUT: (echo như MASTER chuyển tiếp), lệnh lạ -> ERR:UNKNOWN_CMD
+Motor đi qua từng trạm sau travel_sec (STATION_PASS:n ... ARRIVED:n), có lệnh chờ (OK:PENDING).
+Lỗi giả lập: kẹt motor -> ERR:MOVE_TIMEOUT + STATUS, mất dòng ARRIVED (theo xác suất).
+
+Kết nối (engine mở bằng _read_master_serial như COM thật):
+  python master_sim.py --pty                  -> in ra /dev/pts/N (Linux/macOS), đặt com_port=/dev/pts/N
+  python master_sim.py --tcp 7000             -> com_port=socket://127.0.0.1:7000
+  python parking_engine.py --no-web --com socket://127.0.0.1:7000
+
+Tạo dồn sự kiện: --burst rfid_in:200@100 (200 thẻ, 100 sự kiện/giây), loại: rfid_in, rfid_out,
+touch_in, touch_out. Khi chạy có thể gõ lệnh vào console: "rfid_in 50 200", "touch_out 5",
+hoặc 1 dòng thô (vd "RFID_IN:04A1B2C3") để gửi lên PC.
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import threading
+
+N_STATIONS = 4
+BURST_KINDS = {"rfid_in": "RFID_IN", "rfid_out": "RFID_OUT", "touch_in": "TOUCH_IN", "touch_out": "TOUCH_OUT"}
+
+def random_uid(rng=random):
+    return "".join(f"{rng.randrange(256):02X}" for _ in range(4))
+
+class VirtualMaster:
+    """
+    Trạng thái MASTER + xử lý lệnh. write(bytes) là hàm gửi lên PC (do transport gắn vào).
+    Lệnh xử lý tuần tự như loop() của Arduino; motor chạy trên luồng riêng.
+    """
+
+    def __init__(self, travel_sec=0.4, beep_sec=0.16, move_timeout_sec=12.0,
+                 stall_rate=0.0, drop_arrived_rate=0.0, start_pos=1, seed=None):
+        self.travel_sec = float(travel_sec)
+        self.beep_sec = float(beep_sec)              # 1 tiếng beep (90ms bật + 70ms tắt)
+        self.move_timeout_sec = float(move_timeout_sec)
+        self.stall_rate = float(stall_rate)          # xác suất motor kẹt -> ERR:MOVE_TIMEOUT
+        self.drop_arrived_rate = float(drop_arrived_rate)  # xác suất mất dòng ARRIVED
+        self.rng = random.Random(seed)
+
+        self.position = int(start_pos)
+        self.target = 0
+        self.pending = 0
+        self.direction = "IDLE"
+        self.spinning = False
+        self.stalled = False
+        self.steps_needed = 0
+        self.steps_passed = 0
+        self.move_start = 0.0
+        self.next_pass = 0.0
+        self.lcd = {"LCD1": "", "LCD2": ""}
+        self.gate = {"in": False, "out": False}
+
+        self.write = None
+        self.stats = {"rx": 0, "tx": 0, "moves": 0, "stalls": 0, "dropped_arrived": 0}
+        self._lock = threading.RLock()
+        self._buf = b""
+        self._stop = threading.Event()
+        self._motor_thread = threading.Thread(target=self._motor_loop, name="sim-motor", daemon=True)
+        self._motor_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- gửi lên PC ----------
+    def emit(self, line):
+        with self._lock:
+            w = self.write
+            if w is None:
+                return
+            try:
+                w((line + "\r\n").encode("utf-8"))
+                self.stats["tx"] += 1
+            except OSError:
+                self.write = None
+
+    def boot(self):
+        self.emit("MASTER_FULL_READY")
+        self.print_status()
+
+    def print_status(self):
+        self.emit(f"STATUS:pos={self.position},target={self.target},pending={self.pending},"
+                  f"motor={'RUN' if self.spinning else 'STOP'},dir={self.direction},LIMIT=0")
+
+    # ---------- nhận từ PC ----------
+    def feed(self, data):
+        """Nhận byte từ PC, tách dòng và xử lý từng lệnh."""
+        self._buf += data
+        while b"\n" in self._buf:
+            raw, self._buf = self._buf.split(b"\n", 1)
+            cmd = raw.decode("utf-8", errors="ignore").strip()
+            if cmd:
+                self.stats["rx"] += 1
+                self.handle(cmd)
+
+    def handle(self, cmd):
+        if cmd == "PING":
+            return self.emit("PONG")
+        if cmd == "STATUS":
+            return self.print_status()
+        if cmd == "SW?":
+            return self.emit("LIMIT=0")
+        if cmd.startswith(("LCD1:", "LCD2:")):
+            self.lcd[cmd[:4]] = cmd[5:][:16]
+            return self.emit("OK:" + cmd[:4])
+        if cmd.startswith("BEEP:"):
+            self._beep(max(1, min(5, _int(cmd[5:], 1))))
+            return self.emit("OK:BEEP")
+        if cmd == "M:STOP":
+            with self._lock:
+                self.spinning = False
+                self.direction = "IDLE"
+            return self.emit("MOTOR:STOP")
+        if cmd.startswith(("M:FWD:", "M:REV:")):
+            return self.emit("MOTOR:" + cmd[2:])
+        if cmd.startswith("SETPOS:"):
+            with self._lock:
+                self.position = max(1, min(N_STATIONS, _int(cmd[7:], 1)))
+                self.pending = 0
+                self.spinning = False
+                self.direction = "IDLE"
+            self.emit("MOTOR:STOP")
+            self.emit(f"OK:SETPOS:{self.position}")
+            return self.print_status()
+        if cmd.startswith("GO:"):
+            return self.start_move(_int(cmd[3:], 1))
+        if cmd in ("1", "2", "3", "4"):
+            return self.start_move(int(cmd))
+        if cmd in ("OPEN_IN", "OPEN_OUT"):
+            self.gate["in" if cmd == "OPEN_IN" else "out"] = True
+            self._beep(2)
+            return self.emit("OK:" + cmd)
+        if cmd.startswith("OUT,"):
+            self.lcd["LCD2"] = cmd[4:][:16]
+            return self.emit("OK:OUT_UI")
+        if cmd.startswith(("RFID_IN:", "RFID_OUT:")):
+            return self.emit(cmd)
+        self.emit("ERR:UNKNOWN_CMD:" + cmd)
+
+    def _beep(self, n):
+        if self.beep_sec > 0:
+            time.sleep(self.beep_sec * n)
+
+    # ---------- motor ----------
+    def start_move(self, t):
+        t = max(1, min(N_STATIONS, t))
+        with self._lock:
+            if self.spinning:
+                self.pending = t
+                return self.emit(f"OK:PENDING:{t}")
+            if t == self.position:
+                self.emit(f"ARRIVED:{t}")
+                return self.emit("OK:ALREADY_THERE")
+            cw = (t - self.position) % N_STATIONS
+            ccw = (self.position - t) % N_STATIONS
+            self.target = t
+            self.direction = "FWD" if cw <= ccw else "REV"
+            self.steps_needed = min(cw, ccw)
+            self.steps_passed = 0
+            self.spinning = True
+            self.stalled = self.rng.random() < self.stall_rate
+            self.move_start = time.time()
+            self.next_pass = self.move_start + self.travel_sec
+            self.stats["moves"] += 1
+            self.emit(f"MOTOR:{self.direction}:200")
+            self.emit(f"OK:GO:{t}")
+
+    def _motor_loop(self):
+        while not self._stop.wait(0.01):
+            with self._lock:
+                if not self.spinning:
+                    continue
+                now = time.time()
+                if self.stalled:
+                    if now - self.move_start > self.move_timeout_sec:
+                        self.spinning = False
+                        self.direction = "IDLE"
+                        self.stats["stalls"] += 1
+                        self.emit("MOTOR:STOP")
+                        self.emit("ERR:MOVE_TIMEOUT")
+                        self.print_status()
+                    continue
+                if now >= self.next_pass:
+                    self._station_pass()
+                    self.next_pass = now + self.travel_sec
+
+    def _station_pass(self):
+        step = 1 if self.direction == "FWD" else -1
+        self.position = (self.position - 1 + step) % N_STATIONS + 1
+        self.steps_passed += 1
+        self.emit(f"STATION_PASS:{self.position}")
+        if self.steps_passed < self.steps_needed:
+            return
+        self.spinning = False
+        self.direction = "IDLE"
+        self.emit("MOTOR:STOP")
+        if self.rng.random() < self.drop_arrived_rate:
+            self.stats["dropped_arrived"] += 1
+        else:
+            self.emit(f"ARRIVED:{self.position}")
+        if self.pending:
+            t, self.pending = self.pending, 0
+            self.start_move(t)
+
+    # ---------- dồn sự kiện ----------
+    def burst(self, kind, count=1, rate=0.0):
+        """Gửi count sự kiện kind (rfid_in/rfid_out/touch_in/touch_out), rate sự kiện/giây (0: dồn liên tục)."""
+        prefix = BURST_KINDS[kind]
+        gap = 1.0 / rate if rate > 0 else 0.0
+        t0 = time.time()
+        for i in range(int(count)):
+            if gap:
+                delay = t0 + i * gap - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.emit(f"{prefix}:{random_uid(self.rng)}" if prefix.startswith("RFID") else prefix)
+
+    def burst_async(self, kind, count=1, rate=0.0):
+        th = threading.Thread(target=self.burst, args=(kind, count, rate), daemon=True)
+        th.start()
+        return th
+
+def _int(s, default=0):
+    try:
+        return int(str(s).strip())
+    except ValueError:
+        return default
+
+def parse_burst(spec):
+    """'rfid_in:200@100' -> ('rfid_in', 200, 100.0)."""
+    kind, _, rest = spec.partition(":")
+    count, _, rate = (rest or "1").partition("@")
+    if kind not in BURST_KINDS:
+        raise ValueError(f"loại burst không hợp lệ: {kind}")
+    return kind, int(count), float(rate or 0)
+
+# ===================== TRANSPORT =====================
+def serve_pty(vm, on_ready=None):
+    """Mở cặp pseudo-terminal (POSIX), trả đường dẫn phía engine; đọc lệnh trên luồng nền."""
+    import tty
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(slave_fd)
+    path = os.ttyname(slave_fd)
+    vm.write = lambda b: os.write(master_fd, b)
+
+    def loop():
+        while not vm._stop.is_set():
+            try:
+                data = os.read(master_fd, 4096)
+            except OSError:
+                break
+            if data:
+                vm.feed(data)
+    threading.Thread(target=loop, name="sim-pty", daemon=True).start()
+    vm.boot()
+    if on_ready:
+        on_ready()
+    return path
+
+def serve_tcp(vm, host="127.0.0.1", port=7000, on_ready=None):
+    """Server TCP cho pyserial socket://host:port; mỗi lúc 1 client (như 1 cổng COM). Trả cổng thật."""
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind((host, port))
+    srv.listen(1)
+
+    def loop():
+        while not vm._stop.is_set():
+            try:
+                conn, _ = srv.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            vm._buf = b""
+            vm.write = conn.sendall
+            vm.boot()
+            if on_ready:
+                on_ready()
+            try:
+                while True:
+                    data = conn.recv(4096)
+                    if not data:
+                        break
+                    vm.feed(data)
+            except OSError:
+                pass
+            with vm._lock:
+                vm.write = None
+            conn.close()
+        srv.close()
+    threading.Thread(target=loop, name="sim-tcp", daemon=True).start()
+    return srv.getsockname()[1]
+
+def _console(vm):
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] in BURST_KINDS:
+            count = _int(parts[1], 1) if len(parts) > 1 else 1
+            rate = float(parts[2]) if len(parts) > 2 else 0.0
+            vm.burst_async(parts[0], count, rate)
+        elif parts[0] == "stats":
+            print(vm.stats)
+        else:
+            vm.emit(line.strip())
+
+def main():
+    ap = argparse.ArgumentParser(description="MASTER giả lập (thay Arduino) để test tải")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--pty", action="store_true", help="mở pseudo-terminal (Linux/macOS)")
+    g.add_argument("--tcp", type=int, metavar="PORT", help="nghe TCP, engine dùng socket://host:PORT")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--travel", type=float, default=0.4, help="giây motor đi qua 1 trạm")
+    ap.add_argument("--beep", type=float, default=0.16, help="giây mỗi tiếng beep (0: không chặn)")
+    ap.add_argument("--move-timeout", type=float, default=12.0)
+    ap.add_argument("--stall-rate", type=float, default=0.0, help="xác suất kẹt motor (ERR:MOVE_TIMEOUT)")
+    ap.add_argument("--drop-arrived", type=float, default=0.0, help="xác suất mất dòng ARRIVED")
+    ap.add_argument("--burst", action="append", default=[], metavar="KIND:COUNT@RATE",
+                    help="dồn sự kiện khi engine kết nối, vd rfid_in:200@100")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    bursts = [parse_burst(s) for s in args.burst]
+    vm = VirtualMaster(travel_sec=args.travel, beep_sec=args.beep, move_timeout_sec=args.move_timeout,
+                       stall_rate=args.stall_rate, drop_arrived_rate=args.drop_arrived, seed=args.seed)
+
+    def on_ready():
+        for kind, count, rate in bursts:
+            vm.burst_async(kind, count, rate)
+
+    if args.pty:
+        print("MASTER giả lập:", serve_pty(vm, on_ready))
+    else:
+        port = serve_tcp(vm, args.host, args.tcp, on_ready)
+        print(f"MASTER giả lập: socket://{args.host}:{port}")
+    sys.stdout.flush()
+
+    try:
+        _console(vm)
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        vm.stop()
+        print(vm.stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1261 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - ENGINE (không GUI): Serial MASTER + Camera + OCR + Đặt chỗ + CSV/SQLite
+
+Toàn bộ nghiệp vụ bãi xe chạy trong ParkingEngine, không phụ thuộc Tkinter:
+  - Mọi thay đổi trạng thái (ô đỗ, đặt chỗ, lịch sử) chạy trên 1 luồng event loop
+    (engine.post(fn)), các luồng worker OCR / chờ motor chỉ gửi việc vào đó.
+  - Client (giao diện Tk trong smart_parking_full.py, web Flask trong parking_web.py)
+    đăng ký engine.add_listener(fn) để nhận sự kiện: fn(event, data).
+
+Sự kiện:
+  toast        {msg, ms}
+  spots        {spots}                        trạng thái ô đỗ (như get_spots_status_for_web)
+  reservations {rows}                         danh sách đặt chỗ mới nhất
+  log_row      {row}                          1 dòng lịch sử xe vừa ghi
+  entry_pre    {plate, frame, crop}           đã đọc biển số xe vào
+  entry        {plate, spot}                  xe đã vào ô
+  exit_pre     {plate, frame, crop, veh}      xe ra khớp biển số
+  exit         {plate, spot, duration_sec, fee, prepaid, paid_from_prepaid, con_thieu}
+  mismatch     {plate, frame, crop, veh}      biển số ra khác xe đăng ký thẻ
+  settings     {kind, changed, settings}       settings đã đổi (kind: fee/camera/com/ocr/storage/web/other)
+  reservation  {id, plate, spot, status}      đặt chỗ đổi trạng thái (reserved / in / done)
+  master       {state, connected, position, [target|error]}
+                                              MASTER connected/moving/station_pass/arrived/setpos/error/disconnected
+
+Các sự kiện trong SSE_EVENTS (bỏ ảnh) được phát lại cho web qua EventHub (/events).
+
+Chạy headless (không Tk):
+  python parking_engine.py [--no-web] [--host 127.0.0.1] [--port 5000] [--web-mode dev|thread|process] [--web-threads 8]
+"""
+
+import os, math, time, threading, queue, argparse
+from datetime import datetime
+
+import cv2
+
+from function.grabber import FrameGrabber, JpegCache
+from function.tracker import GateWatcher
+from function import metrics
+from parking_store import open_store, ReservationIndex, safe_upper_plate, fmt_money, RES_FIELDS, LOG_FIELDS
+from parking_master import MasterLink
+from parking_settings import SettingsStore, ensure_csv_settings, DEFAULT_FEE_PER_HOUR
+
+# Serial
+import serial
+try:
+    import serial.tools.list_ports
+except Exception:
+    serial = None
+
+
+# ==== MOCK YOLO nếu thiếu module cục bộ ====
+class _MockDetections:
+    def __init__(self): self.boxes = [[100,100,300,200]]; self.conf = [0.95]; self.cls = [0]
+    def __len__(self): return 1
+    def best(self): return 0
+class _MockResult:
+    def __init__(self): self.xyxy = [[[100,100,300,200,0.95,0]]]; self.names = {0: "0"}
+class MockYoloModel:
+    def __init__(self): self.conf = 0.6
+    def __call__(self, frame, size=640): return _MockResult()
+
+try:
+    from function import models
+    TORCH_OK = models.available()
+except Exception:
+    TORCH_OK = False
+if TORCH_OK:
+    import function.utils_rotate as utils_rotate
+    import function.helper as helper
+    from function.plate_search import PlateSearch
+    from function.adaptive_detect import AdaptiveDetector
+else:
+    print("Không có module function/ hoặc torch, dùng mock YOLO-OCR để test.")
+    class helper:
+        @staticmethod
+        def detections(results): return [_MockDetections() for _ in results.xyxy]
+        @staticmethod
+        def read_plate(model, img): return "80T-8888"
+    class utils_rotate:
+        @staticmethod
+        def deskew(img, a, b): return img
+    class PlateSearch:
+        def __init__(self, model, accept=0.80): self.accept = accept
+        def search(self, crop, camera="default"): return "80T-8888", 1.0, (0, 0)
+
+# ==== YOLO: nạp lười 1 lần qua function/models (không force_reload), lỗi thì dùng mock ====
+if TORCH_OK:
+    yolo_LP_detect, yolo_license_plate = models.yolo_models(fallback=MockYoloModel)
+else:
+    yolo_LP_detect = MockYoloModel()
+    yolo_license_plate = MockYoloModel()
+
+# OCR trên các biến thể deskew, nhớ biến thể tốt nhất theo từng camera
+plate_search = PlateSearch(yolo_license_plate, accept=0.80)
+
+# ===================== CONFIG / CONSTANTS =====================
+UID_COOLDOWN_MS_IN  = 2500
+UID_COOLDOWN_MS_OUT = 2500
+SERIAL_SAME_LINE_COOLDOWN_MS = 700
+
+# Chờ Arduino đến vị trí
+ARRIVED_TIMEOUT_SEC = 28
+
+# Map spot -> target position (A1..A4 -> 1..4)
+SPOT_TO_TARGET = {'A1':1,'A2':2,'A3':3,'A4':4}
+TARGET_TO_SPOT = {v:k for k,v in SPOT_TO_TARGET.items()}
+SPOT_ORDER = list(SPOT_TO_TARGET.keys())
+
+def now_ms():
+    return int(time.time()*1000)
+
+# ===================== EVENT HUB (SSE) =====================
+# sự kiện engine gửi cho client web (/events); dữ liệu chỉ giữ kiểu JSON được (bỏ ảnh)
+SSE_EVENTS = ("spots", "entry", "exit", "entry_pre", "exit_pre", "mismatch", "reservation", "log_row", "master", "settings")
+
+def _jsonable(v):
+    if isinstance(v, (str, int, float, bool)) or v is None:
+        return v
+    if isinstance(v, dict):
+        return {k: _jsonable(x) for k, x in v.items() if _is_jsonable(x)}
+    if isinstance(v, (list, tuple)):
+        return [_jsonable(x) for x in v if _is_jsonable(x)]
+    return str(v)
+
+def _is_jsonable(v):
+    # ảnh (ndarray) / object khác: bỏ
+    return isinstance(v, (str, int, float, bool, dict, list, tuple, datetime)) or v is None
+
+class EventHub:
+    """
+    Phát sự kiện cho nhiều subscriber; mỗi subscriber 1 hàng đợi tối đa `maxsize`.
+    Client chậm bị bỏ sự kiện cũ nhất (và được báo số sự kiện bị bỏ) chứ không làm chậm engine.
+    Subscriber không lấy sự kiện quá `idle_sec` (client đã ngắt) bị xoá.
+    """
+
+    def __init__(self, maxsize=200, idle_sec=60.0):
+        self.maxsize = maxsize
+        self.idle_sec = idle_sec
+        self._subs = {}     # sid -> [queue, last_poll, dropped]
+        self._seq = 0
+        self._next_sid = 1
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        with self._lock:
+            sid = self._next_sid
+            self._next_sid += 1
+            self._subs[sid] = [queue.Queue(self.maxsize), time.time(), 0]
+            return sid
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            self._subs.pop(sid, None)
+
+    def publish(self, event, data):
+        now = time.time()
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, event, data)
+            for sid, sub in list(self._subs.items()):
+                if now - sub[1] > self.idle_sec:
+                    del self._subs[sid]
+                    continue
+                q = sub[0]
+                while True:
+                    try:
+                        q.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            q.get_nowait()
+                            sub[2] += 1
+                        except queue.Empty:
+                            pass
+
+    def get(self, sid, timeout=15.0):
+        """
+        Chờ tối đa timeout, trả (events, dropped): events = [(seq, event, data)] (rỗng khi hết giờ).
+        None nếu sid không còn.
+        """
+        with self._lock:
+            sub = self._subs.get(sid)
+            if sub is None:
+                return None
+            sub[1] = time.time()
+        q = sub[0]
+        try:
+            out = [q.get(timeout=timeout)]
+        except queue.Empty:
+            out = []
+        while True:
+            try:
+                out.append(q.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            sub[1] = time.time()
+            dropped, sub[2] = sub[2], 0
+        return out, dropped
+
+
+# ===================== ENGINE =====================
+class ParkingEngine:
+    def __init__(self):
+        # dữ liệu bãi (RAM)
+        # mỗi spot: None hoặc dict {plate_text, entry_time, status, rfid_uid, prepaid_balance, reserve_id, reserved_at,
+        #                           vehicle_frame, plate_frame (ảnh BGR hoặc None)}
+        self.parking_spots = {s: None for s in SPOT_TO_TARGET.keys()}
+
+        # settings
+        self.settings_store = SettingsStore()
+        self.settings = self.settings_store.snapshot()
+        self.fee_per_hour = int(self.settings.get("fee_per_hour", DEFAULT_FEE_PER_HOUR))
+        self.settings_store.subscribe(self._on_settings_event)
+
+        # camera sources: mỗi camera 1 luồng đọc, chỉ giữ frame mới nhất
+        self.source_in = self._parse_cam_source(self.settings.get("cam_in","0"))
+        self.source_out = self._parse_cam_source(self.settings.get("cam_out","1"))
+        self.grab_in = None
+        self.grab_out = None
+        # JPEG cho web (/cam/...): mã hoá 1 lần mỗi frame, dùng chung cho mọi người xem
+        self.jpeg = {
+            "in": JpegCache(lambda: self.grab_in.read()),
+            "out": JpegCache(lambda: self.grab_out.read()),
+        }
+        self._apply_stream_settings(self.settings)
+
+        # detector: size cố định 640, hoặc adaptive (settings detect_mode)
+        self.detector = None
+        self._apply_detect_settings(self.settings)
+
+        # chế độ nhận diện liên tục (continuous_ocr=1): theo dõi biển số trước khi quẹt thẻ
+        self.watch_in = None
+        self.watch_out = None
+
+        # serial MASTER
+        self.master_serial_connection = None
+        self.master_link = None
+        self.listener_thread = None
+        self.stop_thread = threading.Event()
+
+        # queues
+        self.rfid_queue_in  = queue.Queue()
+        self.rfid_queue_out = queue.Queue()
+        self.touch_queue_in = queue.Queue()
+        self.touch_queue_out= queue.Queue()
+
+        self.uid_last_time = {'in':{}, 'out':{}}
+        self.last_serial_line = ""
+        self.last_serial_time_ms = 0
+
+        # keep motor position (default pos 1)
+        self.master_position = 1
+
+        # locks
+        self.entry_lock = threading.Lock()
+        self.exit_lock  = threading.Lock()
+        self.entry_busy = False
+        self.exit_busy  = False
+
+        # event loop + listeners
+        self.listeners = []
+        self._calls = queue.Queue()
+        self._stopped = threading.Event()
+        self._loop_thread = None
+        self.hub = EventHub()
+        self.add_listener(self._publish_sse)
+
+        # lưu trữ: CSV hoặc SQLite (settings "storage")
+        self.store = open_store(self.settings, SPOT_ORDER)
+        self.reservations = ReservationIndex(self.store)
+        self.load_spots()
+        self.apply_reservations_to_spots()
+
+        # nạp + warm-up model ở nền để xe đầu tiên không phải chờ (backend theo settings)
+        if TORCH_OK:
+            models.configure(self.settings.get("infer_backend"), self.settings.get("infer_threads"),
+                             self.settings.get("infer_precision"))
+            models.preload()
+
+        self.init_capture_devices()
+        self._init_watchers()
+        self.settings_store.start()
+
+    # ---------- event loop ----------
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def emit(self, event, **data):
+        for fn in list(self.listeners):
+            try:
+                fn(event, data)
+            except Exception as e:
+                print(f"Listener lỗi ({event}):", e)
+
+    def _publish_sse(self, event, data):
+        if event in SSE_EVENTS:
+            self.hub.publish(event, _jsonable(data))
+
+    # ---------- SSE (gọi từ web, kể cả qua IPC) ----------
+    def events_subscribe(self):
+        return self.hub.subscribe()
+
+    def events_get(self, sid, timeout=15.0):
+        return self.hub.get(sid, timeout)
+
+    def events_unsubscribe(self, sid):
+        self.hub.unsubscribe(sid)
+
+    def _apply_stream_settings(self, st):
+        for c in self.jpeg.values():
+            try:
+                c.width = int(st.get("stream_width", 640))
+                c.quality = int(st.get("stream_quality", 80))
+            except ValueError:
+                pass
+
+    def _apply_detect_settings(self, st):
+        if not TORCH_OK or str(st.get("detect_mode", "fixed")).strip() != "adaptive":
+            self.detector = None
+            return
+        try:
+            small = max(32, int(st.get("detect_small", 320)))
+        except ValueError:
+            small = 320
+        # giữ vùng biển số đã học khi chỉ đổi size
+        if self.detector is None:
+            self.detector = AdaptiveDetector(yolo_LP_detect, small=small, full=models.DETECT_SIZE)
+        self.detector.small = small
+
+    def camera_jpeg(self, channel, last=None):
+        """(key, jpeg) frame mới nhất của camera in/out cho web; jpeg None nếu chưa có / không đổi."""
+        return self.jpeg[channel].get(last)
+
+    def metrics_text(self):
+        """Timer/counter của engine dạng Prometheus text cho /metrics."""
+        return metrics.render()
+
+    def get_master_status(self):
+        conn = self.master_serial_connection
+        return {"connected": bool(conn is not None and getattr(conn, "is_open", False)),
+                "position": int(self.master_position)}
+
+    def _master_event(self, state, **extra):
+        self.emit("master", state=state, **dict(self.get_master_status(), **extra))
+
+    def _reservation_event(self, r, status):
+        self.emit("reservation", id=r.get("id",""), plate=safe_upper_plate(r.get("bien_so","")),
+                  spot=r.get("spot",""), status=status)
+
+    def toast(self, msg, ms=2000):
+        self.emit("toast", msg=msg, ms=ms)
+
+    def post(self, fn):
+        """Chạy fn trên luồng event loop của engine (nơi duy nhất sửa trạng thái bãi)."""
+        self._calls.put(fn)
+
+    def start(self):
+        """Chạy event loop trên luồng nền (khi có GUI giữ luồng chính)."""
+        self._loop_thread = threading.Thread(target=self.run_forever, name="parking-engine", daemon=True)
+        self._loop_thread.start()
+        return self
+
+    def run_forever(self):
+        # auto connect COM if settings has com_port
+        if self.settings.get("com_port",""):
+            self.start_master_listener(self.settings.get("com_port",""), 9600)
+
+        while not self._stopped.is_set():
+            self._process_in_events()
+            self._process_out_events()
+            try:
+                fn = self._calls.get(timeout=0.02)
+            except queue.Empty:
+                continue
+            try:
+                fn()
+            except Exception as e:
+                print("Engine lỗi:", e)
+
+    def stop(self):
+        self._stopped.set()
+        self.stop_thread.set()
+        try:
+            if self.master_serial_connection and self.master_serial_connection.is_open:
+                self.master_serial_connection.close()
+        except:
+            pass
+        try:
+            if self.listener_thread:
+                self.listener_thread.join(timeout=1)
+        except:
+            pass
+        self.settings_store.stop()
+        for g in (self.watch_in, self.watch_out, self.grab_in, self.grab_out):
+            if g: g.stop()
+
+    # ---------- settings change (from web / GUI / sửa file) ----------
+    def get_settings(self):
+        return self.settings_store.snapshot()
+
+    def update_settings(self, **changes):
+        """Lưu settings; chỉ phần bị đổi được khởi động lại (xem _apply_settings)."""
+        self.settings_store.update(**changes)
+
+    def _on_settings_event(self, kind, changed, st):
+        # gọi từ luồng web / GUI / theo dõi file -> xử lý trên event loop
+        self.post(lambda: self._apply_settings(kind, changed, st))
+
+    def _apply_settings(self, kind, changed, st):
+        self.settings = st
+        if kind == "fee":
+            self.fee_per_hour = int(st.get("fee_per_hour", DEFAULT_FEE_PER_HOUR))
+        elif kind == "camera":
+            # chỉ mở lại camera có nguồn đổi
+            if "cam_in" in changed:
+                self.source_in = self._parse_cam_source(st.get("cam_in","0"))
+                self._reopen_cam("in")
+            if "cam_out" in changed:
+                self.source_out = self._parse_cam_source(st.get("cam_out","1"))
+                self._reopen_cam("out")
+            # camera khác: học lại vùng biển số
+            if self.detector:
+                for cam in ("in", "out"):
+                    if f"cam_{cam}" in changed:
+                        self.detector.reset(cam)
+        elif kind == "com":
+            com = st.get("com_port","")
+            if com:
+                self.start_master_listener(com, 9600)
+        elif kind == "ocr":
+            self._init_watchers()
+        elif kind == "stream":
+            self._apply_stream_settings(st)
+        elif kind == "detect":
+            self._apply_detect_settings(st)
+        elif kind == "model":
+            # đổi backend suy luận: nạp lại model ở nền, xe đang xử lý vẫn dùng model cũ
+            if TORCH_OK and models.configure(st.get("infer_backend"), st.get("infer_threads"), st.get("infer_precision")):
+                models.preload()
+        elif kind in ("storage", "web"):
+            print(f"Đổi {', '.join(changed)}: khởi động lại chương trình để áp dụng.")
+        self.emit("settings", kind=kind, changed=list(changed), settings=dict(st))
+
+    def _parse_cam_source(self, s):
+        s = str(s).strip()
+        if s.isdigit():
+            return int(s)
+        return s  # file path
+
+    def set_source(self, channel, src):
+        """Đổi nguồn camera vào/ra (camera index, video, ảnh) và lưu settings."""
+        self.update_settings(**{"cam_in" if channel == 'in' else "cam_out": src})
+
+    # ---------- Entry (IN) ----------
+    def capture_in(self):
+        self._process_vehicle_entry(self.grab_in.frame(), rfid_uid="MANUAL_ENTRY")
+
+    def _process_in_events(self):
+        try:
+            uid = self.rfid_queue_in.get_nowait()
+            self._process_vehicle_entry(self.grab_in.frame(), rfid_uid=uid)
+            return
+        except queue.Empty:
+            pass
+        try:
+            _ = self.touch_queue_in.get_nowait()
+            self._process_vehicle_entry(self.grab_in.frame(), rfid_uid="NO_CARD")
+            return
+        except queue.Empty:
+            pass
+
+    def _process_vehicle_entry(self, frame, rfid_uid):
+        if frame is None:
+            self.toast("Không có tín hiệu camera vào.", 2000)
+            return
+
+        with self.entry_lock:
+            if self.entry_busy:
+                return
+            self.entry_busy = True
+
+        def worker():
+            t0 = time.perf_counter()
+            try:
+                # Show LCD step
+                self._send_master("LCD1:XE VAO")
+                self._send_master("LCD1:SCAN PLATE")
+
+                # OCR NOW
+                plate_text, crop_img = self._plate_for_gate(frame, "in")
+                if plate_text == "unknown":
+                    self.toast("Không nhận diện được biển số xe vào.", 2000)
+                    self._send_master("LCD1:OCR FAIL")
+                    return
+
+                # plate normalize
+                plate_text = safe_upper_plate(plate_text)
+
+                # already inside?
+                found_spot, _ = self._find_vehicle_by_plate(plate_text)
+                if found_spot:
+                    self.toast(f"Biển số {plate_text} đã có ở {found_spot}.", 2200)
+                    self._send_master("LCD1:DA CO TRONG BAI")
+                    return
+
+                # Choose spot: reservation match -> its spot; else empty
+                spot_id, prepaid, reserved_at, reserve_id = self._take_reservation_if_match(plate_text)
+                if not spot_id:
+                    spot_id = self._find_empty_spot()
+                    prepaid = 0
+                    reserved_at = ""
+                    reserve_id = ""
+
+                if not spot_id:
+                    self.toast("Bãi đã đầy.", 2000)
+                    self._send_master("LCD1:BAI DAY")
+                    return
+
+                target_num = SPOT_TO_TARGET.get(spot_id, 0)
+                if not target_num:
+                    self.toast("Lỗi mapping ô đỗ.", 2000)
+                    self._send_master("LCD1:MAP ERROR")
+                    return
+
+                # UI: show images + plate immediately
+                self.emit("entry_pre", plate=plate_text, frame=frame, crop=crop_img)
+
+                # Move to spot (skip if already at position)
+                self._send_master(f"LCD1:SPOT {spot_id}")
+                ok = self._move_and_wait_arrived(target_num)
+                if not ok:
+                    self.toast("Quay vị trí thất bại (timeout).", 2200)
+                    self._send_master("LCD1:MOVE TIMEOUT")
+                    return
+
+                # Beep 1 after arrived (as requested)
+                self._send_master("BEEP:1")
+
+                # open gate IN (Arduino beeps 2 and auto close 3s)
+                self._send_master("LCD1:OPEN GATE")
+                self._send_master("OPEN_IN")
+
+                veh = {
+                    'plate_text': plate_text,
+                    'entry_time': datetime.now(),
+                    'plate_frame': crop_img,
+                    'vehicle_frame': frame,
+                    'status': 'occupied',
+                    'rfid_uid': rfid_uid,
+                    'prepaid_balance': int(prepaid) if prepaid else 0,
+                    'reserve_id': reserve_id,
+                    'reserved_at': reserved_at
+                }
+
+                def apply():
+                    self.parking_spots[spot_id] = veh
+                    self.save_spots()
+                    self.emit("spots", spots=self.get_spots_status_for_web())
+                    self.emit("entry", plate=plate_text, spot=spot_id)
+                    self.toast(f"Xe {plate_text} đã vào {spot_id}", 1800)
+                    # refresh reservation list
+                    self.emit("reservations", rows=self.reservation_rows())
+                self.post(apply)
+
+            finally:
+                metrics.observe("entry_flow", time.perf_counter() - t0)
+                self.post(lambda: setattr(self, 'entry_busy', False))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    # ---------- Exit (OUT) ----------
+    def capture_out(self):
+        self._process_vehicle_exit_manual()
+
+    def _process_out_events(self):
+        try:
+            uid = self.rfid_queue_out.get_nowait()
+            self._process_vehicle_exit_by_rfid(uid)
+            return
+        except queue.Empty:
+            pass
+        try:
+            _ = self.touch_queue_out.get_nowait()
+            self._process_vehicle_exit_manual()
+            return
+        except queue.Empty:
+            pass
+
+    def _process_vehicle_exit_manual(self):
+        frame = self.grab_out.frame()
+        if frame is None:
+            self.toast("Không có tín hiệu camera ra.", 2000)
+            return
+
+        with self.exit_lock:
+            if self.exit_busy:
+                return
+            self.exit_busy = True
+
+        def worker():
+            t0 = time.perf_counter()
+            try:
+                self._send_master("LCD2:XE RA")
+                self._send_master("LCD2:SCAN PLATE")
+
+                plate_out, crop_out = self._plate_for_gate(frame, "out")
+                if plate_out == "unknown":
+                    self.toast("Không nhận diện được biển số xe ra.", 2000)
+                    self._send_master("LCD2:OCR FAIL")
+                    return
+                plate_out = safe_upper_plate(plate_out)
+
+                spot_id, veh_in = self._find_vehicle_by_plate(plate_out)
+                if not spot_id:
+                    self.toast(f"Không tìm thấy xe {plate_out} trong bãi.", 2200)
+                    self._send_master("LCD2:NOT FOUND")
+                    return
+
+                self._finalize_exit_flow(spot_id, veh_in, frame, crop_out, rfid_uid=None)
+            finally:
+                metrics.observe("exit_flow", time.perf_counter() - t0)
+                self.post(lambda: setattr(self, 'exit_busy', False))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _process_vehicle_exit_by_rfid(self, rfid_uid):
+        frame = self.grab_out.frame()
+        if frame is None:
+            self.toast("Không có tín hiệu camera ra.", 2000)
+            return
+
+        with self.exit_lock:
+            if self.exit_busy:
+                return
+            self.exit_busy = True
+
+        def worker():
+            t0 = time.perf_counter()
+            try:
+                self._send_master("LCD2:XE RA")
+                self._send_master("LCD2:SCAN PLATE")
+
+                spot_id, veh_in = self._find_vehicle_by_rfid(rfid_uid)
+                if not spot_id:
+                    self.toast(f"Không có xe dùng thẻ {rfid_uid}", 2200)
+                    self._send_master("LCD2:UID NOT FOUND")
+                    return
+
+                plate_out, crop_out = self._plate_for_gate(frame, "out")
+                if plate_out == "unknown":
+                    self.toast("Không nhận diện được biển số xe ra.", 2000)
+                    self._send_master("LCD2:OCR FAIL")
+                    return
+
+                plate_out = safe_upper_plate(plate_out)
+                if plate_out != safe_upper_plate(veh_in['plate_text']):
+                    self.emit("mismatch", plate=plate_out, frame=frame, crop=crop_out, veh=veh_in)
+                    self.toast("Sai biển số so với xe đã đăng ký!", 2200)
+                    self._send_master("LCD2:PLATE MISMATCH")
+                    return
+
+                self._finalize_exit_flow(spot_id, veh_in, frame, crop_out, rfid_uid=rfid_uid)
+            finally:
+                metrics.observe("exit_flow", time.perf_counter() - t0)
+                self.post(lambda: setattr(self, 'exit_busy', False))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _finalize_exit_flow(self, spot_id, veh_in, frame_out, crop_img_out, rfid_uid):
+        """Chạy trên luồng worker xe ra; cập nhật trạng thái bãi qua post()."""
+        plate = safe_upper_plate(veh_in['plate_text'])
+
+        # UI: show images
+        self.emit("exit_pre", plate=plate, frame=frame_out, crop=crop_img_out, veh=veh_in)
+
+        target_num = SPOT_TO_TARGET.get(spot_id, 0)
+        if not target_num:
+            self.toast("Lỗi mapping ô đỗ.", 2000)
+            return
+
+        # LCD OUT UI on Arduino
+        self._send_master(f"OUT,{plate}")
+
+        self._send_master(f"LCD2:SPOT {spot_id}")
+        ok = self._move_and_wait_arrived(target_num)
+        if not ok:
+            self.toast("Quay vị trí xe ra thất bại (timeout).", 2200)
+            self._send_master("LCD2:MOVE TIMEOUT")
+            return
+
+        # Beep 1 after arrived
+        self._send_master("BEEP:1")
+
+        # open servo OUT
+        self._send_master("LCD2:OPEN GATE")
+        self._send_master("OPEN_OUT")
+
+        exit_time = datetime.now()
+
+        # Fee rule:
+        # - If has reservation -> start time from reserved_at (created_at)
+        # - Else -> start time from entry_time
+        start_time = veh_in.get('entry_time', datetime.now())
+        reserved_at_str = (veh_in.get("reserved_at") or "").strip()
+        if reserved_at_str:
+            try:
+                start_time = datetime.strptime(reserved_at_str, "%Y-%m-%d %H:%M:%S")
+            except:
+                pass
+
+        duration = exit_time - start_time
+        raw_fee = (duration.total_seconds()/3600) * self.fee_per_hour
+        final_fee = int(math.ceil(raw_fee/1000)*1000) if raw_fee > 0 else 0
+
+        prepaid = int(veh_in.get("prepaid_balance", 0) or 0)
+        paid_from_prepaid = min(prepaid, final_fee)
+        thieu = max(0, final_fee - prepaid)
+
+        def commit():
+            # lịch sử xe
+            self._log_exit({
+                'ma_the': veh_in.get('rfid_uid','N/A'),
+                'bien_so': plate,
+                'thoi_gian_vao': (veh_in.get('entry_time', datetime.now())).strftime("%Y-%m-%d %H:%M:%S"),
+                'thoi_gian_ra' : exit_time.strftime("%Y-%m-%d %H:%M:%S"),
+                'phi': f"{fmt_money(final_fee)} VNĐ",
+                'paid_from_prepaid': f"{fmt_money(paid_from_prepaid)} VNĐ",
+                'con_thieu': f"{fmt_money(thieu)} VNĐ"
+            })
+
+            # update reservation if used
+            reserve_id = (veh_in.get("reserve_id") or "").strip()
+            if reserve_id:
+                self._mark_reservation_done(reserve_id, exit_time, final_fee, paid_from_prepaid, thieu)
+
+            # clear spot
+            self.parking_spots[spot_id] = None
+            self.save_spots()
+            self.emit("spots", spots=self.get_spots_status_for_web())
+            self.emit("reservations", rows=self.reservation_rows())
+            self.emit("exit", plate=plate, spot=spot_id, duration_sec=int(max(0, duration.total_seconds())),
+                      fee=final_fee, prepaid=prepaid, paid_from_prepaid=paid_from_prepaid, con_thieu=thieu)
+
+            if prepaid > 0:
+                self.toast(f"Xe {plate} rời {spot_id}. Trừ từ nạp: {fmt_money(paid_from_prepaid)}đ, thiếu: {fmt_money(thieu)}đ", 2600)
+            else:
+                self.toast(f"Xe {plate} rời {spot_id}. Phí: {fmt_money(final_fee)}đ", 2200)
+        self.post(commit)
+
+    # ---------- MOVE + WAIT ARRIVED ----------
+    def _move_and_wait_arrived(self, target_num):
+        # skip if already there (Python tracks master_position)
+        if int(target_num) == int(self.master_position):
+            return True
+
+        link = self.master_link
+        if link is None:
+            return False
+        arrived = link.goto(int(target_num))
+        self._master_event("moving", target=int(target_num))
+        try:
+            with metrics.timer("motor_wait"):
+                self.master_position = int(arrived.result(timeout=ARRIVED_TIMEOUT_SEC))
+            return True
+        except Exception as e:
+            link.cancel(arrived)
+            print("Di chuyển lỗi:", str(e) or "quá giờ chờ ARRIVED")
+            return False
+
+    # ---------- OCR (NO TIMEOUT) ----------
+    def _detect_plates(self, frame, camera="in", thorough=True):
+        """thorough=False (theo dõi liên tục): frame trống không cần chạy lại ở size lớn."""
+        with metrics.timer("detect"):
+            detector = self.detector
+            if detector is not None:
+                return detector.detect(frame, camera, thorough)
+            return helper.detections(yolo_LP_detect(frame, size=640))[0]
+
+    def _init_watchers(self):
+        for w in (self.watch_in, self.watch_out):
+            if w: w.stop()
+        self.watch_in = self.watch_out = None
+        if str(self.settings.get("continuous_ocr","0")).strip() != "1":
+            return
+        self.watch_in = GateWatcher(lambda: self.grab_in.read(), lambda f: self._detect_plates(f, "in", False),
+                                    plate_search, "in").start()
+        self.watch_out = GateWatcher(lambda: self.grab_out.read(), lambda f: self._detect_plates(f, "out", False),
+                                     plate_search, "out").start()
+
+    def _plate_for_gate(self, frame, camera):
+        """
+        Biển số cho cổng vào/ra: dùng kết quả đã bình chọn của track (chế độ liên tục)
+        nếu có, nếu không thì OCR ngay trên frame.
+        """
+        w = self.watch_in if camera == "in" else self.watch_out
+        hit = w.plate() if w else None
+        if hit:
+            plate, crop = hit
+            return safe_upper_plate(plate), crop
+        return self._ocr_plate_now(frame, camera)
+
+    def _ocr_plate_now(self, frame, camera="in"):
+        """
+        OCR ngay thời điểm hiện tại (không timeout chờ).
+        - Detect plate once
+        - OCR the deskew combos, best-scoring first, stop early when confident
+        """
+        plate = "unknown"
+        crop = None
+        try:
+            det = self._detect_plates(frame, camera)
+        except Exception as e:
+            print("Detect lỗi:", e)
+            return "unknown", None
+
+        # Choose best by confidence
+        i = det.best()
+        if i < 0:
+            metrics.inc("plates", gate=camera, result="no_plate")
+            return "unknown", None
+
+        with metrics.timer("crop"):
+            x,y,x2,y2 = map(int, det.boxes[i])
+            x=max(0,x); y=max(0,y); x2=max(x+1,x2); y2=max(y+1,y2)
+            crop = frame[y:y2, x:x2]
+
+        # OCR deskew combos: chọn kết quả điểm cao nhất (độ tin cậy + đúng định dạng biển)
+        try:
+            lp, _, _ = plate_search.search(crop, camera)
+            if lp and str(lp).strip().lower() != "unknown":
+                metrics.inc("plates", gate=camera, result="read")
+                return safe_upper_plate(str(lp)), crop
+        except Exception as e:
+            print("OCR lỗi:", e)
+
+        metrics.inc("plates", gate=camera, result="unknown")
+        return plate, crop
+
+    # ---------- Serial MASTER ----------
+    def start_master_listener(self, com_port, baud=9600):
+        com_port = (com_port or "").strip()
+        if not com_port or "Không tìm thấy" in com_port:
+            self.toast("Chọn cổng COM hợp lệ.", 2000)
+            return
+
+        # stop old
+        if self.listener_thread and self.listener_thread.is_alive():
+            self.stop_thread.set()
+            try:
+                self.listener_thread.join(timeout=1)
+            except Exception:
+                pass
+            try:
+                if self.master_serial_connection and self.master_serial_connection.is_open:
+                    self.master_serial_connection.close()
+            except Exception:
+                pass
+
+        self.stop_thread.clear()
+        self.listener_thread = threading.Thread(target=self._read_master_serial, args=(com_port, baud), daemon=True)
+        self.listener_thread.start()
+        self.toast(f"Đang kết nối MASTER {com_port}...", 1500)
+
+    def _read_master_serial(self, com_port, baud):
+        print(f"Kết nối MASTER: {com_port}")
+        try:
+            # serial_for_url: COMx, /dev/tty... hoặc socket://host:port (master_sim.py)
+            conn = serial.serial_for_url(com_port, baud, timeout=1)
+            self.master_serial_connection = conn
+        except Exception as e:
+            print("Mở COM lỗi:", e)
+            self.toast("Mở COM lỗi.", 2200)
+            return
+
+        self.toast(f"Đã kết nối {com_port}", 1500)
+        self.master_link = MasterLink(conn, on_event=self._on_master_line)
+        self._master_event("connected")
+
+        try:
+            self.master_link.run(self.stop_thread)
+        except Exception as e:
+            print("Lỗi luồng MASTER:", e)
+        self.master_link = None
+
+        try:
+            if self.master_serial_connection and self.master_serial_connection.is_open:
+                self.master_serial_connection.close()
+        except Exception:
+            pass
+        print("Luồng MASTER đã dừng.")
+        self._master_event("disconnected")
+
+    def _on_master_line(self, kind, value, line):
+        # print("[MASTER]", line)
+        if kind in ("RFID_IN", "RFID_OUT", "TOUCH_IN", "TOUCH_OUT"):
+            # chặn spam lặp dòng (chỉ dòng quẹt thẻ / chạm; dòng OK: lặp lại là hợp lệ)
+            if line == self.last_serial_line and (now_ms()-self.last_serial_time_ms) < SERIAL_SAME_LINE_COOLDOWN_MS:
+                return
+            self.last_serial_line = line; self.last_serial_time_ms = now_ms()
+
+        if kind == "RFID_IN":
+            if self._uid_ok('in', value):
+                self.rfid_queue_in.put(value)
+        elif kind == "RFID_OUT":
+            if self._uid_ok('out', value):
+                self.rfid_queue_out.put(value)
+        elif kind == "TOUCH_IN":
+            self.touch_queue_in.put(True)
+        elif kind == "TOUCH_OUT":
+            self.touch_queue_out.put(True)
+        elif kind == "ARRIVED" and value is not None:
+            self.master_position = value
+            self._master_event("arrived")
+        elif kind == "STATION_PASS" and value is not None:
+            self.master_position = value
+            self._master_event("station_pass")
+        elif kind == "OK" and value.startswith("SETPOS:") and value[7:].strip().isdigit():
+            self.master_position = int(value[7:])
+            self._master_event("setpos")
+        elif kind == "ERR":
+            print("[MASTER]", line)
+            self._master_event("error", error=value)
+
+    def _uid_ok(self, direction, uid):
+        uid = (uid or "").strip().upper()
+        if not uid:
+            return False
+        t = self.uid_last_time[direction].get(uid, 0)
+        cd = UID_COOLDOWN_MS_IN if direction=='in' else UID_COOLDOWN_MS_OUT
+        if now_ms()-t < cd:
+            return False
+        self.uid_last_time[direction][uid] = now_ms()
+        return True
+
+    def _send_master(self, text):
+        """Gửi lệnh tới MASTER, trả Reply (xác nhận OK:/ERR:) hoặc None khi chưa kết nối."""
+        text = (text or "").strip()
+        link = self.master_link
+        if not text or link is None:
+            # print("[PC→MASTER] Chưa kết nối.")
+            return None
+        try:
+            # print("[PC→MASTER]", text)
+            return link.send(text)
+        except Exception as e:
+            print("Gửi lệnh lỗi:", e)
+            return None
+
+    # ---------- Camera (FIX: support camera index / video file / image file) ----------
+    def init_capture_devices(self):
+        # stop old grabbers (each releases its own device)
+        for g in (self.grab_in, self.grab_out):
+            if g: g.stop()
+
+        self.grab_in = FrameGrabber(self.source_in, "in").start()
+        self.grab_out = FrameGrabber(self.source_out, "out").start()
+
+    def _reopen_cams(self):
+        self.init_capture_devices()
+
+    def _reopen_cam(self, channel):
+        # GateWatcher đọc self.grab_in/out mỗi lần nên không cần tạo lại
+        if channel == "in":
+            if self.grab_in: self.grab_in.stop()
+            self.grab_in = FrameGrabber(self.source_in, "in").start()
+        else:
+            if self.grab_out: self.grab_out.stop()
+            self.grab_out = FrameGrabber(self.source_out, "out").start()
+
+    # ---------- Web helpers ----------
+    def get_spots_status_for_web(self):
+        """
+        return list of dicts: {spot,status,plate}
+        status: empty/reserved/occupied
+        """
+        spots = []
+        for sid in SPOT_ORDER:
+            v = self.parking_spots.get(sid)
+            if v is None:
+                spots.append({"spot": sid, "status": "empty", "plate": ""})
+            else:
+                st = v.get("status","occupied")
+                if st not in ("reserved","occupied"):
+                    st = "occupied"
+                spots.append({"spot": sid, "status": st, "plate": v.get("plate_text","")})
+        return spots
+
+    def read_reservations(self, limit=300, cursor=None):
+        """Đặt chỗ mới nhất trước (dict), trả (rows, next_cursor) cho web."""
+        return self.reservations.page(limit, cursor)
+
+    def read_vehicle_logs(self, limit=400, cursor=None):
+        """Lịch sử xe mới nhất trước (dict), trả (rows, next_cursor) cho web."""
+        return self.store.log_page(limit, cursor)
+
+    def add_reservation(self, ten, sdt, plate, spot, gio_du_kien, so_tien_nap):
+        plate = safe_upper_plate(plate)
+
+        # validate spot exists
+        if spot not in self.parking_spots:
+            return False, "Ô đỗ không hợp lệ."
+
+        # must be empty (not reserved, not occupied)
+        if self.parking_spots.get(spot) is not None:
+            return False, "Ô đỗ không còn trống."
+
+        # check no active reservation on same spot
+        if self.reservations.active_for_spot(spot):
+            return False, "Ô đỗ đã được đặt trước."
+
+        rid = str(int(time.time()*1000))
+        created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        status = "reserved"
+
+        row = {k:"" for k in RES_FIELDS}
+        row.update({
+            "id": rid, "ten": ten, "sdt": sdt, "bien_so": plate,
+            "spot": spot, "gio_du_kien": str(gio_du_kien),
+            "so_tien_nap": str(so_tien_nap),
+            "created_at": created, "status": status,
+            "arrival_time": "", "exit_time": "",
+            "fee_total": "", "paid_from_prepaid": "", "con_thieu": ""
+        })
+        self.reservations.add(row)
+        self._reservation_event(row, "reserved")
+
+        # apply reserved into RAM for UI & web
+        self.post(self.apply_reservations_to_spots)
+        return True, "OK"
+
+    # ---------- Reservation internals ----------
+    def apply_reservations_to_spots(self):
+        """
+        Represent reservation in RAM as status='reserved' (orange) only if spot is empty.
+        """
+        rows = self.reservations.with_status("reserved")
+
+        # clear old reserved markers in RAM
+        for sid, v in list(self.parking_spots.items()):
+            if v and v.get("status") == "reserved":
+                self.parking_spots[sid] = None
+
+        # apply latest reserved rows
+        for r in rows:
+            spot = r.get("spot","").strip()
+            plate = safe_upper_plate(r.get("bien_so",""))
+            if spot in self.parking_spots and self.parking_spots[spot] is None:
+                self.parking_spots[spot] = {
+                    "plate_text": plate,
+                    "status": "reserved",
+                    "vehicle_frame": None,
+                    "plate_frame": None,
+                    "rfid_uid": "RESERVED",
+                    "entry_time": datetime.now(),
+                    "prepaid_balance": int(r.get("so_tien_nap","0") or 0),
+                    "reserve_id": r.get("id",""),
+                    "reserved_at": r.get("created_at","")
+                }
+
+        self.save_spots()
+        self.emit("spots", spots=self.get_spots_status_for_web())
+        self.emit("reservations", rows=self.reservation_rows())
+
+    def _take_reservation_if_match(self, plate_text):
+        """
+        If reservation matches plate and is active (reserved):
+          - mark status to 'in'
+          - return its spot, prepaid, created_at, reserve_id
+        """
+        hit = self.reservations.find_reserved_by_plate(plate_text)
+        if not hit:
+            return None, 0, "", ""
+
+        spot = hit.get("spot","").strip()
+        if spot not in self.parking_spots:
+            return None, 0, "", ""
+
+        # If that spot is currently occupied by a car, fallback to normal empty spot (keep reservation)
+        if self.parking_spots.get(spot) is not None and self.parking_spots[spot].get("status") == "occupied":
+            return None, 0, "", ""
+
+        # mark IN + arrival_time
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.reservations.update(hit.get("id"), status="in", arrival_time=now_str)
+        self._reservation_event(hit, "in")
+
+        # update RAM display
+        self.post(self.apply_reservations_to_spots)
+
+        prepaid = int(hit.get("so_tien_nap","0") or 0)
+        reserved_at = hit.get("created_at","")
+        reserve_id = hit.get("id","")
+        return spot, prepaid, reserved_at, reserve_id
+
+    def _mark_reservation_done(self, reserve_id, exit_time, fee_total, paid_from_prepaid, con_thieu):
+        self.reservations.update(reserve_id, status="done",
+                                 exit_time=exit_time.strftime("%Y-%m-%d %H:%M:%S"),
+                                 fee_total=f"{fmt_money(fee_total)}",
+                                 paid_from_prepaid=f"{fmt_money(paid_from_prepaid)}",
+                                 con_thieu=f"{fmt_money(con_thieu)}")
+        r = self.reservations.get(reserve_id)
+        if r:
+            self._reservation_event(r, "done")
+
+    # ---------- spots persistence ----------
+    def save_spots(self):
+        rows = []
+        for sid in SPOT_ORDER:
+            v = self.parking_spots.get(sid)
+            if v is None:
+                rows.append({"spot": sid, "status": "empty", "prepaid_balance": "0"})
+            else:
+                et = ""
+                if isinstance(v.get("entry_time"), datetime):
+                    et = v["entry_time"].strftime("%Y-%m-%d %H:%M:%S")
+                rows.append({
+                    "spot": sid, "status": v.get("status","occupied"), "plate": v.get("plate_text",""),
+                    "rfid_uid": v.get("rfid_uid",""), "entry_time": et,
+                    "prepaid_balance": str(int(v.get("prepaid_balance",0) or 0)),
+                    "reserve_id": v.get("reserve_id",""), "reserved_at": v.get("reserved_at","")
+                })
+        try:
+            with metrics.timer("persist"):
+                self.store.save_spots(rows)
+        except Exception as e:
+            print("Lưu trạng thái ô đỗ lỗi:", e)
+
+    def load_spots(self):
+        try:
+            rows = self.store.load_spots()
+        except Exception as e:
+            print("Load trạng thái ô đỗ lỗi:", e)
+            return
+        for sid in self.parking_spots:
+            self.parking_spots[sid] = None
+        for r in rows:
+            sid = r.get("spot","")
+            st  = r.get("status","empty") or "empty"
+            if sid not in self.parking_spots or st == "empty":
+                continue
+            plate = safe_upper_plate(r.get("plate",""))
+            uid = r.get("rfid_uid","")
+            et_str = r.get("entry_time","")
+            try: et = datetime.strptime(et_str, "%Y-%m-%d %H:%M:%S") if et_str else datetime.now()
+            except: et = datetime.now()
+            prepaid = int(r.get("prepaid_balance","0") or 0)
+            self.parking_spots[sid] = {
+                "plate_text": plate,
+                "status": st,
+                "vehicle_frame": None,
+                "plate_frame": None,
+                "rfid_uid": uid,
+                "entry_time": et,
+                "prepaid_balance": prepaid,
+                "reserve_id": r.get("reserve_id",""),
+                "reserved_at": r.get("reserved_at","")
+            }
+
+    # ---------- Reserved list & log list ----------
+    def reservation_rows(self, limit=400):
+        """Đặt chỗ mới nhất trước (cho danh sách trên GUI)."""
+        return self.reservations.recent(limit)
+
+    def log_rows(self, limit=600):
+        """Lịch sử xe mới nhất trước."""
+        try:
+            return self.store.recent_logs(limit)
+        except Exception as e:
+            print("Đọc lịch sử xe lỗi:", e)
+            return []
+
+    def _log_exit(self, row):
+        try:
+            row = {k:row.get(k,"") for k in LOG_FIELDS}
+            with metrics.timer("persist"):
+                self.store.append_log(row)
+            self.emit("log_row", row=row)
+        except Exception as e:
+            print("Ghi lịch sử xe lỗi:", e)
+
+    # ---------- Spot finders ----------
+    def _find_empty_spot(self):
+        for sid in SPOT_ORDER:
+            v = self.parking_spots.get(sid)
+            if v is None:
+                return sid
+        return None
+
+    def _find_vehicle_by_plate(self, plate):
+        plate = safe_upper_plate(plate)
+        for sid, v in self.parking_spots.items():
+            if v and v.get("status") == "occupied" and safe_upper_plate(v.get('plate_text','')) == plate:
+                return sid, v
+        return None, None
+
+    def _find_vehicle_by_rfid(self, uid):
+        uid = (uid or "").upper().strip()
+        for sid, v in self.parking_spots.items():
+            if v and v.get("status") == "occupied" and (str(v.get('rfid_uid','')).upper().strip() == uid):
+                return sid, v
+        return None, None
+
+    # ---------- find cams/com ----------
+    def find_cams(self):
+        res = []
+        for i in range(10):
+            backend = cv2.CAP_DSHOW if os.name == "nt" else cv2.CAP_ANY
+            cap = cv2.VideoCapture(i, backend)
+            if cap is not None and cap.isOpened():
+                res.append(f"Camera {i}")
+                cap.release()
+        return res if res else ["Không tìm thấy camera"]
+
+    def find_coms(self):
+        try:
+            ports = serial.tools.list_ports.comports()
+            return [p.device for p in ports] if ports else ["Không tìm thấy cổng COM"]
+        except:
+            return ["pyserial chưa được cài đặt"]
+
+
+# ===================== RUN (headless) =====================
+def main():
+    ap = argparse.ArgumentParser(description="Smart parking engine (không GUI)")
+    ap.add_argument("--no-web", action="store_true", help="không chạy web đặt chỗ")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5000)
+    ap.add_argument("--web-mode", choices=["dev", "thread", "process"], default=None,
+                    help="cách chạy web (mặc định theo settings web_mode)")
+    ap.add_argument("--web-threads", type=int, default=None, help="số luồng WSGI (mặc định theo settings web_threads)")
+    ap.add_argument("--profile", nargs="?", type=float, const=0.0, default=None, metavar="SEC",
+                    help="in bảng độ trễ từng công đoạn khi thoát (và mỗi SEC giây nếu có)")
+    ap.add_argument("--com", default=None, help="cổng MASTER cho lần chạy này (vd COM3, socket://127.0.0.1:7000)")
+    args = ap.parse_args()
+    if args.profile is not None:
+        metrics.enable_profile(args.profile)
+
+    ensure_csv_settings()
+
+    engine = ParkingEngine()
+    if args.com:
+        engine.settings["com_port"] = args.com
+    # headless: thông báo ra console
+    engine.add_listener(lambda ev, d: print(d["msg"]) if ev == "toast" else None)
+
+    if not args.no_web:
+        from parking_web import start_web_server
+        st = engine.get_settings()
+        start_web_server(engine, args.host, args.port,
+                         mode=args.web_mode or st.get("web_mode","thread"),
+                         threads=args.web_threads or st.get("web_threads", 8))
+
+    try:
+        engine.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop()
+
+if __name__ == "__main__":
+    main()
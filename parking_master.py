@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - MASTER LINK: giao thức dòng lệnh với Arduino MASTER (Arduino/Master/Master.ino).
+
+PC -> MASTER (mỗi lệnh 1 dòng) và dòng xác nhận tương ứng:
+  PING -> PONG              STATUS -> STATUS:pos=..,target=..,...     SW? -> LIMIT=0|1
+  LCD1:<txt> -> OK:LCD1     LCD2:<txt> -> OK:LCD2                    BEEP:<n> -> OK:BEEP
+  SETPOS:<n> -> OK:SETPOS:n GO:<n> | 1..4 -> OK:GO:n / OK:PENDING:n / OK:ALREADY_THERE
+  OPEN_IN -> OK:OPEN_IN     OPEN_OUT -> OK:OPEN_OUT                  OUT,<plate> -> OK:OUT_UI
+  M:STOP / M:FWD:x / M:REV:x (không xác nhận)      lệnh lạ -> ERR:UNKNOWN_CMD:<lệnh>
+
+MASTER -> PC tự phát (sự kiện):
+  RFID_IN:<uid>  RFID_OUT:<uid>  TOUCH_IN  TOUCH_OUT  STATION_PASS:n  ARRIVED:n
+  MOTOR:STOP|FWD:x|REV:x  ERR:MOVE_TIMEOUT  STATUS:...  MASTER_FULL_READY
+
+MASTER xử lý lệnh tuần tự nên xác nhận về theo đúng thứ tự gửi: lệnh chờ xác nhận
+nằm trong hàng FIFO, dòng đầu tiên khớp tiền tố của lệnh đầu hàng sẽ hoàn tất Future của lệnh đó.
+Future dùng được cả kiểu luồng (fut.result(timeout)) lẫn asyncio (await link.goto(3)).
+
+Gửi: send() chỉ xếp lệnh vào hàng đợi, 1 luồng ghi duy nhất gửi theo thứ tự và chờ xác nhận
+của lệnh trước rồi mới gửi lệnh sau (không sleep cố định). LCD1:/LCD2: chưa gửi mà bị lệnh
+cùng dòng LCD ghi đè (không có lệnh khác xen giữa) thì chỉ gửi nội dung mới nhất.
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from function import metrics
+
+class MasterError(Exception):
+    """MASTER trả ERR:... (lệnh lạ, motor quá giờ) hoặc không xác nhận kịp."""
+
+class Reply(Future):
+    """Future chờ dòng trả lời của MASTER; await được trong asyncio."""
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+# lệnh -> (tiền tố dòng xác nhận, thời gian chờ xác nhận giây); None: lệnh không có xác nhận
+def expected_ack(cmd):
+    if cmd == "PING":
+        return ("PONG",), 1.0
+    if cmd == "STATUS":
+        return ("STATUS:",), 1.0
+    if cmd == "SW?":
+        return ("LIMIT=",), 1.0
+    if cmd.startswith("LCD1:"):
+        return ("OK:LCD1",), 1.0
+    if cmd.startswith("LCD2:"):
+        return ("OK:LCD2",), 1.0
+    if cmd.startswith("BEEP:"):
+        return ("OK:BEEP",), 3.0          # playBeep chặn trong lúc kêu
+    if cmd.startswith("SETPOS:"):
+        return ("OK:SETPOS:",), 1.0
+    if cmd.startswith("GO:") or cmd in ("1", "2", "3", "4"):
+        return ("OK:GO:", "OK:PENDING:", "OK:ALREADY_THERE"), 1.5
+    if cmd in ("OPEN_IN", "OPEN_OUT"):
+        return ("OK:" + cmd,), 3.0
+    if cmd.startswith("OUT,"):
+        return ("OK:OUT_UI",), 1.0
+    return None
+
+def _int(s):
+    try:
+        return int(str(s).strip())
+    except ValueError:
+        return None
+
+def parse_line(line):
+    """Dòng MASTER -> (loại, giá trị). STATUS trả dict các trường key=value."""
+    if line.startswith("RFID_IN:"):
+        return "RFID_IN", line[8:].strip().upper()
+    if line.startswith("RFID_OUT:"):
+        return "RFID_OUT", line[9:].strip().upper()
+    if "TOUCH_IN" in line:
+        return "TOUCH_IN", None
+    if "TOUCH_OUT" in line:
+        return "TOUCH_OUT", None
+    if line.startswith("ARRIVED:"):
+        return "ARRIVED", _int(line[8:])
+    if line.startswith("STATION_PASS:"):
+        return "STATION_PASS", _int(line[13:])
+    if line.startswith("MOTOR:"):
+        return "MOTOR", line[6:]
+    if line.startswith("STATUS:"):
+        d = {}
+        for part in line[7:].split(","):
+            if "=" in part:
+                k, v = part.split("=", 1)
+                d[k.strip()] = v.strip()
+        return "STATUS", d
+    if line.startswith("OK:"):
+        return "OK", line[3:]
+    if line.startswith("ERR:"):
+        return "ERR", line[4:]
+    if line == "PONG":
+        return "PONG", None
+    if line.startswith("LIMIT="):
+        return "LIMIT", _int(line[6:])
+    if line == "MASTER_FULL_READY":
+        return "READY", None
+    return "OTHER", line
+
+# nhãn metrics: phần lệnh trước ":" / "," (LCD1, GO, OUT...), số trạm 1..4 -> GO
+def _cmd_name(cmd):
+    if cmd in ("1", "2", "3", "4"):
+        return "GO"
+    return cmd.split(":", 1)[0].split(",", 1)[0]
+
+def _copy_result(src, dst):
+    if dst.done():
+        return
+    if src.exception() is not None:
+        dst.set_exception(src.exception())
+    else:
+        dst.set_result(src.result())
+
+class MasterLink:
+    """
+    1 kết nối serial tới MASTER: luồng đọc (run) tách dòng, hoàn tất Future của lệnh chờ xác nhận
+    và gọi on_event(kind, value, line) cho mọi dòng (kể cả dòng xác nhận).
+    """
+
+    def __init__(self, conn, on_event=None):
+        self.conn = conn
+        self.on_event = on_event
+        self.position = None
+        self._pending = deque()         # [cmd, prefixes, Reply, deadline]
+        self._goto = {}                 # target -> [Reply] chờ ARRIVED:target
+        self._lock = threading.RLock()  # callback của Future có thể gọi lại link
+        self._outbox = deque()          # [cmd, [Reply]] chưa gửi
+        self._out_cv = threading.Condition()
+        self._closed = False
+        self.coalesced = 0
+
+    # ---------- gửi ----------
+    def send(self, cmd):
+        """Xếp 1 lệnh vào hàng gửi, trả Reply hoàn tất bằng dòng xác nhận (None nếu lệnh không có xác nhận)."""
+        cmd = (cmd or "").strip()
+        fut = Reply()
+        if not cmd:
+            fut.set_result(None)
+            return fut
+        with self._out_cv:
+            if self._closed:
+                fut.set_exception(MasterError("Mất kết nối MASTER"))
+                return fut
+            if not self._coalesce(cmd, fut):
+                self._outbox.append([cmd, [fut]])
+            self._out_cv.notify()
+        return fut
+
+    def _coalesce(self, cmd, fut):
+        # LCDx: chưa gửi, chỉ cách lệnh mới bởi các lệnh LCD khác -> thay nội dung
+        if not cmd.startswith(("LCD1:", "LCD2:")):
+            return False
+        for item in reversed(self._outbox):
+            if not item[0].startswith(("LCD1:", "LCD2:")):
+                return False
+            if item[0][:5] == cmd[:5]:
+                item[0] = cmd
+                item[1].append(fut)
+                self.coalesced += 1
+                metrics.inc("serial_coalesced")
+                return True
+        return False
+
+    def _writer(self):
+        while True:
+            with self._out_cv:
+                while not self._outbox and not self._closed:
+                    self._out_cv.wait()
+                if self._closed:
+                    return
+                cmd, futs = self._outbox.popleft()
+            ack = expected_ack(cmd)
+            metrics.inc("serial_commands", cmd=_cmd_name(cmd))
+            reply = Reply()
+            for f in futs:
+                reply.add_done_callback(lambda r, f=f: _copy_result(r, f))
+            t0 = time.perf_counter()
+            try:
+                with self._lock:
+                    if ack is not None:
+                        self._pending.append([cmd, ack[0], reply, time.time() + ack[1]])
+                    self.conn.write((cmd + "\n").encode("utf-8"))
+            except Exception as e:
+                self._drop_pending(reply)
+                reply.set_exception(MasterError(f"Gửi {cmd} lỗi: {e}"))
+                continue
+            if ack is None:
+                reply.set_result(None)
+                continue
+            # chờ xác nhận trước khi gửi lệnh tiếp (MASTER chỉ đọc 1 lệnh mỗi lần)
+            try:
+                exc = reply.exception(timeout=ack[1])
+            except Exception:
+                exc = MasterError(f"Không có xác nhận cho {cmd}")
+                if self._drop_pending(reply):
+                    reply.set_exception(exc)
+            if exc is None:
+                metrics.observe("serial_rtt", time.perf_counter() - t0)
+            else:
+                metrics.inc("serial_errors", cmd=_cmd_name(cmd))
+
+    def _drop_pending(self, reply):
+        with self._lock:
+            for i, p in enumerate(self._pending):
+                if p[2] is reply:
+                    del self._pending[i]
+                    return True
+        return False
+
+    def goto(self, target):
+        """Chạy tới vị trí target; Reply hoàn tất (vị trí) khi MASTER báo ARRIVED:target."""
+        target = int(target)
+        fut = Reply()
+        with self._lock:
+            self._goto.setdefault(target, []).append(fut)
+        ack = self.send(str(target))
+        ack.add_done_callback(lambda a: self._goto_failed(target, fut, a.exception()) if a.exception() else None)
+        return fut
+
+    def _goto_failed(self, target, fut, exc):
+        with self._lock:
+            waiters = self._goto.get(target, [])
+            if fut in waiters:
+                waiters.remove(fut)
+            if not waiters:
+                self._goto.pop(target, None)
+        if not fut.done():
+            fut.set_exception(exc)
+
+    def cancel(self, fut):
+        """Bỏ chờ 1 Reply của goto() (vd quá giờ): ARRIVED tới muộn không hoàn tất nhầm goto sau."""
+        with self._lock:
+            target = next((t for t, fs in self._goto.items() if fut in fs), None)
+        if target is not None:
+            self._goto_failed(target, fut, TimeoutError("quá giờ chờ ARRIVED:%d" % target))
+
+    # ---------- nhận ----------
+    def run(self, stop_event):
+        """Vòng đọc (chạy trên luồng riêng, kèm luồng ghi) tới khi stop_event được set hoặc serial lỗi."""
+        writer = threading.Thread(target=self._writer, name="master-writer", daemon=True)
+        writer.start()
+        try:
+            while not stop_event.is_set():
+                raw = self.conn.readline()
+                self._expire()
+                line = raw.decode("utf-8", errors="ignore").strip()
+                if line:
+                    self.feed(line)
+        finally:
+            with self._out_cv:
+                self._closed = True
+                unsent = [f for item in self._outbox for f in item[1]]
+                self._outbox.clear()
+                self._out_cv.notify_all()
+            self._fail_all(MasterError("Mất kết nối MASTER"), unsent)
+
+    def feed(self, line):
+        kind, value = parse_line(line)
+        with self._lock:
+            self._match_ack(line, kind, value)
+            if kind == "ARRIVED" and value is not None:
+                self.position = value
+                done = self._goto.pop(value, [])
+            elif kind == "ERR" and value == "MOVE_TIMEOUT":
+                done = [f for fs in self._goto.values() for f in fs]
+                self._goto.clear()
+            else:
+                done = []
+        for f in done:
+            if f.done():
+                continue
+            if kind == "ARRIVED":
+                f.set_result(value)
+            else:
+                f.set_exception(MasterError(line))
+        if kind == "STATION_PASS" and value is not None:
+            self.position = value
+        elif kind == "OK" and value.startswith("SETPOS:"):
+            self.position = _int(value[7:])
+        if self.on_event:
+            self.on_event(kind, value, line)
+
+    def _match_ack(self, line, kind, value):
+        if kind == "ERR" and value.startswith("UNKNOWN_CMD:"):
+            cmd = value[len("UNKNOWN_CMD:"):]
+            for i, p in enumerate(self._pending):
+                if p[0] == cmd:
+                    del self._pending[i]
+                    p[2].set_exception(MasterError(line))
+                    return
+            return
+        if self._pending and line.startswith(self._pending[0][1]):
+            p = self._pending.popleft()
+            p[2].set_result(line)
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            while self._pending and self._pending[0][3] < now:
+                p = self._pending.popleft()
+                p[2].set_exception(MasterError(f"Không có xác nhận cho {p[0]}"))
+
+    def _fail_all(self, exc, extra=()):
+        with self._lock:
+            futs = list(extra) + [p[2] for p in self._pending] + [f for fs in self._goto.values() for f in fs]
+            self._pending.clear()
+            self._goto.clear()
+        for f in futs:
+            if not f.done():
+                f.set_exception(exc)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - SETTINGS: settings.csv (key,value) + SettingsStore giữ trong RAM.
+
+Không import torch / OpenCV: dùng được cả trong tiến trình web riêng (parking_web, web_mode=process).
+"""
+
+import os, csv, threading
+
+from parking_store import DEFAULT_DB
+
+CSV_SETTINGS = "settings.csv"
+
+DEFAULT_FEE_PER_HOUR = 5000
+ADMIN_USER = "Admin"
+ADMIN_PASS = "123"
+
+def ensure_csv_settings():
+    if not os.path.isfile(CSV_SETTINGS):
+        with open(CSV_SETTINGS, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["key","value"])
+            w.writerow(["fee_per_hour", str(DEFAULT_FEE_PER_HOUR)])
+            w.writerow(["cam_in", "0"])
+            w.writerow(["cam_out","1"])
+            w.writerow(["com_port",""])
+
+def read_settings():
+    ensure_csv_settings()
+    d = {"fee_per_hour": str(DEFAULT_FEE_PER_HOUR), "cam_in":"0", "cam_out":"1", "com_port":"", "continuous_ocr":"0",
+         "storage":"csv", "db_path":DEFAULT_DB, "web_mode":"thread", "web_threads":"8",
+         "stream_width":"640", "stream_quality":"80", "stream_fps":"15",
+         "infer_backend":"torch", "infer_threads":"0", "infer_precision":"fp32",
+         "detect_mode":"fixed", "detect_small":"320"}
+    try:
+        with open(CSV_SETTINGS, "r", newline="", encoding="utf-8") as f:
+            rd = csv.reader(f)
+            next(rd, None)
+            for row in rd:
+                if len(row) >= 2:
+                    k, v = row[0], row[1]
+                    d[k] = v
+    except Exception:
+        pass
+    try:
+        d["fee_per_hour"] = int(d.get("fee_per_hour", DEFAULT_FEE_PER_HOUR))
+    except:
+        d["fee_per_hour"] = DEFAULT_FEE_PER_HOUR
+    return d
+
+def write_settings(d):
+    rows = [["key","value"]]
+    for k,v in d.items():
+        rows.append([k, str(v)])
+    with open(CSV_SETTINGS, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerows(rows)
+
+# backend suy luận YOLO (xem function/models.py)
+INFER_BACKENDS = ("torch", "onnx", "openvino")
+# int8: model lượng tử hoá (training/quantize.py), chỉ dùng khi đã qua kiểm tra độ chính xác
+INFER_PRECISIONS = ("fp32", "int8")
+# adaptive: detector chạy size detect_small trước, 640 khi cần, cắt theo vùng biển số học được
+DETECT_MODES = ("fixed", "adaptive")
+
+# key settings -> loại sự kiện thay đổi (chỉ khởi động lại phần liên quan)
+SETTINGS_KINDS = {
+    "fee_per_hour": "fee",
+    "cam_in": "camera", "cam_out": "camera",
+    "com_port": "com",
+    "continuous_ocr": "ocr",
+    "storage": "storage", "db_path": "storage",
+    "web_mode": "web", "web_threads": "web",
+    "stream_width": "stream", "stream_quality": "stream", "stream_fps": "stream",
+    "infer_backend": "model", "infer_threads": "model", "infer_precision": "model",
+    "detect_mode": "detect", "detect_small": "detect",
+}
+
+class SettingsStore:
+    """
+    settings.csv giữ trong RAM. Đọc lại khi mtime của file đổi (poll_sec, kể cả sửa tay),
+    ghi qua update(). Mỗi thay đổi báo cho subscriber theo loại:
+    fn(kind, changed, settings) với kind in fee/camera/com/ocr/storage/web/stream/model/detect/other,
+    changed = {key: (cũ, mới)}.
+    """
+
+    def __init__(self, path=CSV_SETTINGS, poll_sec=1.0):
+        self.path = path
+        self.poll_sec = poll_sec
+        self._lock = threading.RLock()
+        self._subs = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._mtime = None
+        self._data = {}
+        self.refresh()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def subscribe(self, fn):
+        self._subs.append(fn)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._data)
+
+    def refresh(self):
+        """Đọc lại file nếu đã đổi; trả về True khi có đọc lại."""
+        with self._lock:
+            mtime = self._file_mtime()
+            if mtime is not None and mtime == self._mtime:
+                return False
+            new = read_settings()
+            self._mtime = self._file_mtime()
+            old, self._data = self._data, new
+        if old:
+            self._publish(old, new)
+        return True
+
+    def update(self, **changes):
+        with self._lock:
+            old = dict(self._data)
+            new = dict(old)
+            new.update(changes)
+            if "fee_per_hour" in changes:
+                try: new["fee_per_hour"] = int(new["fee_per_hour"])
+                except: new["fee_per_hour"] = DEFAULT_FEE_PER_HOUR
+            write_settings(new)
+            self._data = new
+            self._mtime = self._file_mtime()
+        self._publish(old, new)
+
+    def _publish(self, old, new):
+        by_kind = {}
+        for k in set(old) | set(new):
+            if str(old.get(k,"")) != str(new.get(k,"")):
+                by_kind.setdefault(SETTINGS_KINDS.get(k, "other"), {})[k] = (old.get(k), new.get(k))
+        for kind, changed in by_kind.items():
+            for fn in list(self._subs):
+                try:
+                    fn(kind, changed, dict(new))
+                except Exception as e:
+                    print("Lỗi xử lý settings:", e)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="settings-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_sec):
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Đọc settings lỗi:", e)
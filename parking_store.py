@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - STORE: lưu đặt chỗ, lịch sử xe, trạng thái ô đỗ
+
+2 backend cùng 1 interface, chọn bằng settings "storage":
+  - csv    (mặc định): dat_cho_truoc.csv, lich_su_xe.csv, vi_tri_do.csv như trước
+  - sqlite : 1 file SQLite (WAL, settings "db_path"), có index theo biển số, ô đỗ,
+             trạng thái và thời gian -> mỗi sự kiện O(log n) thay vì đọc/ghi lại cả file.
+             Lần mở đầu tiên tự nhập dữ liệu từ các file CSV cũ (1 lần).
+
+CLI:
+  python parking_store.py migrate [--db parking.db]        nhập CSV -> SQLite
+  python parking_store.py export  [--db parking.db] [--out DIR]   xuất SQLite -> CSV
+"""
+
+import os, io, csv, sqlite3, threading, argparse
+from collections import deque
+from array import array
+
+from function import metrics
+
+CSV_RESERVED = "dat_cho_truoc.csv"
+CSV_LOG      = "lich_su_xe.csv"
+CSV_SPOTS    = "vi_tri_do.csv"
+DEFAULT_DB   = "parking.db"
+DEFAULT_EXPORT = "export"
+IDX_MAGIC    = int.from_bytes(b"SPIDX\x00\x00\x01", "little")  # đầu file <log>.idx, đổi khi đổi định dạng
+
+RES_FIELDS = ["id","ten","sdt","bien_so","spot","gio_du_kien","so_tien_nap","created_at","status","arrival_time","exit_time","fee_total","paid_from_prepaid","con_thieu"]
+LOG_FIELDS = ["ma_the","bien_so","thoi_gian_vao","thoi_gian_ra","phi","paid_from_prepaid","con_thieu"]
+SPOT_FIELDS = ["spot","status","plate","rfid_uid","entry_time","prepaid_balance","reserve_id","reserved_at"]
+
+# reservation statuses that still hold a spot
+ACTIVE_STATUSES = ("reserved", "in")
+
+def safe_upper_plate(s):
+    s = (s or "").strip().upper()
+    # normalize common separators
+    s = s.replace(" ", "").replace("_", "-")
+    return s
+
+def fmt_money(v):
+    try:
+        v = int(v)
+    except:
+        v = 0
+    return f"{v:,}".replace(",", ".")
+
+def empty_spot_row(sid):
+    return {"spot": sid, "status": "empty", "plate": "", "rfid_uid": "", "entry_time": "",
+            "prepaid_balance": "0", "reserve_id": "", "reserved_at": ""}
+
+# ===================== CSV HELPERS =====================
+def ensure_csv_reserved(path=CSV_RESERVED):
+    if not os.path.isfile(path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(RES_FIELDS)
+
+def ensure_csv_spots(spot_ids, path=CSV_SPOTS):
+    if not os.path.isfile(path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=SPOT_FIELDS)
+            w.writeheader()
+            for s in spot_ids:
+                w.writerow(empty_spot_row(s))
+
+def ensure_csv_log(path=CSV_LOG):
+    if not os.path.isfile(path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(LOG_FIELDS)
+
+def _read_csv(path, fields):
+    rows = []
+    try:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            for r in csv.DictReader(f):
+                rows.append({k:(r.get(k,"") or "") for k in fields})
+    except FileNotFoundError:
+        pass
+    return rows
+
+def _write_csv(path, fields, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        for r in rows:
+            w.writerow({k:r.get(k,"") for k in fields})
+
+def _normalize_res(r):
+    # default status if empty
+    if not r["status"]:
+        r["status"] = "reserved"
+    return r
+
+# ===================== HISTORY LOG (append-only) =====================
+class HistoryLog:
+    """
+    lich_su_xe.csv chỉ ghi thêm. File chỉ mục <log>.idx lưu offset byte đầu mỗi dòng
+    (uint64), nên đọc N dòng mới nhất chỉ cần seek tới offset[-N] thay vì đọc cả file.
+    Đầu file chỉ mục ghi kích thước + mtime của CSV lúc ghi chỉ mục; lệch (CSV bị sửa / ghi
+    ngoài chương trình, chỉ mục định dạng cũ) thì dựng lại từ đầu.
+    (mỗi bản ghi nằm trên 1 dòng: các trường lịch sử không chứa xuống dòng)
+    """
+
+    def __init__(self, path=CSV_LOG, fields=LOG_FIELDS):
+        self.path = path
+        self.idx_path = path + ".idx"
+        self.fields = list(fields)
+        self._lock = threading.Lock()
+        ensure_csv_log(path)
+        with open(path, "rb") as f:
+            head = f.readline()
+        # header cũ có thể ngắn hơn LOG_FIELDS: cột thiếu lấy tên theo LOG_FIELDS
+        names = next(csv.reader([head.decode("utf-8-sig")]), [])
+        self.header = names + self.fields[len(names):]
+        self._data_start = len(head)
+        self._offsets = self._load_index()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _stamp(self):
+        st = os.stat(self.path)
+        return array("Q", [IDX_MAGIC, st.st_size, st.st_mtime_ns])
+
+    def _load_index(self):
+        data = array("Q")
+        try:
+            with open(self.idx_path, "rb") as f:
+                data.frombytes(f.read())
+        except (FileNotFoundError, ValueError):
+            data = array("Q")
+        if data[:3] == self._stamp():
+            return data[3:]
+        offs = array("Q")
+        with open(self.path, "rb") as f:
+            f.seek(self._data_start)
+            pos = self._data_start
+            for line in iter(f.readline, b""):
+                if line.strip():
+                    offs.append(pos)
+                pos += len(line)
+        with open(self.idx_path, "wb") as f:
+            f.write((self._stamp() + offs).tobytes())
+        return offs
+
+    def _is_row_start(self, off):
+        with open(self.path, "rb") as f:
+            f.seek(off - 1)
+            return f.read(1) == b"\n"
+
+    def append(self, row):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\r\n").writerow([row.get(k,"") for k in self.fields])
+        data = buf.getvalue().encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as f:
+                off = f.tell()
+                if off > 0 and not self._is_row_start(off):
+                    f.write(b"\r\n")
+                    off += 2
+                f.write(data)
+            self._offsets.append(off)
+            try:
+                with open(self.idx_path, "r+b") as f:
+                    f.seek(0, os.SEEK_END)
+                    f.write(array("Q", [off]).tobytes())
+                    f.seek(0)
+                    f.write(self._stamp().tobytes())
+            except FileNotFoundError:
+                with open(self.idx_path, "wb") as f:
+                    f.write((self._stamp() + self._offsets).tobytes())
+
+    def page(self, limit, before=None):
+        """
+        Tối đa limit dòng có số thứ tự < before (None: mới nhất), mới nhất trước.
+        Trả (rows, next_before); next_before None khi đã hết.
+        """
+        with self._lock:
+            end = len(self._offsets) if before is None else max(0, min(int(before), len(self._offsets)))
+            start = max(0, end - limit)
+            if limit <= 0 or start >= end:
+                return [], None
+            with open(self.path, "rb") as f:
+                f.seek(self._offsets[start])
+                if end < len(self._offsets):
+                    data = f.read(self._offsets[end] - self._offsets[start])
+                else:
+                    data = f.read()
+        rows = []
+        for vals in csv.reader(io.StringIO(data.decode("utf-8"))):
+            if vals:
+                r = dict(zip(self.header, vals))
+                rows.append({k:r.get(k,"") for k in self.fields})
+        rows.reverse()
+        return rows[:end - start], (start if start > 0 else None)
+
+    def tail(self, n):
+        """n dòng mới nhất, mới nhất trước."""
+        return self.page(n)[0]
+
+# ===================== CSV BACKEND =====================
+class CsvStore:
+    """Backend CSV (giữ nguyên định dạng file cũ): đọc/ghi lại toàn bộ file mỗi lần."""
+
+    def __init__(self, spot_ids):
+        self.spot_ids = list(spot_ids)
+        self._lock = threading.Lock()
+        ensure_csv_reserved()
+        ensure_csv_spots(self.spot_ids)
+        self.history = HistoryLog()
+
+    # ---------- reservations ----------
+    def reservations_version(self):
+        """Đổi khi file đặt chỗ bị sửa (kể cả ngoài chương trình)."""
+        try:
+            st = os.stat(CSV_RESERVED)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def reservations(self):
+        with self._lock:
+            return [_normalize_res(r) for r in _read_csv(CSV_RESERVED, RES_FIELDS)]
+
+    def recent_reservations(self, limit):
+        return list(reversed(self.reservations()[-limit:]))
+
+    def reservations_with_status(self, status):
+        return [r for r in self.reservations() if r["status"] == status]
+
+    def find_reserved_by_plate(self, plate):
+        plate = safe_upper_plate(plate)
+        for r in self.reservations():
+            if safe_upper_plate(r["bien_so"]) == plate and r["status"] == "reserved":
+                return r
+        return None
+
+    def active_reservation_for_spot(self, spot):
+        for r in self.reservations():
+            if r["spot"] == spot and r["status"] in ACTIVE_STATUSES:
+                return r
+        return None
+
+    def add_reservation(self, row):
+        with self._lock:
+            with open(CSV_RESERVED, "a", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=RES_FIELDS).writerow({k:row.get(k,"") for k in RES_FIELDS})
+
+    def update_reservation(self, rid, **fields):
+        rid = str(rid).strip()
+        with self._lock:
+            rows = [_normalize_res(r) for r in _read_csv(CSV_RESERVED, RES_FIELDS)]
+            for r in rows:
+                if str(r.get("id","")).strip() == rid:
+                    r.update(fields)
+            _write_csv(CSV_RESERVED, RES_FIELDS, rows)
+
+    # ---------- history ----------
+    def append_log(self, row):
+        self.history.append(row)
+
+    def recent_logs(self, limit):
+        return self.history.tail(limit)
+
+    def log_page(self, limit, before=None):
+        return self.history.page(limit, before)
+
+    # ---------- spots ----------
+    def load_spots(self):
+        with self._lock:
+            return _read_csv(CSV_SPOTS, SPOT_FIELDS)
+
+    def save_spots(self, rows):
+        with self._lock:
+            _write_csv(CSV_SPOTS, SPOT_FIELDS, rows)
+
+    def close(self):
+        pass
+
+# ===================== SQLITE BACKEND =====================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reservations (
+    id TEXT PRIMARY KEY, ten TEXT, sdt TEXT, bien_so TEXT, plate_norm TEXT, spot TEXT,
+    gio_du_kien TEXT, so_tien_nap TEXT, created_at TEXT, status TEXT, arrival_time TEXT,
+    exit_time TEXT, fee_total TEXT, paid_from_prepaid TEXT, con_thieu TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_res_plate   ON reservations(plate_norm, status);
+CREATE INDEX IF NOT EXISTS idx_res_spot    ON reservations(spot, status);
+CREATE INDEX IF NOT EXISTS idx_res_status  ON reservations(status);
+CREATE INDEX IF NOT EXISTS idx_res_created ON reservations(created_at);
+
+CREATE TABLE IF NOT EXISTS history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, ma_the TEXT, bien_so TEXT, thoi_gian_vao TEXT,
+    thoi_gian_ra TEXT, phi TEXT, paid_from_prepaid TEXT, con_thieu TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_hist_plate ON history(bien_so);
+CREATE INDEX IF NOT EXISTS idx_hist_time  ON history(thoi_gian_ra);
+
+CREATE TABLE IF NOT EXISTS spots (
+    spot TEXT PRIMARY KEY, status TEXT, plate TEXT, rfid_uid TEXT, entry_time TEXT,
+    prepaid_balance TEXT, reserve_id TEXT, reserved_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_spots_plate  ON spots(plate);
+CREATE INDEX IF NOT EXISTS idx_spots_status ON spots(status);
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+class SqliteStore:
+    """Backend SQLite (WAL). 1 connection dùng chung giữa các luồng, khóa bằng lock."""
+
+    def __init__(self, spot_ids, path=DEFAULT_DB, migrate=True):
+        self.spot_ids = list(spot_ids)
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self._lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.executescript(SCHEMA)
+        if migrate:
+            self.migrate_from_csv()
+        with self._lock, self.db:
+            for sid in self.spot_ids:
+                self.db.execute("INSERT OR IGNORE INTO spots (spot,status,prepaid_balance) VALUES (?,'empty','0')", (sid,))
+
+    def _rows(self, sql, args=()):
+        with self._lock:
+            return [dict(r) for r in self.db.execute(sql, args).fetchall()]
+
+    def _res(self, rows):
+        for r in rows:
+            r.pop("plate_norm", None)
+        return rows
+
+    # ---------- migration / export ----------
+    def migrate_from_csv(self, force=False):
+        """
+        Nhập CSV cũ vào DB đúng 1 lần (đánh dấu trong bảng meta).
+        force: nhập lại, lịch sử trong DB được thay bằng lịch sử CSV (không cộng dồn).
+        """
+        with self._lock:
+            done = self.db.execute("SELECT value FROM meta WHERE key='migrated_from_csv'").fetchone()
+        if done and not force:
+            return False
+        res = [_normalize_res(r) for r in _read_csv(CSV_RESERVED, RES_FIELDS)]
+        hist = HistoryLog()
+        logs = hist.tail(len(hist))[::-1]
+        spots = [r for r in _read_csv(CSV_SPOTS, SPOT_FIELDS) if r["spot"]]
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM history")
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO reservations ({','.join(RES_FIELDS)},plate_norm) VALUES ({','.join('?'*len(RES_FIELDS))},?)",
+                [[r[k] for k in RES_FIELDS] + [safe_upper_plate(r["bien_so"])] for r in res])
+            self.db.executemany(
+                f"INSERT INTO history ({','.join(LOG_FIELDS)}) VALUES ({','.join('?'*len(LOG_FIELDS))})",
+                [[r[k] for k in LOG_FIELDS] for r in logs])
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO spots ({','.join(SPOT_FIELDS)}) VALUES ({','.join('?'*len(SPOT_FIELDS))})",
+                [[r[k] for k in SPOT_FIELDS] for r in spots])
+            self.db.execute("INSERT OR REPLACE INTO meta (key,value) VALUES ('migrated_from_csv','1')")
+        print(f"SQLite: đã nhập {len(res)} đặt chỗ, {len(logs)} lịch sử, {len(spots)} ô từ CSV.")
+        return True
+
+    def export_csv(self, out_dir=DEFAULT_EXPORT):
+        os.makedirs(out_dir, exist_ok=True)
+        _write_csv(os.path.join(out_dir, CSV_RESERVED), RES_FIELDS, self.reservations())
+        log = os.path.join(out_dir, CSV_LOG)
+        _write_csv(log, LOG_FIELDS, self._rows("SELECT * FROM history ORDER BY seq"))
+        # chỉ mục của file lịch sử cũ không còn đúng: HistoryLog dựng lại khi mở
+        try:
+            os.remove(log + ".idx")
+        except FileNotFoundError:
+            pass
+        _write_csv(os.path.join(out_dir, CSV_SPOTS), SPOT_FIELDS, self.load_spots())
+
+    # ---------- reservations ----------
+    def reservations_version(self):
+        """data_version chỉ đổi khi connection khác ghi vào DB."""
+        with self._lock:
+            return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def reservations(self):
+        return self._res(self._rows("SELECT * FROM reservations ORDER BY created_at, id"))
+
+    def recent_reservations(self, limit):
+        return self._res(self._rows("SELECT * FROM reservations ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)))
+
+    def reservations_with_status(self, status):
+        return self._res(self._rows("SELECT * FROM reservations WHERE status=? ORDER BY created_at, id", (status,)))
+
+    def find_reserved_by_plate(self, plate):
+        rows = self._rows("SELECT * FROM reservations WHERE plate_norm=? AND status='reserved' ORDER BY created_at, id LIMIT 1",
+                          (safe_upper_plate(plate),))
+        return self._res(rows)[0] if rows else None
+
+    def active_reservation_for_spot(self, spot):
+        rows = self._rows("SELECT * FROM reservations WHERE spot=? AND status IN (?,?) LIMIT 1", (spot,) + ACTIVE_STATUSES)
+        return self._res(rows)[0] if rows else None
+
+    def add_reservation(self, row):
+        with self._lock, self.db:
+            self.db.execute(
+                f"INSERT INTO reservations ({','.join(RES_FIELDS)},plate_norm) VALUES ({','.join('?'*len(RES_FIELDS))},?)",
+                [row.get(k,"") for k in RES_FIELDS] + [safe_upper_plate(row.get("bien_so",""))])
+
+    def update_reservation(self, rid, **fields):
+        fields = {k:v for k,v in fields.items() if k in RES_FIELDS and k != "id"}
+        if "bien_so" in fields:
+            fields["plate_norm"] = safe_upper_plate(fields["bien_so"])
+        if not fields:
+            return
+        with self._lock, self.db:
+            self.db.execute(f"UPDATE reservations SET {','.join(k+'=?' for k in fields)} WHERE id=?",
+                            list(fields.values()) + [str(rid).strip()])
+
+    # ---------- history ----------
+    def append_log(self, row):
+        with self._lock, self.db:
+            self.db.execute(f"INSERT INTO history ({','.join(LOG_FIELDS)}) VALUES ({','.join('?'*len(LOG_FIELDS))})",
+                            [row.get(k,"") for k in LOG_FIELDS])
+
+    def recent_logs(self, limit):
+        return self.log_page(limit)[0]
+
+    def log_page(self, limit, before=None):
+        """Như HistoryLog.page: con trỏ là seq của dòng cũ nhất đã trả, None khi đã hết."""
+        if limit <= 0:
+            return [], None
+        # lấy thêm 1 dòng để biết còn trang sau hay không
+        if before is None:
+            rows = self._rows("SELECT * FROM history ORDER BY seq DESC LIMIT ?", (limit + 1,))
+        else:
+            rows = self._rows("SELECT * FROM history WHERE seq<? ORDER BY seq DESC LIMIT ?", (int(before), limit + 1))
+        nxt = rows[limit - 1]["seq"] if len(rows) > limit else None
+        rows = rows[:limit]
+        for r in rows:
+            r.pop("seq", None)
+        return rows, nxt
+
+    # ---------- spots ----------
+    def load_spots(self):
+        order = {s:i for i,s in enumerate(self.spot_ids)}
+        return sorted(self._rows("SELECT * FROM spots"), key=lambda r: order.get(r["spot"], len(order)))
+
+    def save_spots(self, rows):
+        with self._lock, self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO spots ({','.join(SPOT_FIELDS)}) VALUES ({','.join('?'*len(SPOT_FIELDS))})",
+                [[str(r.get(k,"")) for k in SPOT_FIELDS] for r in rows])
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+# ===================== RESERVATION INDEX =====================
+class ReservationIndex:
+    """
+    Đặt chỗ giữ trong RAM: biển số (chuẩn hoá) -> đặt chỗ 'reserved', ô -> đặt chỗ đang giữ ô
+    ('reserved'/'in'), tra cứu O(1). Mỗi khoá giữ hàng đợi ứng viên theo thứ tự file; đặt chỗ
+    đổi trạng thái được bỏ khỏi đầu hàng khi tra cứu (O(1) khấu hao, không quét lại danh sách).
+    Ghi xuyên xuống store (write-through); nạp lại khi store báo dữ liệu bị sửa từ bên ngoài
+    (reservations_version).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._version = None
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            self._version = self.store.reservations_version()
+            self._rows = self.store.reservations()
+            self._by_id = {str(r["id"]).strip(): r for r in self._rows}
+            self.by_plate = {}
+            self.by_spot = {}
+            for r in self._rows:
+                self._index(r)
+
+    @staticmethod
+    def _keys(r):
+        """(biển số nếu đang 'reserved', ô nếu đang giữ ô); "" khi không thuộc chỉ mục."""
+        status = r.get("status","")
+        plate = safe_upper_plate(r.get("bien_so","")) if status == "reserved" else ""
+        spot = r.get("spot","") if status in ACTIVE_STATUSES else ""
+        return plate, spot
+
+    def _index(self, r, before=("", "")):
+        # đặt chỗ cũ nhất của biển số / ô đứng đầu hàng (như khi quét file từ đầu)
+        for index, key, old in zip((self.by_plate, self.by_spot), self._keys(r), before):
+            if key and key != old:
+                index.setdefault(key, deque()).append(r)
+
+    def _head(self, index, key, i):
+        """Ứng viên đầu tiên còn đúng khoá; ứng viên đã đổi trạng thái / biển số / ô bị bỏ."""
+        q = index.get(key)
+        while q and self._keys(q[0])[i] != key:
+            q.popleft()
+        if not q:
+            index.pop(key, None)
+            return None
+        return q[0]
+
+    def _check(self):
+        if self.store.reservations_version() != self._version:
+            self.reload()
+
+    def find_reserved_by_plate(self, plate):
+        with self._lock:
+            self._check()
+            r = self._head(self.by_plate, safe_upper_plate(plate), 0)
+            return dict(r) if r else None
+
+    def active_for_spot(self, spot):
+        with self._lock:
+            self._check()
+            r = self._head(self.by_spot, spot, 1) if spot else None
+            return dict(r) if r else None
+
+    def get(self, rid):
+        with self._lock:
+            self._check()
+            r = self._by_id.get(str(rid).strip())
+            return dict(r) if r else None
+
+    def with_status(self, status):
+        with self._lock:
+            self._check()
+            return [dict(r) for r in self._rows if r.get("status") == status]
+
+    def recent(self, limit):
+        return self.page(limit)[0]
+
+    def page(self, limit, before=None):
+        """Đặt chỗ theo vị trí (chỉ thêm vào cuối), mới nhất trước: (rows, next_before)."""
+        with self._lock:
+            self._check()
+            end = len(self._rows) if before is None else max(0, min(int(before), len(self._rows)))
+            start = max(0, end - limit)
+            rows = [dict(r) for r in reversed(self._rows[start:end])]
+        return rows, (start if start > 0 else None)
+
+    def add(self, row):
+        row = _normalize_res({k:str(row.get(k,"")) for k in RES_FIELDS})
+        with self._lock:
+            self._check()
+            with metrics.timer("persist"):
+                self.store.add_reservation(row)
+            self._version = self.store.reservations_version()
+            self._rows.append(row)
+            self._by_id[str(row["id"]).strip()] = row
+            self._index(row)
+
+    def update(self, rid, **fields):
+        rid = str(rid).strip()
+        with self._lock:
+            self._check()
+            with metrics.timer("persist"):
+                self.store.update_reservation(rid, **fields)
+            self._version = self.store.reservations_version()
+            r = self._by_id.get(rid)
+            if r is None:
+                return
+            before = self._keys(r)
+            r.update({k:str(v) for k,v in fields.items() if k in RES_FIELDS and k != "id"})
+            self._index(r, before)
+
+def open_store(settings, spot_ids):
+    """Chọn backend theo settings: storage=csv|sqlite, db_path=..."""
+    kind = str(settings.get("storage","csv")).strip().lower()
+    if kind == "sqlite":
+        return SqliteStore(spot_ids, settings.get("db_path","") or DEFAULT_DB)
+    return CsvStore(spot_ids)
+
+# ===================== CLI =====================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Nhập / xuất dữ liệu bãi xe giữa CSV và SQLite")
+    ap.add_argument("cmd", choices=["migrate", "export"])
+    ap.add_argument("--db", default=DEFAULT_DB)
+    ap.add_argument("--out", default=DEFAULT_EXPORT, help="thư mục xuất CSV (export)")
+    ap.add_argument("--force", action="store_true", help="cho phép export ghi đè CSV đang dùng ở thư mục hiện tại")
+    args = ap.parse_args()
+
+    live = [f for f in (CSV_RESERVED, CSV_LOG, CSV_SPOTS) if os.path.isfile(f)]
+    if args.cmd == "export" and live and os.path.realpath(args.out) == os.path.realpath(".") and not args.force:
+        raise SystemExit(f"Thư mục {os.path.abspath(args.out)} đang có {', '.join(live)}; "
+                         f"chọn --out khác hoặc thêm --force để ghi đè.")
+
+    # spots được tạo từ CSV / đã có trong DB
+    st = SqliteStore([], args.db, migrate=False)
+    if args.cmd == "migrate":
+        if not st.migrate_from_csv(force=True):
+            print("Không có gì để nhập.")
+    else:
+        st.export_csv(args.out)
+        print(f"Đã xuất CSV vào {os.path.abspath(args.out)}")
+    st.close()
@@ -0,0 +1,752 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - WEB (Flask): đặt trước chỗ đỗ, lịch sử xe, admin settings.
+
+Là client của ParkingEngine (parking_engine.py), dùng được cả khi chạy kèm
+giao diện Tk (smart_parking_full.py) lẫn khi chạy engine headless.
+  - /           : Reservation dashboard (professional UI)
+  - /reserve    : POST create reservation
+  - /history    : View vehicle history (CSV log)
+  - /admin      : Login
+  - /admin/settings : Change fee/hour, COM, cam sources
+  - /events     : SSE trạng thái ô đỗ, xe vào/ra, đặt chỗ, MASTER (không cần poll)
+  - /cam/in.mjpg, /cam/out.mjpg, /cam/<in|out>/snapshot.jpg : xem camera cổng
+  - /api/spots, /api/reservations?cursor=&limit=, /api/history?cursor=&limit=
+                : JSON (mới nhất trước, next_cursor để lấy trang cũ hơn), hỗ trợ ETag/304
+  - /metrics    : độ trễ từng công đoạn (detect, OCR, deskew, serial, lưu...) dạng Prometheus
+
+Chế độ chạy (settings web_mode / web_threads): dev | thread (mặc định, waitress nếu có) |
+process (tiến trình riêng, gọi engine qua IPC) — xem start_web_server.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import subprocess
+from multiprocessing.managers import BaseManager
+
+from flask import Flask, request, redirect, session, jsonify, Response
+from werkzeug.serving import make_server
+
+# chỉ module nhẹ (không torch / camera) để tiến trình web riêng khởi động nhanh
+from parking_store import fmt_money, safe_upper_plate
+from parking_settings import DEFAULT_FEE_PER_HOUR, ADMIN_USER, ADMIN_PASS, INFER_BACKENDS, INFER_PRECISIONS, DETECT_MODES
+
+# ===================== WEB (Flask) =====================
+WEB_BASE = r"""
+<!doctype html>
+<html lang="vi">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>{{title}}</title>
+  <style>
+    :root{
+      --bg:#0b1220;
+      --card:#0f1a2e;
+      --card2:#101f3a;
+      --text:#eaf0ff;
+      --muted:#a9b7d6;
+      --line:rgba(255,255,255,.08);
+      --brand1:#1c4fd7;
+      --brand2:#23c2ff;
+      --ok:#21c55d;
+      --warn:#f59e0b;
+      --bad:#ef4444;
+    }
+    *{box-sizing:border-box}
+    body{margin:0;font-family:Inter,Segoe UI,Arial;background:linear-gradient(180deg,#071024 0%, #050a14 100%);color:var(--text)}
+    .top{
+      position:sticky;top:0;z-index:20;
+      background:linear-gradient(90deg,#0b1f4d 0%, #061b3f 55%, #051634 100%);
+      border-bottom:1px solid var(--line);
+      padding:14px 18px;
+      display:flex;align-items:center;justify-content:space-between;
+    }
+    .brand{display:flex;gap:12px;align-items:center}
+    .dot{width:10px;height:10px;border-radius:999px;background:var(--brand2);box-shadow:0 0 0 6px rgba(35,194,255,.12)}
+    .brand h1{margin:0;font-size:18px;letter-spacing:.3px}
+    .brand .sub{font-size:12px;color:var(--muted);margin-top:2px}
+    .nav{display:flex;gap:10px;align-items:center}
+    .pill{
+      padding:10px 14px;border-radius:12px;text-decoration:none;
+      color:var(--text);border:1px solid var(--line);
+      background:rgba(255,255,255,.04);
+      font-weight:700;font-size:14px;
+    }
+    .pill.active{background:linear-gradient(90deg,rgba(28,79,215,.35),rgba(35,194,255,.18));border-color:rgba(35,194,255,.35)}
+    .wrap{max-width:1150px;margin:18px auto;padding:0 14px}
+    .grid{display:grid;grid-template-columns:1.2fr .8fr;gap:14px}
+    @media(max-width:980px){.grid{grid-template-columns:1fr}}
+    .card{
+      background:linear-gradient(180deg,rgba(255,255,255,.05),rgba(255,255,255,.03));
+      border:1px solid var(--line);
+      border-radius:18px;
+      padding:16px;
+      box-shadow:0 18px 40px rgba(0,0,0,.35);
+    }
+    .card h2{margin:0 0 8px;font-size:18px}
+    .muted{color:var(--muted);font-size:13px}
+    .formgrid{display:grid;grid-template-columns:1fr 1fr;gap:12px;margin-top:12px}
+    @media(max-width:720px){.formgrid{grid-template-columns:1fr}}
+    label{display:block;font-weight:800;font-size:12px;margin-bottom:6px;color:#dbe6ff}
+    input,select{
+      width:100%;
+      padding:11px 12px;border-radius:12px;
+      border:1px solid rgba(255,255,255,.14);
+      background:rgba(7,12,24,.55);
+      color:var(--text);
+      outline:none;
+    }
+    input:focus,select:focus{border-color:rgba(35,194,255,.65);box-shadow:0 0 0 4px rgba(35,194,255,.12)}
+    .btn{
+      border:0;border-radius:12px;
+      padding:11px 14px;
+      font-weight:900;
+      cursor:pointer;
+      color:#071024;
+      background:linear-gradient(90deg,var(--brand2),#7dd3fc);
+    }
+    .btn:hover{filter:brightness(1.05)}
+    table{width:100%;border-collapse:collapse;margin-top:10px}
+    th,td{padding:10px;border-bottom:1px solid var(--line);text-align:left;font-size:13px}
+    th{color:#dbe6ff;font-weight:900}
+    .scroll{max-height:360px;overflow:auto;border:1px solid var(--line);border-radius:14px}
+    .badge{
+      padding:4px 10px;border-radius:999px;font-weight:900;font-size:12px;display:inline-block
+    }
+    .b-ok{background:rgba(33,197,93,.18);color:#b8ffcf;border:1px solid rgba(33,197,93,.35)}
+    .b-warn{background:rgba(245,158,11,.18);color:#ffe7b0;border:1px solid rgba(245,158,11,.35)}
+    .b-bad{background:rgba(239,68,68,.18);color:#ffb8b8;border:1px solid rgba(239,68,68,.35)}
+    .kpi{display:grid;grid-template-columns:repeat(3,1fr);gap:12px;margin-top:12px}
+    .box{background:rgba(255,255,255,.04);border:1px solid var(--line);border-radius:16px;padding:12px}
+    .big{font-size:26px;font-weight:1000;margin-top:6px}
+    .hint{margin-top:10px;font-size:12px;color:var(--muted);line-height:1.5}
+    .mono{font-family:ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace}
+    a{color:#a5d8ff}
+    .footer{margin:18px 0;color:rgba(255,255,255,.45);font-size:12px;text-align:center}
+  </style>
+</head>
+<body>
+  <div class="top">
+    <div class="brand">
+      <div class="dot"></div>
+      <div>
+        <h1>SMART PARKING</h1>
+        <div class="sub">{{subtitle}}</div>
+      </div>
+    </div>
+    <div class="nav">
+      <a class="pill {{'active' if active=='reserve' else ''}}" href="/">Đặt trước</a>
+      <a class="pill {{'active' if active=='history' else ''}}" href="/history">Lịch sử xe</a>
+      <a class="pill" href="/admin">Admin</a>
+    </div>
+  </div>
+
+  <div class="wrap">
+    {{body | safe}}
+    <div class="footer">Smart Parking • Local Web • http://127.0.0.1:5000</div>
+  </div>
+</body>
+</html>
+"""
+
+WEB_BODY_RESERVE = r"""
+<div class="grid">
+  <div class="card">
+    <h2>Đặt trước ô đỗ</h2>
+    <div class="muted">Phí/giờ hiện tại: <b>{{fee}}</b> VNĐ</div>
+
+    <form method="POST" action="/reserve" style="margin-top:12px">
+      <div class="formgrid">
+        <div>
+          <label>Họ tên</label>
+          <input name="ten" required>
+        </div>
+        <div>
+          <label>Số điện thoại</label>
+          <input name="sdt" required>
+        </div>
+        <div>
+          <label>Biển số</label>
+          <input name="bien_so" required placeholder="VD: 80T-8888">
+        </div>
+        <div>
+          <label>Ô đỗ (chỉ chọn ô còn trống)</label>
+          <select name="spot" required>
+            {% for s in selectable_spots %}
+              <option value="{{s}}">{{s}} — Trống ✅</option>
+            {% endfor %}
+          </select>
+        </div>
+        <div>
+          <label>Thời gian đỗ dự kiến (giờ)</label>
+          <input name="gio_du_kien" type="number" min="1" value="1" required>
+        </div>
+        <div>
+          <label>Số tiền nạp trước (VNĐ)</label>
+          <input name="so_tien_nap" type="number" min="0" value="0" required>
+        </div>
+      </div>
+
+      <div style="margin-top:12px;display:flex;gap:10px;align-items:center;flex-wrap:wrap">
+        <button class="btn" type="submit">Xác nhận đặt trước</button>
+        <span class="muted">{{msg}}</span>
+      </div>
+
+      <div class="hint">
+        <b>Cách tính phí đặt trước:</b> nếu xe vào bằng đúng biển số đã đặt,
+        hệ thống tính từ thời điểm <b>xác nhận đặt</b> (created_at) đến khi xe <b>rời bãi</b> (exit_time).
+        Nếu không có đặt trước, hệ thống tính từ <b>thời điểm xe vào</b>.
+      </div>
+    </form>
+  </div>
+
+  <div class="card">
+    <h2>Trạng thái bãi xe</h2>
+    <div class="muted">Ô trống / đã đặt / có xe</div>
+
+    <div class="kpi">
+      <div class="box">
+        <div class="muted">Ô trống</div>
+        <div class="big" id="kpi-empty">{{kpi_empty}}</div>
+      </div>
+      <div class="box">
+        <div class="muted">Đã đặt</div>
+        <div class="big" id="kpi-reserved">{{kpi_reserved}}</div>
+      </div>
+      <div class="box">
+        <div class="muted">Có xe</div>
+        <div class="big" id="kpi-occupied">{{kpi_occupied}}</div>
+      </div>
+    </div>
+
+    <div class="scroll" style="margin-top:12px">
+      <table>
+        <thead>
+          <tr><th>Ô</th><th>Trạng thái</th><th>Biển số</th></tr>
+        </thead>
+        <tbody id="spot-rows">
+          {% for s in spots %}
+            <tr>
+              <td class="mono"><b>{{s.spot}}</b></td>
+              <td>
+                {% if s.status=='empty' %}
+                  <span class="badge b-ok">empty</span>
+                {% elif s.status=='reserved' %}
+                  <span class="badge b-warn">reserved</span>
+                {% else %}
+                  <span class="badge b-bad">occupied</span>
+                {% endif %}
+              </td>
+              <td><b>{{s.plate}}</b></td>
+            </tr>
+          {% endfor %}
+        </tbody>
+      </table>
+    </div>
+
+    <div class="hint">
+      Chọn ô đỗ chỉ hiển thị ô <b>trống</b>. Ô <b>reserved</b> sẽ tự động được dùng khi xe vào đúng biển số đã đặt.
+    </div>
+    <div class="muted" id="master-status" style="margin-top:8px"></div>
+
+    <script>
+      // cập nhật trực tiếp qua /events (SSE)
+      (function(){
+        if (!window.EventSource) return;
+        var badge = {empty:'b-ok', reserved:'b-warn', occupied:'b-bad'};
+        function esc(t){ var d=document.createElement('div'); d.textContent=t||''; return d.innerHTML; }
+        var es = new EventSource('/events');
+        es.addEventListener('spots', function(e){
+          var spots = JSON.parse(e.data).spots, n = {empty:0, reserved:0, occupied:0}, html = '';
+          spots.forEach(function(s){
+            n[s.status] = (n[s.status]||0) + 1;
+            html += '<tr><td class="mono"><b>'+esc(s.spot)+'</b></td><td><span class="badge '+(badge[s.status]||'b-bad')+'">'
+                 + esc(s.status)+'</span></td><td><b>'+esc(s.plate)+'</b></td></tr>';
+          });
+          document.getElementById('spot-rows').innerHTML = html;
+          document.getElementById('kpi-empty').textContent = n.empty;
+          document.getElementById('kpi-reserved').textContent = n.reserved;
+          document.getElementById('kpi-occupied').textContent = n.occupied;
+        });
+        es.addEventListener('master', function(e){
+          var m = JSON.parse(e.data);
+          document.getElementById('master-status').textContent =
+            'MASTER: ' + (m.connected ? 'đã kết nối' : 'chưa kết nối') + ' • vị trí ' + m.position;
+        });
+      })();
+    </script>
+  </div>
+</div>
+
+<div class="card" style="margin-top:14px">
+  <h2>Danh sách đặt trước</h2>
+  <div class="muted">Trạng thái: reserved (chưa đến), in (đã đến), done (đã rời), cancel.</div>
+
+  <div class="scroll" style="margin-top:10px">
+    <table>
+      <thead>
+        <tr>
+          <th>ID</th><th>Tên</th><th>SĐT</th><th>Biển số</th><th>Ô</th><th>Giờ DK</th><th>Nạp</th>
+          <th>Created</th><th>Status</th><th>Arrival</th><th>Exit</th><th>Phí</th>
+        </tr>
+      </thead>
+      <tbody>
+        {% for r in reservations %}
+          <tr>
+            <td class="mono">{{r.id}}</td>
+            <td>{{r.ten}}</td>
+            <td class="mono">{{r.sdt}}</td>
+            <td><b>{{r.bien_so}}</b></td>
+            <td class="mono"><b>{{r.spot}}</b></td>
+            <td class="mono">{{r.gio_du_kien}}</td>
+            <td class="mono">{{r.so_tien_nap}}</td>
+            <td class="mono">{{r.created_at}}</td>
+            <td>
+              {% if r.status=='reserved' %}
+                <span class="badge b-warn">reserved</span>
+              {% elif r.status=='in' %}
+                <span class="badge b-ok">in</span>
+              {% elif r.status=='done' %}
+                <span class="badge b-ok">done</span>
+              {% else %}
+                <span class="badge b-bad">{{r.status}}</span>
+              {% endif %}
+            </td>
+            <td class="mono">{{r.arrival_time}}</td>
+            <td class="mono">{{r.exit_time}}</td>
+            <td class="mono"><b>{{r.fee_total}}</b></td>
+          </tr>
+        {% endfor %}
+      </tbody>
+    </table>
+  </div>
+</div>
+"""
+
+WEB_BODY_HISTORY = r"""
+<div class="card">
+  <h2>Lịch sử xe</h2>
+  <div class="muted">Dữ liệu lấy từ <span class="mono">lich_su_xe.csv</span></div>
+
+  <div class="scroll" style="margin-top:10px">
+    <table>
+      <thead>
+        <tr>
+          <th>Mã thẻ</th><th>Biển số</th><th>Thời gian vào</th><th>Thời gian ra</th>
+          <th>Phí</th><th>Trừ từ nạp</th><th>Còn thiếu</th>
+        </tr>
+      </thead>
+      <tbody>
+        {% for r in logs %}
+          <tr>
+            <td class="mono">{{r.ma_the}}</td>
+            <td><b>{{r.bien_so}}</b></td>
+            <td class="mono">{{r.thoi_gian_vao}}</td>
+            <td class="mono">{{r.thoi_gian_ra}}</td>
+            <td class="mono"><b>{{r.phi}}</b></td>
+            <td class="mono">{{r.paid_from_prepaid}}</td>
+            <td class="mono">{{r.con_thieu}}</td>
+          </tr>
+        {% endfor %}
+      </tbody>
+    </table>
+  </div>
+</div>
+"""
+
+WEB_ADMIN_LOGIN = r"""
+<div class="card" style="max-width:520px;margin:0 auto">
+  <h2>Admin Login</h2>
+  <div class="muted">Tài khoản mặc định: <span class="mono">Admin / 123</span></div>
+  <form method="POST" style="margin-top:12px">
+    <div class="formgrid" style="grid-template-columns:1fr">
+      <div><label>Tài khoản</label><input name="u" required></div>
+      <div><label>Mật khẩu</label><input name="p" type="password" required></div>
+    </div>
+    <div style="margin-top:12px;display:flex;gap:10px;align-items:center">
+      <button class="btn" type="submit">Đăng nhập</button>
+      <span class="muted">{{msg}}</span>
+    </div>
+  </form>
+</div>
+"""
+
+WEB_ADMIN_SETTINGS = r"""
+<div class="card">
+  <h2>Admin Settings</h2>
+  <div class="muted">Chỉnh phí/giờ, camera, COM, backend nhận diện — lưu vào <span class="mono">settings.csv</span></div>
+
+  <form method="POST" action="/admin/settings" style="margin-top:12px">
+    <div class="formgrid">
+      <div>
+        <label>Phí gửi xe (VNĐ/giờ)</label>
+        <input name="fee_per_hour" type="number" min="0" value="{{fee_per_hour}}" required>
+      </div>
+      <div>
+        <label>COM Arduino MASTER</label>
+        <input name="com_port" value="{{com_port}}" placeholder="VD: COM5">
+      </div>
+      <div>
+        <label>Camera vào</label>
+        <input name="cam_in" value="{{cam_in}}" placeholder="VD: 0 hoặc đường dẫn video/ảnh">
+      </div>
+      <div>
+        <label>Camera ra</label>
+        <input name="cam_out" value="{{cam_out}}" placeholder="VD: 1 hoặc đường dẫn video/ảnh">
+      </div>
+      <div>
+        <label>Backend nhận diện (YOLO)</label>
+        <select name="infer_backend">
+          {% for b in backends %}<option value="{{b}}" {% if b == infer_backend %}selected{% endif %}>{{b}}</option>{% endfor %}
+        </select>
+      </div>
+      <div>
+        <label>Độ chính xác model (int8: chỉ onnx/openvino, cần qua kiểm tra)</label>
+        <select name="infer_precision">
+          {% for p in precisions %}<option value="{{p}}" {% if p == infer_precision %}selected{% endif %}>{{p}}</option>{% endfor %}
+        </select>
+      </div>
+      <div>
+        <label>Detector (adaptive: size nhỏ trước + vùng biển số theo camera)</label>
+        <select name="detect_mode">
+          {% for m in detect_modes %}<option value="{{m}}" {% if m == detect_mode %}selected{% endif %}>{{m}}</option>{% endfor %}
+        </select>
+      </div>
+    </div>
+
+    <div style="margin-top:12px;display:flex;gap:10px;align-items:center;flex-wrap:wrap">
+      <button class="btn" type="submit">Lưu</button>
+      <a class="pill" style="padding:10px 14px" href="/admin/logout">Đăng xuất</a>
+      <span class="muted">{{msg}}</span>
+    </div>
+
+    <div class="hint">
+      Gợi ý Camera: nhập <b>0</b>, <b>1</b>... để dùng webcam theo index.
+      Nếu nhập đường dẫn <b>.mp4</b> sẽ chạy video; nhập <b>.jpg</b> sẽ hiển thị ảnh tĩnh (demo OCR).
+    </div>
+  </form>
+</div>
+"""
+
+def create_web_server(engine):
+    app = Flask(__name__)
+    app.secret_key = "smart-parking-secret"
+
+    # mỗi trang = WEB_BASE + body, biên dịch 1 lần khi khởi động
+    pages = {body: app.jinja_env.from_string(WEB_BASE.replace("{{body | safe}}", body))
+             for body in (WEB_BODY_RESERVE, WEB_BODY_HISTORY, WEB_ADMIN_LOGIN, WEB_ADMIN_SETTINGS)}
+
+    def render_page(body_html, title="Smart Parking", subtitle="Đặt trước & Lịch sử xe", active="reserve", **ctx):
+        html = pages[body_html].render(title=title, subtitle=subtitle, active=active, **ctx)
+        return Response(html, mimetype="text/html")
+
+    def json_page(rows, next_cursor, **extra):
+        resp = jsonify(rows=rows, next_cursor=next_cursor, **extra)
+        resp.add_etag()
+        return resp.make_conditional(request)
+
+    def page_args(default_limit):
+        try:
+            cursor = request.args.get("cursor")
+            cursor = int(cursor) if cursor not in (None, "") else None
+            limit = min(500, max(1, int(request.args.get("limit", default_limit))))
+        except ValueError:
+            return None
+        return cursor, limit
+
+    @app.get("/")
+    def home():
+        fee = int(engine.get_settings().get("fee_per_hour", DEFAULT_FEE_PER_HOUR))
+
+        spots = engine.get_spots_status_for_web()
+        selectable_spots = [s["spot"] for s in spots if s["status"] == "empty"]
+        reservations, _ = engine.read_reservations()
+
+        kpi_empty = sum(1 for s in spots if s["status"] == "empty")
+        kpi_reserved = sum(1 for s in spots if s["status"] == "reserved")
+        kpi_occupied = sum(1 for s in spots if s["status"] == "occupied")
+
+        msg = request.args.get("msg","")
+        return render_page(
+            WEB_BODY_RESERVE,
+            active="reserve",
+            fee=fmt_money(fee),
+            msg=msg,
+            selectable_spots=selectable_spots if selectable_spots else ["(Không còn ô trống)"],
+            spots=spots,
+            reservations=reservations,
+            kpi_empty=kpi_empty, kpi_reserved=kpi_reserved, kpi_occupied=kpi_occupied
+        )
+
+    @app.post("/reserve")
+    def reserve():
+        ten = (request.form.get("ten","") or "").strip()
+        sdt = (request.form.get("sdt","") or "").strip()
+        bien_so = safe_upper_plate(request.form.get("bien_so",""))
+        spot = (request.form.get("spot","") or "").strip()
+        gio = (request.form.get("gio_du_kien","1") or "1").strip()
+        nap = (request.form.get("so_tien_nap","0") or "0").strip()
+
+        try: gio_i = max(1, int(gio))
+        except: gio_i = 1
+        try: nap_i = max(0, int(nap))
+        except: nap_i = 0
+
+        ok, reason = engine.add_reservation(ten, sdt, bien_so, spot, gio_i, nap_i)
+        if not ok:
+            return redirect(f"/?msg={reason}")
+        return redirect("/?msg=Đặt trước thành công!")
+
+    @app.get("/history")
+    def history():
+        logs, _ = engine.read_vehicle_logs()
+        return render_page(WEB_BODY_HISTORY, active="history", logs=logs)
+
+    @app.route("/admin", methods=["GET","POST"])
+    def admin_login():
+        msg = ""
+        if request.method == "POST":
+            u = request.form.get("u","")
+            p = request.form.get("p","")
+            if u == ADMIN_USER and p == ADMIN_PASS:
+                session["admin"] = True
+                return redirect("/admin/settings")
+            msg = "Sai tài khoản hoặc mật khẩu."
+        return render_page(WEB_ADMIN_LOGIN, active="", msg=msg, subtitle="Admin", title="Admin Login")
+
+    @app.get("/admin/logout")
+    def admin_logout():
+        session.clear()
+        return redirect("/")
+
+    @app.route("/admin/settings", methods=["GET","POST"])
+    def admin_settings():
+        if not session.get("admin"):
+            return redirect("/admin")
+
+        msg = ""
+        if request.method == "POST":
+            fee_per_hour = (request.form.get("fee_per_hour","5000") or "5000").strip()
+            com_port = (request.form.get("com_port","") or "").strip()
+            cam_in = (request.form.get("cam_in","0") or "0").strip()
+            cam_out = (request.form.get("cam_out","1") or "1").strip()
+            infer_backend = (request.form.get("infer_backend","torch") or "torch").strip()
+            if infer_backend not in INFER_BACKENDS:
+                infer_backend = "torch"
+            infer_precision = (request.form.get("infer_precision","fp32") or "fp32").strip()
+            if infer_precision not in INFER_PRECISIONS:
+                infer_precision = "fp32"
+            detect_mode = (request.form.get("detect_mode","fixed") or "fixed").strip()
+            if detect_mode not in DETECT_MODES:
+                detect_mode = "fixed"
+
+            try: fee_per_hour_i = max(0, int(fee_per_hour))
+            except: fee_per_hour_i = DEFAULT_FEE_PER_HOUR
+
+            # engine chỉ khởi động lại phần có thay đổi (phí / camera / COM / model)
+            engine.update_settings(fee_per_hour=fee_per_hour_i, com_port=com_port, cam_in=cam_in, cam_out=cam_out,
+                                   infer_backend=infer_backend, infer_precision=infer_precision,
+                                   detect_mode=detect_mode)
+            msg = "Đã lưu."
+
+        st = engine.get_settings()
+        return render_page(
+            WEB_ADMIN_SETTINGS,
+            active="",
+            subtitle="Admin Settings",
+            title="Admin Settings",
+            fee_per_hour=st["fee_per_hour"],
+            com_port=st.get("com_port",""),
+            cam_in=st.get("cam_in","0"),
+            cam_out=st.get("cam_out","1"),
+            infer_backend=st.get("infer_backend","torch"),
+            backends=INFER_BACKENDS,
+            infer_precision=st.get("infer_precision","fp32"),
+            precisions=INFER_PRECISIONS,
+            detect_mode=st.get("detect_mode","fixed"),
+            detect_modes=DETECT_MODES,
+            msg=msg
+        )
+
+    # ---------- SSE ----------
+    def sse(seq, event, data):
+        return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    @app.get("/events")
+    def events():
+        sid = engine.events_subscribe()
+
+        def stream():
+            try:
+                yield "retry: 3000\n\n"
+                # trạng thái hiện tại trước, sau đó chỉ gửi thay đổi
+                yield sse(0, "spots", {"spots": engine.get_spots_status_for_web()})
+                yield sse(0, "master", dict(engine.get_master_status(), state="status"))
+                while True:
+                    got = engine.events_get(sid, 15.0)
+                    if got is None:
+                        break
+                    batch, dropped = got
+                    if dropped:
+                        yield sse(0, "dropped", {"count": dropped})
+                    if not batch:
+                        yield ": ping\n\n"
+                    for seq, event, data in batch:
+                        yield sse(seq, event, data)
+            finally:
+                engine.events_unsubscribe(sid)
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    # ---------- Camera ----------
+    CAMS = ("in", "out")
+
+    @app.get("/cam/<ch>/snapshot.jpg")
+    def cam_snapshot(ch):
+        if ch not in CAMS:
+            return Response("Không có camera.", status=404)
+        _, jpg = engine.camera_jpeg(ch)
+        if jpg is None:
+            return Response("Camera chưa có hình.", status=503)
+        return Response(jpg, mimetype="image/jpeg", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/cam/<ch>.mjpg")
+    def cam_mjpeg(ch):
+        if ch not in CAMS:
+            return Response("Không có camera.", status=404)
+        try:
+            interval = 1.0 / max(1, int(engine.get_settings().get("stream_fps", 15)))
+        except ValueError:
+            interval = 1.0 / 15
+
+        def stream():
+            last = None
+            while True:
+                t0 = time.time()
+                key, jpg = engine.camera_jpeg(ch, last)
+                if jpg is not None:
+                    last = key
+                    yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                           + str(len(jpg)).encode() + b"\r\n\r\n" + jpg + b"\r\n")
+                # giới hạn fps gửi đi; không có frame mới thì chờ tiếp
+                time.sleep(max(0.01, interval - (time.time() - t0)))
+
+        return Response(stream(), mimetype="multipart/x-mixed-replace; boundary=frame",
+                        headers={"Cache-Control": "no-cache"})
+
+    # ---------- JSON API ----------
+    @app.get("/api/spots")
+    def api_spots():
+        resp = jsonify(spots=engine.get_spots_status_for_web(),
+                       fee_per_hour=int(engine.get_settings().get("fee_per_hour", DEFAULT_FEE_PER_HOUR)))
+        resp.add_etag()
+        return resp.make_conditional(request)
+
+    @app.get("/api/reservations")
+    def api_reservations():
+        args = page_args(50)
+        if args is None:
+            return jsonify(error="cursor/limit không hợp lệ"), 400
+        rows, nxt = engine.read_reservations(args[1], args[0])
+        return json_page(rows, nxt)
+
+    @app.get("/api/history")
+    def api_history():
+        args = page_args(50)
+        if args is None:
+            return jsonify(error="cursor/limit không hợp lệ"), 400
+        rows, nxt = engine.read_vehicle_logs(args[1], args[0])
+        return json_page(rows, nxt)
+
+    # ---------- Metrics (Prometheus) ----------
+    @app.get("/metrics")
+    def metrics_page():
+        return Response(engine.metrics_text(), mimetype="text/plain; version=0.0.4",
+                        headers={"Cache-Control": "no-cache"})
+
+    return app
+
+# ===================== SERVING =====================
+# các method của engine mà web dùng (gọi qua proxy khi web chạy ở tiến trình riêng)
+ENGINE_API = ("get_spots_status_for_web", "read_reservations", "read_vehicle_logs",
+              "add_reservation", "get_settings", "update_settings", "get_master_status",
+              "events_subscribe", "events_get", "events_unsubscribe", "camera_jpeg",
+              "metrics_text")
+
+class EngineManager(BaseManager):
+    pass
+
+def serve_wsgi(app, host, port, threads=8):
+    """Chạy app bằng waitress (nếu có cài) với `threads` luồng, không thì Werkzeug đa luồng."""
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+    if serve is not None:
+        serve(app, host=host, port=port, threads=threads)
+    else:
+        make_server(host, port, app, threaded=True).serve_forever()
+
+def serve_engine(engine, authkey):
+    """Mở engine cho tiến trình web qua IPC cục bộ (multiprocessing manager), trả về địa chỉ."""
+    EngineManager.register("engine", callable=lambda: engine, exposed=ENGINE_API)
+    server = EngineManager(address=("127.0.0.1", 0), authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name="engine-ipc", daemon=True).start()
+    return server.address
+
+def connect_engine(address, authkey):
+    """Proxy tới engine của tiến trình chính (chỉ gồm các method trong ENGINE_API)."""
+    EngineManager.register("engine")
+    m = EngineManager(address=address, authkey=authkey)
+    m.connect()
+    return m.engine()
+
+def start_web_server(engine, host="127.0.0.1", port=5000, mode="thread", threads=8):
+    """
+    mode:
+      dev     : Werkzeug dev server trên 1 luồng daemon (như cũ)
+      thread  : WSGI đa luồng (waitress / Werkzeug threaded) trên luồng daemon
+      process : web chạy ở tiến trình riêng, gọi engine qua IPC -> request web không
+                tranh GIL với các luồng camera / OCR
+    Trả về thread (dev/thread) hoặc Popen (process).
+    """
+    threads = max(1, int(threads or 1))
+    if mode == "process":
+        authkey = os.urandom(16)
+        address = serve_engine(engine, authkey)
+        # chạy parking_web.py bằng interpreter mới: tiến trình web không import torch / camera
+        env = dict(os.environ, PARKING_IPC_KEY=authkey.hex())
+        p = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                              "--engine", f"{address[0]}:{address[1]}",
+                              "--host", host, "--port", str(port), "--threads", str(threads)], env=env)
+        atexit.register(p.terminate)
+        return p
+
+    app = create_web_server(engine)
+    if mode == "dev":
+        target = lambda: app.run(host=host, port=port, debug=False, use_reloader=False)
+    else:
+        target = lambda: serve_wsgi(app, host, port, threads)
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    return t
+
+# ===================== RUN (tiến trình web, web_mode=process) =====================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Web đặt chỗ, nối tới engine qua IPC")
+    ap.add_argument("--engine", required=True, help="host:port của engine (serve_engine)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5000)
+    ap.add_argument("--threads", type=int, default=8)
+    args = ap.parse_args()
+
+    h, p = args.engine.rsplit(":", 1)
+    engine = connect_engine((h, int(p)), bytes.fromhex(os.environ["PARKING_IPC_KEY"]))
+    serve_wsgi(create_web_server(engine), args.host, args.port, args.threads)
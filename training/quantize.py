@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+SMART PARKING - LƯỢNG TỬ HOÁ INT8 (post-training, ONNX Runtime) cho model detector + OCR.
+
+  python export_onnx.py                 -> model/*.onnx (FP32)
+  python training/quantize.py           -> model/*.int8.onnx + model/*.int8.json (báo cáo kiểm tra)
+  settings infer_backend=onnx, infer_precision=int8
+
+Dữ liệu lấy theo 2 file data của training:
+  LP_detection.yaml   calib:  ảnh khung hình ở cổng (hiệu chỉnh detector)
+                      labels: CSV "image,plates" (đường dẫn ảnh tương đối theo file CSV, nhiều biển
+                              cách nhau bằng dấu cách) cho bước kiểm tra độ chính xác
+  Letter_detect.yaml  calib:  ảnh crop biển số (hiệu chỉnh OCR); trống thì crop từ ảnh khung hình
+                              bằng detector FP32
+
+Kiểm tra độ chính xác: tỉ lệ biển số đọc đúng hoàn toàn (exact match) trên tập nhãn, pipeline
+giống engine (detect -> crop -> PlateSearch). Mỗi model INT8 chạy cùng model còn lại ở FP32, rồi
+cả 2 cùng INT8; model chỉ "passed" khi không giảm quá --max-drop so với FP32. models.py chỉ nạp
+file .int8.onnx khi báo cáo passed và sha256 còn khớp.
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import re
+import argparse
+import tempfile
+from datetime import datetime
+
+import cv2
+import yaml
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_static)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from function import models
+import function.helper as helper
+from function.onnx_backend import OnnxYolo
+from function.plate_search import PlateSearch
+
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".bmp")
+METHODS = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+           "percentile": CalibrationMethod.Percentile}
+
+def data_paths(yaml_path):
+    """calib / labels của file data training, đổi sang đường dẫn tuyệt đối."""
+    with open(yaml_path, encoding="utf-8") as f:
+        d = yaml.safe_load(f) or {}
+    base = os.path.dirname(yaml_path)
+    return {k: os.path.join(base, d[k]) for k in ("calib", "labels") if d.get(k)}
+
+def read_images(folder, limit=0):
+    paths = sorted(p for p in glob.glob(os.path.join(folder or "", "*")) if p.lower().endswith(IMAGE_EXT))
+    ims = []
+    for p in paths[:limit or None]:
+        im = cv2.imread(p)
+        if im is not None:
+            ims.append(im)
+    return ims
+
+def read_labels(path):
+    """[(ảnh, set biển số chuẩn hoá)] từ CSV image,plates."""
+    out = []
+    if not path or not os.path.isfile(path):
+        return out
+    base = os.path.dirname(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            im = cv2.imread(os.path.join(base, (row.get("image") or "").strip()))
+            plates = {norm_plate(p) for p in (row.get("plates") or "").split()}
+            if im is None or not plates:
+                print("Bỏ qua dòng nhãn:", row)
+                continue
+            out.append((im, plates))
+    return out
+
+def norm_plate(lp):
+    return re.sub(r"[^0-9A-Z]", "", lp.upper())
+
+def crop_plates(det, frames, limit=0):
+    """Crop các biển detector FP32 tìm được (dùng khi không có thư mục crop riêng)."""
+    crops = []
+    for im in frames:
+        d = helper.detections(det(im, size=models.DETECT_SIZE))[0]
+        for x, y, x2, y2 in d.boxes.astype(int):
+            if x2 > x and y2 > y:
+                crops.append(im[max(0, y):y2, max(0, x):x2])
+    return crops[:limit or None]
+
+class YoloCalibReader(CalibrationDataReader):
+    """Đưa từng ảnh (letterbox size x size, cùng tiền xử lý với OnnxYolo) cho bộ hiệu chỉnh."""
+
+    def __init__(self, model, ims, size):
+        self.model = model
+        self.ims = ims
+        self.size = size
+        self.i = 0
+
+    def get_next(self):
+        if self.i >= len(self.ims):
+            return None
+        x = self.model.preprocess([self.ims[self.i]], shape=(self.size, self.size))[0]
+        self.i += 1
+        return {self.model.input_name: x}
+
+    def rewind(self):
+        self.i = 0
+
+def head_nodes(path):
+    """Node của module cuối (Detect: decode toạ độ + sigmoid), giữ FP32 vì rất nhạy với INT8."""
+    import onnx
+    names = [n.name for n in onnx.load(path, load_external_data=False).graph.node]
+    idx = [int(m.group(1)) for m in (re.search(r"/model\.(\d+)/", n) for n in names) if m]
+    if not idx:
+        return []
+    last = f"/model.{max(idx)}/"
+    return [n for n in names if last in n]
+
+def quantize(src, dst, reader, method="minmax", per_channel=True, keep_head=True):
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    exclude = head_nodes(src) if keep_head else []
+    fd, prep = tempfile.mkstemp(suffix=".onnx")
+    os.close(fd)
+    try:
+        try:
+            try:
+                quant_pre_process(src, prep)
+            except ImportError:  # symbolic shape inference cần sympy
+                quant_pre_process(src, prep, skip_symbolic_shape=True)
+        except Exception as e:
+            print("  Bỏ qua tiền xử lý (shape inference):", e)
+            prep = src
+        quantize_static(prep, dst, reader, quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        nodes_to_exclude=exclude, calibrate_method=METHODS[method])
+    finally:
+        if prep != src:
+            os.remove(prep)
+    return len(exclude)
+
+def exact_match(det, ocr, labelled):
+    """Tỉ lệ biển số trong nhãn được đọc đúng hoàn toàn."""
+    search = PlateSearch(ocr, accept=0.80)
+    hit = total = 0
+    for im, plates in labelled:
+        d = helper.detections(det(im, size=models.DETECT_SIZE))[0]
+        read = set()
+        for x, y, x2, y2 in d.boxes.astype(int):
+            if x2 > x and y2 > y:
+                lp = search.search(im[max(0, y):y2, max(0, x):x2], "quantize")[0]
+                if lp != "unknown":
+                    read.add(norm_plate(lp))
+        hit += len(plates & read)
+        total += len(plates)
+    return hit / total if total else 0.0
+
+def load(path, lazy, threads):
+    m = OnnxYolo(path, threads=threads, names=models.yaml_names(lazy.names_yaml))
+    if lazy.min_conf is not None:
+        m.conf = lazy.min_conf
+    return m
+
+def main():
+    ap = argparse.ArgumentParser(description="Lượng tử hoá INT8 model detector + OCR, kèm kiểm tra độ chính xác")
+    ap.add_argument("--frames", default=None, help="thư mục ảnh hiệu chỉnh detector (mặc định: calib của LP_detection.yaml)")
+    ap.add_argument("--plates", default=None, help="thư mục crop biển hiệu chỉnh OCR (mặc định: calib của Letter_detect.yaml)")
+    ap.add_argument("--labels", default=None, help="CSV image,plates (mặc định: labels của LP_detection.yaml)")
+    ap.add_argument("--calib-max", type=int, default=300, help="số ảnh hiệu chỉnh tối đa mỗi model")
+    ap.add_argument("--method", choices=sorted(METHODS), default="minmax")
+    ap.add_argument("--per-tensor", action="store_true", help="scale theo tensor thay vì theo kênh")
+    ap.add_argument("--quantize-head", action="store_true", help="lượng tử hoá cả module Detect cuối")
+    ap.add_argument("--max-drop", type=float, default=0.01, help="mức giảm exact-match tối đa so với FP32")
+    ap.add_argument("--check-only", action="store_true", help="chỉ chạy lại kiểm tra cho file .int8.onnx có sẵn")
+    ap.add_argument("--threads", type=int, default=0)
+    args = ap.parse_args()
+
+    det_data = data_paths(models.DETECTOR_NAMES)
+    ocr_data = data_paths(models.OCR_NAMES)
+    pair = (models.DETECTOR, models.OCR)
+    fp32 = {m.name: os.path.splitext(m.weights)[0] + ".onnx" for m in pair}
+    for path in fp32.values():
+        if not os.path.isfile(path):
+            raise SystemExit(f"Không thấy {path} (chạy export_onnx.py trước)")
+    det32, ocr32 = (load(fp32[m.name], m, args.threads) for m in pair)
+
+    info = {}
+    if not args.check_only:
+        frames = read_images(args.frames or det_data.get("calib"), args.calib_max)
+        if not frames:
+            raise SystemExit("Không có ảnh hiệu chỉnh detector (calib trong LP_detection.yaml hoặc --frames)")
+        crops = read_images(args.plates or ocr_data.get("calib"), args.calib_max)
+        if not crops:
+            crops = crop_plates(det32, read_images(args.frames or det_data.get("calib")), args.calib_max)
+            print(f"Crop {len(crops)} biển từ ảnh khung hình để hiệu chỉnh OCR")
+        if not crops:
+            raise SystemExit("Không có crop biển số để hiệu chỉnh OCR")
+        for m, model, ims in ((models.DETECTOR, det32, frames), (models.OCR, ocr32, crops)):
+            print(f"Lượng tử hoá {m.name}: {len(ims)} ảnh hiệu chỉnh, {args.method}")
+            kept = quantize(fp32[m.name], models.int8_path(m.weights),
+                            YoloCalibReader(model, ims, models.DETECT_SIZE), args.method,
+                            per_channel=not args.per_tensor, keep_head=not args.quantize_head)
+            info[m.name] = {"calib_images": len(ims), "method": args.method,
+                            "per_channel": not args.per_tensor, "fp32_nodes": kept}
+            print("  Đã ghi", models.int8_path(m.weights))
+
+    labels = args.labels or det_data.get("labels")
+    labelled = read_labels(labels)
+    for m in pair:
+        if not os.path.isfile(models.int8_path(m.weights)):
+            raise SystemExit(f"Không thấy {models.int8_path(m.weights)}")
+    det8, ocr8 = (load(models.int8_path(m.weights), m, args.threads) for m in pair)
+
+    if labelled:
+        n = sum(len(p) for _, p in labelled)
+        print(f"Kiểm tra exact-match trên {len(labelled)} ảnh / {n} biển ({labels})")
+        rates = {"fp32": exact_match(det32, ocr32, labelled),
+                 "detector": exact_match(det8, ocr32, labelled),
+                 "ocr": exact_match(det32, ocr8, labelled),
+                 "both": exact_match(det8, ocr8, labelled)}
+        for k, v in rates.items():
+            print(f"  {k:9s} {100 * v:6.2f}%")
+        floor = rates["fp32"] - args.max_drop
+        passed = {m.name: rates[m.name] >= floor and rates["both"] >= floor for m in pair}
+    else:
+        print(f"Không có tập nhãn ({labels}): model INT8 chưa được phép dùng.")
+        n, rates, passed = 0, {}, {m.name: False for m in pair}
+
+    for m in pair:
+        report = {
+            "passed": passed[m.name],
+            "sha256": models.file_sha256(models.int8_path(m.weights)),
+            "model": os.path.basename(models.int8_path(m.weights)),
+            "fp32_model": os.path.basename(fp32[m.name]),
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "labels": labels, "images": len(labelled), "plates": n,
+            "exact_match": rates, "max_drop": args.max_drop,
+        }
+        if m.name in info:
+            report.update(info[m.name])
+        else:  # --check-only: giữ thông tin hiệu chỉnh của lần lượng tử hoá trước
+            try:
+                with open(models.int8_report_path(m.weights), encoding="utf-8") as f:
+                    old = json.load(f)
+                report.update({k: old[k] for k in ("calib_images", "method", "per_channel", "fp32_nodes") if k in old})
+            except (OSError, ValueError):
+                pass
+        with open(models.int8_report_path(m.weights), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"{m.name}: {'ĐẠT' if passed[m.name] else 'KHÔNG ĐẠT'} -> {models.int8_report_path(m.weights)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 from PIL import Image
 import cv2
-import torch
 import math 
 import function.utils_rotate as utils_rotate
 from IPython.display import display
@@ -8,11 +7,19 @@ import os
 import time
 import argparse
 import function.helper as helper
+import function.metrics as metrics
+from function import models
+
+ap = argparse.ArgumentParser()
+ap.add_argument('--profile', nargs='?', type=float, const=0.0, default=None, metavar='SEC',
+                help='print per-stage latency at exit (and every SEC seconds)')
+args = ap.parse_args()
+if args.profile is not None:
+    metrics.enable_profile(args.profile)
 
 # load model
-yolo_LP_detect = torch.hub.load('yolov5', 'custom', path='model/LP_detector_nano_61.pt', force_reload=True, source='local')
-yolo_license_plate = torch.hub.load('yolov5', 'custom', path='model/LP_ocr_nano_62.pt', force_reload=True, source='local')
-yolo_license_plate.conf = 0.60
+yolo_LP_detect, yolo_license_plate = models.yolo_models()
+models.preload(background=False)  # load + warm-up before the first frame
 
 prev_frame_time = 0
 new_frame_time = 0
@@ -22,36 +29,37 @@ vid = cv2.VideoCapture(0)
 while(True):
     ret, frame = vid.read()
     
-    plates = yolo_LP_detect(frame, size=640)
-    list_plates = plates.pandas().xyxy[0].values.tolist()
+    t_frame = time.perf_counter()
+    with metrics.timer("detect"):
+        plates = yolo_LP_detect(frame, size=640)
+    list_plates = helper.detections(plates)[0].boxes.tolist()
     list_read_plates = set()
     for plate in list_plates:
-        flag = 0
         x = int(plate[0]) # xmin
         y = int(plate[1]) # ymin
         w = int(plate[2] - plate[0]) # xmax - xmin
         h = int(plate[3] - plate[1]) # ymax - ymin  
-        crop_img = frame[y:y+h, x:x+w]
+        with metrics.timer("crop"):
+            crop_img = frame[y:y+h, x:x+w]
         cv2.rectangle(frame, (int(plate[0]),int(plate[1])), (int(plate[2]),int(plate[3])), color = (0,0,225), thickness = 2)
         cv2.imwrite("crop.jpg", crop_img)
         rc_image = cv2.imread("crop.jpg")
         lp = ""
-        for cc in range(0,2):
-            for ct in range(0,2):
-                lp = helper.read_plate(yolo_license_plate, utils_rotate.deskew(crop_img, cc, ct))
-                if lp != "unknown":
-                    list_read_plates.add(lp)
-                    cv2.putText(frame, lp, (int(plate[0]), int(plate[1]-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36,255,12), 2)
-                    flag = 1
-                    break
-            if flag == 1:
+        with utils_rotate.deskewer().for_crop(crop_img) as dk:
+            variants = [dk.deskew(crop_img, cc, ct) for cc in range(0,2) for ct in range(0,2)]
+        for lp in helper.read_plates(yolo_license_plate, variants):
+            if lp != "unknown":
+                list_read_plates.add(lp)
+                cv2.putText(frame, lp, (int(plate[0]), int(plate[1]-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (36,255,12), 2)
                 break
     new_frame_time = time.time()
     fps = 1/(new_frame_time-prev_frame_time)
     prev_frame_time = new_frame_time
     fps = int(fps)
     cv2.putText(frame, str(fps), (7, 70), cv2.FONT_HERSHEY_SIMPLEX, 3, (100, 255, 0), 3, cv2.LINE_AA)
-    cv2.imshow('frame', frame)
+    with metrics.timer("display"):
+        cv2.imshow('frame', frame)
+    metrics.observe("frame", time.perf_counter() - t_frame)
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 